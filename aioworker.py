@@ -0,0 +1,341 @@
+# aioworker.py
+"""Asyncio worker runtime: many I/O-bound jobs in one process (WORKER_MODE=async).
+
+One event loop owns every child process of every job. yt-dlp and ffmpeg are
+started as asyncio subprocesses in their own process group, and their output
+is streamed back to the job. The job pipeline itself
+(worker.process_single_job) stays synchronous and runs in a thread per job
+slot, handing each command to the loop through a JobContext.
+
+A job's deadline is a timer on the loop. When it fires, it SIGKILLs the
+process groups of all of the job's children, and the job's next command
+raises TimeoutException, so timeouts no longer rely on signal.alarm (which
+only works in the main thread).
+
+On SIGTERM the runtime stops picking up jobs and gives running ones
+DRAIN_GRACE_S to finish. Jobs still running after that are interrupted:
+their children get SIGINT (yt-dlp saves its download state), the job raises
+JobInterrupted and goes back to its queue with its workspace parked.
+A cancelled job (see cancellation.py) has its children SIGKILLed at once.
+
+At most ASYNC_JOBS jobs run at once. CPU-heavy stages are limited to
+ASYNC_CPU_WORKERS at a time: ffmpeg runs under that limit, and Whisper runs
+in a separate process pool of that size. The model is therefore loaded once
+per pool process instead of once per job process. The Redis and MinIO
+clients are shared by all jobs of the process.
+"""
+import os, re, time, queue, signal, asyncio, threading, multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait as wait_futures
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import cancellation
+import cluster
+import disk
+import scheduler
+
+ASYNC_JOBS = int(os.getenv("ASYNC_JOBS", "16"))
+ASYNC_CPU_WORKERS = int(os.getenv("ASYNC_CPU_WORKERS", "2"))
+
+LINE_SPLIT_RE = re.compile(rb"[\r\n]")
+
+
+class _Exit:
+    def __init__(self, returncode: int):
+        self.returncode = returncode
+
+
+class Runtime:
+    """Shared state of the async worker process."""
+
+    def __init__(self, w, loop: asyncio.AbstractEventLoop):
+        self.w = w
+        self.loop = loop
+        self.cpu_slots = threading.BoundedSemaphore(ASYNC_CPU_WORKERS)
+        self.cpu_pool = None
+        self._pool_lock = threading.Lock()
+        self.jobs = set()
+
+    def cpu_executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self.cpu_pool is None:
+                # spawn: forking a process that runs threads and an event loop is unsafe
+                self.cpu_pool = ProcessPoolExecutor(ASYNC_CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            return self.cpu_pool
+
+    def reset_cpu_executor(self, terminate: bool = False):
+        with self._pool_lock:
+            if self.cpu_pool is not None:
+                # Abandoned tasks would otherwise keep the pool (and process exit) waiting;
+                # there is no public API to stop pool workers before Python 3.14
+                processes = list((getattr(self.cpu_pool, "_processes", None) or {}).values()) if terminate else []
+                self.cpu_pool.shutdown(wait=False, cancel_futures=True)
+                for proc in processes:
+                    proc.terminate()
+            self.cpu_pool = None
+
+    def cancel(self, job_id: str):
+        """Called by the cancellation listener thread."""
+        for job in list(self.jobs):
+            if job.job_id == job_id and not job.cancelled:
+                self.loop.call_soon_threadsafe(job.cancel)
+
+
+class JobContext:
+    """Per-job handle through which worker.py runs commands on the event loop.
+
+    run() and run_cpu() are called from the job's thread; the deadline timer
+    and the child processes live on the loop.
+    """
+
+    def __init__(self, runtime: Runtime, job_id: str):
+        self.runtime = runtime
+        self.loop = runtime.loop
+        self.job_id = job_id
+        self.procs = set()
+        self.expired = False
+        self.interrupted = False
+        self.cancelled = False
+        self._wake = threading.Event()
+        self.seconds = 0
+        self.deadline_at = None
+        self._timer = None
+
+    @contextmanager
+    def deadline(self, seconds: int):
+        self.expired = False
+        self.seconds = seconds
+        self.deadline_at = time.monotonic() + seconds
+        self.loop.call_soon_threadsafe(self._arm, seconds)
+        try:
+            yield
+        finally:
+            self.deadline_at = None
+            self.loop.call_soon_threadsafe(self._disarm)
+
+    def _arm(self, seconds: int):
+        self._disarm()
+        self._timer = self.loop.call_later(seconds, self._expire)
+
+    def _disarm(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _expire(self):
+        print(f"[WARN] Job {self.job_id} exceeded timeout of {self.seconds}s; killing {len(self.procs)} process group(s)")
+        self.expired = True
+        for proc in list(self.procs):
+            self._kill(proc)
+
+    def interrupt(self):
+        """Stop the job for a shutdown (on the loop): SIGINT its children, SIGKILL them if they linger."""
+        self.interrupted = True
+        self._wake.set()
+        for proc in list(self.procs):
+            self._kill(proc, signal.SIGINT)
+        self.loop.call_later(self.runtime.w.CHILD_STOP_TIMEOUT, lambda: [self._kill(p) for p in list(self.procs)])
+
+    def cancel(self):
+        """Stop the job for a cancellation (on the loop): SIGKILL its children."""
+        self.cancelled = True
+        self._wake.set()
+        for proc in list(self.procs):
+            self._kill(proc)
+
+    @staticmethod
+    def _kill(proc, sig=signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def check(self):
+        if self.cancelled:
+            raise self.runtime.w.JobCancelled()
+        if self.interrupted:
+            raise self.runtime.w.JobInterrupted()
+        if self.expired:
+            raise self.runtime.w.TimeoutException(f"Job exceeded timeout of {self.seconds} seconds")
+
+    def run(self, cmd: list[str], on_line=None, cpu: bool = False) -> int:
+        """Run `cmd` on the loop, feeding output lines to `on_line` in this thread; returns the exit code."""
+        self.check()
+        if cpu:
+            self.runtime.cpu_slots.acquire()
+        try:
+            lines = queue.Queue()
+            asyncio.run_coroutine_threadsafe(self._run(cmd, lines, on_line is not None), self.loop)
+            while True:
+                item = lines.get()
+                if isinstance(item, _Exit):
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                on_line(item)
+        finally:
+            if cpu:
+                self.runtime.cpu_slots.release()
+        self.check()
+        return item.returncode
+
+    async def _run(self, cmd: list[str], lines: queue.Queue, capture: bool):
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE if capture else None,
+                stderr=asyncio.subprocess.STDOUT if capture else None,
+                start_new_session=True,
+            )
+        except Exception as e:
+            lines.put(e)
+            return
+        self.procs.add(proc)
+        if self.expired or self.interrupted or self.cancelled:
+            self._kill(proc)
+        try:
+            if capture:
+                # yt-dlp rewrites progress lines with \r, so split on both
+                buf = b""
+                while chunk := await proc.stdout.read(65536):
+                    *parts, buf = LINE_SPLIT_RE.split(buf + chunk)
+                    for part in parts:
+                        lines.put(part.decode("utf-8", "replace"))
+                if buf:
+                    lines.put(buf.decode("utf-8", "replace"))
+            lines.put(_Exit(await proc.wait()))
+        except Exception as e:
+            self._kill(proc)
+            lines.put(e)
+        finally:
+            self.procs.discard(proc)
+
+    def run_cpu(self, fn, *args):
+        """Run a picklable CPU-bound function in the runtime's process pool, within the job's deadline.
+
+        A task that outlives the deadline or a shutdown cannot be interrupted; the
+        job stops waiting for it and its result is discarded. A cancelled
+        transcription stops itself at its next progress update.
+        """
+        self.check()
+        with self.runtime.cpu_slots:
+            future = self.runtime.cpu_executor().submit(fn, *args)
+            try:
+                while not future.done():
+                    remaining = None if self.deadline_at is None else self.deadline_at - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self.expired = True
+                    self.check()
+                    wait_futures([future], timeout=1 if remaining is None else min(1, remaining))
+                return future.result()
+            except BrokenProcessPool:
+                print("[ERROR] CPU process pool died; recreating it")
+                self.runtime.reset_cpu_executor()
+                raise
+
+
+    def sleep(self, seconds: float):
+        """Wait `seconds` unless the job is interrupted or cancelled meanwhile."""
+        self._wake.wait(seconds)
+        self.check()
+
+
+def _run_job(runtime: Runtime, job_id: str):
+    w = runtime.w
+    job = JobContext(runtime, job_id)
+    w._local.job = job
+    runtime.jobs.add(job)
+    try:
+        w.process_single_job(job_id)
+    except w.JobInterrupted:
+        pass
+    except Exception as e:
+        print(f"[ERROR] Job {job_id} crashed: {e}")
+    finally:
+        runtime.jobs.discard(job)
+        w._local.job = None
+        try:
+            disk.maybe_sweep(w.get_redis_connection())
+        except Exception as e:
+            print(f"[WARN] Disk sweep failed: {e}")
+
+
+def _poll(w, r_local):
+    w._promote_delayed(r_local)
+    picked = scheduler.pick(r_local, w.QUEUE_POLL_TIMEOUT, w.NODE_TAGS)
+    if not picked:
+        disk.maybe_sweep(r_local)
+    return picked
+
+
+async def _drain(runtime: Runtime, tasks: set):
+    w = runtime.w
+    if tasks:
+        print(f"[INFO] Draining {len(tasks)} job(s) (grace period {w.DRAIN_GRACE_S}s)...")
+        _, pending = await asyncio.wait(tasks, timeout=w.DRAIN_GRACE_S)
+        if pending:
+            print(f"[INFO] Interrupting {len(pending)} job(s); they go back to the queue")
+            for job in list(runtime.jobs):
+                job.interrupt()
+            await asyncio.wait(pending, timeout=w.CHILD_STOP_TIMEOUT + 15)
+    runtime.reset_cpu_executor(terminate=True)
+    print(f"[INFO] Async worker {os.getpid()} stopped")
+
+
+async def _serve(w):
+    loop = asyncio.get_running_loop()
+    runtime = Runtime(w, loop)
+    r_local = w.get_redis_connection()
+    job_threads = ThreadPoolExecutor(ASYNC_JOBS, thread_name_prefix="job")
+    poller = ThreadPoolExecutor(1, thread_name_prefix="poll")
+    tasks = set()
+    stopping = asyncio.Event()
+
+    def on_sigterm():
+        if stopping.is_set():
+            # Second SIGTERM: interrupt running jobs without waiting for the grace period
+            for job in list(runtime.jobs):
+                job.interrupt()
+        stopping.set()
+
+    loop.add_signal_handler(signal.SIGTERM, on_sigterm)
+    cancellation.start_listener(w.get_redis_connection, lambda: [job.job_id for job in list(runtime.jobs)], runtime.cancel)
+    stop_wait = asyncio.ensure_future(stopping.wait())
+
+    while not stopping.is_set():
+        if len(tasks) >= ASYNC_JOBS:
+            await asyncio.wait(tasks | {stop_wait}, return_when=asyncio.FIRST_COMPLETED)
+            continue
+        try:
+            picked = await loop.run_in_executor(poller, _poll, w, r_local)
+        except Exception as e:
+            print(f"[ERROR] Async worker {os.getpid()} encountered error: {e}")
+            await asyncio.sleep(1)
+            continue
+        if not picked:
+            continue
+
+        lane, job_id = picked
+        if stopping.is_set():
+            # Drain started while waiting on the queue: hand the job back untouched
+            await loop.run_in_executor(poller, w._requeue_front, r_local, job_id)
+            break
+        print(f"[INFO] Async worker {os.getpid()} picked up job {job_id} from lane {lane}")
+        task = loop.run_in_executor(job_threads, _run_job, runtime, job_id)
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    stop_wait.cancel()
+    await _drain(runtime, tasks)
+
+
+def run(w):
+    """Serve jobs with the async runtime; `w` is the worker module."""
+    print(f"[CONFIG] Async jobs per process: {ASYNC_JOBS}, CPU workers: {ASYNC_CPU_WORKERS}")
+    w._shared_redis = w.get_redis_connection()
+    stop_heartbeat = scheduler.start_heartbeat(w.get_redis_connection, slots=ASYNC_JOBS)
+    cluster.start_heartbeat(w.get_redis_connection, w.WHISPER_MODEL_NAME, lambda: ASYNC_JOBS, w._recover_orphans)
+    try:
+        asyncio.run(_serve(w))
+    except KeyboardInterrupt:
+        print(f"[INFO] Async worker {os.getpid()} shutting down...")
+    stop_heartbeat()
@@ -1,11 +1,21 @@
 # app.py
-import os, uuid, redis, subprocess, json, hashlib
+import os, uuid, redis, subprocess, json, hashlib, time, math
 from typing import Any
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+import archive
+import cancellation
+import clips
+import cluster
+import hostlimit
+import identities
+import jobstore
+import metrics
+import probe
+import scheduler
+import ytcache
+from ratelimit import RedisRateLimiter
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://yt-redis:6379/0")
 print(f"[INFO] Connecting to Redis...")
@@ -51,11 +61,24 @@ r = get_redis_client(REDIS_URL)
 
 ROLE = os.getenv("ROLE", "api")
 COOKIES_PATH = os.getenv("COOKIES_PATH", "/data/cookies/cookies.txt")
-
-limiter = Limiter(key_func=get_remote_address)
+# Probe videos at enqueue time and reject live streams, Shorts and short videos
+ENQUEUE_PREFILTER = os.getenv("ENQUEUE_PREFILTER", "true").lower() == "true"
+# Reject new jobs with 429 when their expected wait exceeds this many seconds (0 = no limit)
+ENQUEUE_MAX_WAIT_S = int(os.getenv("ENQUEUE_MAX_WAIT_S", "0"))
+# Largest accepted POST /enqueue/batch
+ENQUEUE_BATCH_MAX = int(os.getenv("ENQUEUE_BATCH_MAX", "500"))
+# Required in the X-Admin-Token header of /admin endpoints when set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+limiter = RedisRateLimiter(r)
 app = FastAPI(title="yt-dlp API")
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+HISTORY_BUCKETS = {"hour": 3600, "day": 86400}
+
+
+@app.on_event("startup")
+def start_archive():
+    if archive.enabled():
+        archive.start(lambda: redis.from_url(REDIS_URL, decode_responses=True))
 
 
 class DownloadReq(BaseModel):
@@ -65,6 +88,12 @@ class DownloadReq(BaseModel):
     transcribe: bool = False
     callback_url: str | None = None
     db_id: str | None = None
+    whisper_model: str | None = None  # route transcription to nodes with this model
+    sections: list[str] | None = None  # clip time ranges, e.g. ["10:00-15:00"] (see clips.py)
+
+
+class BatchEnqueueReq(BaseModel):
+    items: list[DownloadReq]
 
 
 class ChannelCheckReq(BaseModel):
@@ -87,6 +116,7 @@ def run_yt_dl_flat(channel_url: str):
 
     cmd = [
         "yt-dlp",
+        *ytcache.args(),
         "--flat-playlist",
         "--dump-json",
         "--socket-timeout", "15",
@@ -96,6 +126,10 @@ def run_yt_dl_flat(channel_url: str):
     if COOKIES_PATH and os.path.exists(COOKIES_PATH):
         cmd.insert(1, "--cookies")
         cmd.insert(2, COOKIES_PATH)
+    try:
+        hostlimit.acquire(r, channel_url, max_wait=hostlimit.HOST_RATE_API_MAX_WAIT_S)
+    except hostlimit.HostBusy as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.wait))})
     proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
     for line in proc.stdout:
         line = line.strip()
@@ -115,6 +149,7 @@ def get_video_details(url: str) -> dict:
     }
     cmd = [
         "yt-dlp",
+        *ytcache.args(),
         "--dump-json",
         "--no-playlist",
         "--socket-timeout", "15",
@@ -126,6 +161,7 @@ def get_video_details(url: str) -> dict:
         cmd.insert(2, COOKIES_PATH)
         
     try:
+        hostlimit.acquire(r, url, max_wait=hostlimit.HOST_RATE_API_MAX_WAIT_S)
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         stdout, _ = proc.communicate()
         if proc.returncode == 0 and stdout:
@@ -155,6 +191,7 @@ def download_subtitle(video_url: str, video_id: str) -> str:
         output_template = f"{temp_dir}/{video_id}.%(ext)s"
         cmd = [
             "yt-dlp",
+            *ytcache.args(),
             "--write-subs",
             "--write-auto-subs",
             "--sub-format", "srt",
@@ -171,6 +208,7 @@ def download_subtitle(video_url: str, video_id: str) -> str:
             cmd.insert(2, COOKIES_PATH)
         
         # Run download with timeout
+        hostlimit.acquire(r, video_url, max_wait=hostlimit.HOST_RATE_API_MAX_WAIT_S)
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         try:
             stdout, stderr = proc.communicate(timeout=30)
@@ -249,8 +287,8 @@ def service_status():
     # Redis check
     try:
         pong = r.ping()
-        qlen = r.llen("yt_queue")
-        status["redis"] = {"ok": bool(pong), "queue_length": int(qlen)}
+        qlen = sum(r.llen(key) for lane in scheduler.LANES for key in scheduler.queue_keys(r, lane))
+        status["redis"] = {"ok": bool(pong), "queue_length": int(qlen), "delayed_length": int(r.zcard("yt_delayed"))}
     except Exception as e:
         status["ok"] = False
         status["redis"] = {"ok": False, "error": str(e), "queue_length": None}
@@ -283,36 +321,184 @@ def service_status():
     return status
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Expose worker stage histograms, throughput and queue depth in Prometheus format."""
+    try:
+        body = metrics.render(r)
+        lanes = scheduler.stats(r)["lanes"]
+        delayed = r.zcard("yt_delayed")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"redis error: {e}")
+
+    body += "# HELP yt_queue_length Jobs waiting in each queue lane\n"
+    body += "# TYPE yt_queue_length gauge\n"
+    for lane, info in lanes.items():
+        body += f'yt_queue_length{{lane="{lane}"}} {info["depth"]}\n'
+    body += "# HELP yt_queue_expected_wait_seconds Estimated wait for a job entering each lane\n"
+    body += "# TYPE yt_queue_expected_wait_seconds gauge\n"
+    for lane, info in lanes.items():
+        body += f'yt_queue_expected_wait_seconds{{lane="{lane}"}} {info["expected_wait_s"]}\n'
+    body += "# HELP yt_delayed_jobs Jobs deferred until resources free up\n"
+    body += "# TYPE yt_delayed_jobs gauge\n"
+    body += f"yt_delayed_jobs {int(delayed)}\n"
+    return body
+
+
+@app.get("/queues")
+def list_queues():
+    """Depth, queued work and expected wait of each scheduling lane."""
+    try:
+        return scheduler.stats(r)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"redis error: {e}")
+
+
+@app.get("/cluster")
+def cluster_view():
+    """Live worker nodes with their capabilities, in-flight jobs and throughput."""
+    try:
+        nodes = cluster.nodes(r)
+        lanes = scheduler.stats(r)["lanes"]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"redis error: {e}")
+    tagged = {}
+    for info in lanes.values():
+        for tag, depth in info["tagged"].items():
+            tagged[tag] = tagged.get(tag, 0) + depth
+    return {
+        "nodes": nodes,
+        "slots": sum(int(n.get("slots") or 0) for n in nodes),
+        "inflight": sum(len(n["inflight"]) for n in nodes),
+        "tagged_queues": tagged,
+    }
+
+
+@app.get("/identities")
+def identities_view():
+    """The worker identity pool: cool-downs, active leases and recent throttle rates."""
+    try:
+        pool = identities.status(r)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"redis error: {e}")
+    return {"identities": pool, "available": sum(1 for i in pool if i["available"])}
+
+
 @app.get("/jobs")
-def list_jobs(limit: int = 20):
-    """List up to `limit` job entries currently in the `yt_queue` (most recent first)."""
+def list_jobs(limit: int = 20, lane: str | None = None):
+    """List up to `limit` queued job entries per lane (most recent first)."""
+    lanes = [lane] if lane else list(scheduler.LANES)
+    if any(l not in scheduler.LANE_KEYS for l in lanes):
+        raise HTTPException(status_code=400, detail=f"Unknown lane. Use one of: {', '.join(scheduler.LANES)}")
     try:
-        ids = r.lrange("yt_queue", 0, max(0, int(limit) - 1))
+        ids = [(l, jid) for l in lanes for key in scheduler.queue_keys(r, l)
+               for jid in r.lrange(key, 0, max(0, int(limit) - 1))]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"redis error: {e}")
 
     jobs = []
-    for jid in ids:
-        data = r.hgetall(f"job:{jid}") or {}
+    for l, jid in ids:
+        data = jobstore.get(r, jid)
         # ensure job_id present
-        entry = {"job_id": jid}
+        entry = {"job_id": jid, "lane": l}
         entry.update(data)
         jobs.append(entry)
 
     return {"count": len(jobs), "jobs": jobs}
 
-@app.post("/enqueue")
-@limiter.limit("10/minute")
-def enqueue(request: Request, req: DownloadReq):
-    # Reject playlist URLs and Shorts to prevent worker overload
-    if not req.url or not req.url.strip():
-        raise HTTPException(status_code=400, detail="URL cannot be empty.")
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """Cancel a queued, deferred or running job; a running one is stopped by its worker."""
+    try:
+        result = cancellation.request(r, job_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"redis error: {e}")
+    if result is None:
+        raise HTTPException(404, "job not found")
+    if not result["cancelled"]:
+        raise HTTPException(409, f"job already {result['previous_status']}")
+    if not result["running"]:
+        metrics.inc("yt_jobs_total", status="cancelled")
+    return {"job_id": job_id, "status": "cancelled", "previous_status": result["previous_status"], "running": result["running"]}
 
-    if "list=" in req.url or "/playlist" in req.url:
-        raise HTTPException(status_code=400, detail="Playlist URLs are not allowed. Please provide a single video URL.")
 
-    job_id = str(uuid.uuid4())
+def require_admin(request: Request):
+    if ADMIN_TOKEN and request.headers.get("x-admin-token") != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/admin/negative/{video_id}", dependencies=[Depends(require_admin)])
+def get_negative(video_id: str):
+    """Show the cached permanent failure of a video."""
+    entry = probe.get_negative(r, video_id)
+    if not entry:
+        raise HTTPException(404, "video not in negative cache")
+    return {"video_id": video_id, "ttl": r.ttl(f"negative:{video_id}"), **entry}
+
+
+@app.delete("/admin/negative/{video_id}", dependencies=[Depends(require_admin)])
+def purge_negative(video_id: str):
+    """Forget a video's cached failure so it can be enqueued again."""
+    return {"video_id": video_id, "purged": probe.purge_negative(r, video_id)}
+
+
+@app.delete("/admin/negative", dependencies=[Depends(require_admin)])
+def purge_all_negative():
+    """Empty the negative cache."""
+    return {"purged": probe.purge_negative(r)}
+
+
+def _invalid_url(url: str) -> str | None:
+    """Reason a URL cannot be enqueued at all, or None."""
+    if not url or not url.strip():
+        return "URL cannot be empty."
+    if "list=" in url or "/playlist" in url:
+        return "Playlist URLs are not allowed. Please provide a single video URL."
+    return None
 
+
+def _invalid_sections(req: DownloadReq) -> str | None:
+    """Reason the request's clip sections cannot be used, or None."""
+    try:
+        clips.parse(req.sections or [])
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def _beyond_end(req: DownloadReq, meta: dict | None) -> tuple[str, str] | None:
+    """Rejection of clip sections that start after the end of the video."""
+    message = clips.beyond_end(clips.parse(req.sections or []), (meta or {}).get("duration") or 0)
+    return ("sections", message) if message else None
+
+
+def _unroutable(req: DownloadReq, served: dict) -> str | None:
+    """Reason no worker node can run the request, or None. `served` caches tag lookups."""
+    tag = cluster.job_tag(req.transcribe, req.whisper_model)
+    if not tag:
+        return None
+    if tag not in served:
+        served[tag] = cluster.serving(r, tag)
+    return None if served[tag] else f"No worker node serves Whisper model '{req.whisper_model}'."
+
+
+def _check_eligibility(urls: list[str]) -> dict:
+    """(meta, rejected) per URL; known-dead and ineligible videos are rejected.
+
+    If the probe fails transiently the URL is accepted and the worker decides.
+    """
+    if ENQUEUE_PREFILTER:
+        return probe.check_many(r, urls)
+    result = {}
+    for url in urls:
+        vid = probe.video_id(url)
+        neg = probe.get_negative(r, vid)
+        result[url] = (probe.get_cached(r, vid), (neg["class"], neg["error"]) if neg else None)
+    return result
+
+
+def _classify(req: DownloadReq, meta: dict) -> tuple[str, float, str]:
+    """Return (media, expected_s, lane) of a request."""
     # Determine media type based on video/audio flags
     media = "video"
     if req.video and req.audio:
@@ -322,8 +508,24 @@ def enqueue(request: Request, req: DownloadReq):
     elif req.video:
         media = "video"
 
-    r.hset(f"job:{job_id}", mapping={
-        "status": "queued",
+    # Classify into a scheduling lane by duration (unknown duration -> default lane); clips by their length
+    duration = clips.length(clips.parse(req.sections or [])) or meta.get("duration") or 0
+    expected = scheduler.expected_seconds(r, duration, media, req.transcribe)
+    return media, expected, scheduler.lane_for(expected)
+
+
+def _backpressure(eta: dict) -> int:
+    """Retry-After seconds if the expected wait passes ENQUEUE_MAX_WAIT_S, else 0."""
+    if ENQUEUE_MAX_WAIT_S and eta["expected_wait_s"] > ENQUEUE_MAX_WAIT_S:
+        return max(1, math.ceil(eta["expected_wait_s"] - ENQUEUE_MAX_WAIT_S))
+    return 0
+
+
+def _queue_job(pipe, req: DownloadReq, media: str, expected: float, lane: str, eta: dict) -> str:
+    """Add the job (see jobstore.py) and its queue entry to `pipe`; returns the job ID."""
+    job_id = str(uuid.uuid4())
+    tag = cluster.job_tag(req.transcribe, req.whisper_model)
+    spec = {
         "url": req.url,
         "filename": job_id,
         "format": "",
@@ -335,16 +537,138 @@ def enqueue(request: Request, req: DownloadReq):
         "transcribe_lang": "id" if req.transcribe else "",
         "transcribe_prompt": "",
         "callback_url": req.callback_url or "",
-        "db_id": req.db_id or ""
-    })
-    r.lpush("yt_queue", job_id)
+        "db_id": req.db_id or "",
+        "video_id": probe.video_id(req.url),
+        "whisper_model": req.whisper_model or "",
+        "sections": clips.to_spec(clips.parse(req.sections or [])),
+    }
+    state = {
+        "status": "queued",
+        "enqueued_at": int(time.time()),
+        "lane": lane,
+        "expected_s": expected,
+        "estimated_finish_at": eta["estimated_finish_at"],
+    }
+    if tag:
+        state["tag"] = tag
+    jobstore.create(pipe, job_id, spec, state)
+    scheduler.push(pipe, job_id, lane, expected, tag=tag)
+    return job_id
+
 
-    return {"job_id": job_id, "status": "queued"}
+@app.post("/enqueue", dependencies=[limiter.dependency("enqueue")])
+def enqueue(request: Request, req: DownloadReq):
+    # Reject playlist URLs and Shorts to prevent worker overload
+    invalid = _invalid_url(req.url) or _invalid_sections(req) or _unroutable(req, {})
+    if invalid:
+        raise HTTPException(status_code=400, detail=invalid)
+
+    meta, rejected = _check_eligibility([req.url])[req.url]
+    rejected = rejected or _beyond_end(req, meta)
+    if rejected:
+        metrics.inc("yt_enqueue_rejections_total", reason=rejected[0])
+        raise HTTPException(status_code=400, detail=f"Video not eligible: {rejected[1]}")
+
+    # Backpressure: refuse work that would wait longer than ENQUEUE_MAX_WAIT_S
+    media, expected, lane = _classify(req, meta or {})
+    eta = scheduler.estimate(scheduler.stats(r), lane, expected)
+    retry_after = _backpressure(eta)
+    if retry_after:
+        metrics.inc("yt_enqueue_rejections_total", reason="backlog")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Queue backlog too large: expected wait {eta['expected_wait_s']}s exceeds {ENQUEUE_MAX_WAIT_S}s",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    pipe = r.pipeline()
+    job_id = _queue_job(pipe, req, media, expected, lane, eta)
+    pipe.execute()
+    metrics.inc("yt_jobs_total", status="queued")
+
+    return {"job_id": job_id, "status": "queued", "lane": lane, **eta}
+
+
+@app.post("/enqueue/batch")
+def enqueue_batch(request: Request, response: Response, req: BatchEnqueueReq):
+    """Enqueue many downloads in one call.
+
+    Items are validated and deduplicated, then every accepted job is written in
+    one pipelined MULTI/EXEC. Each item is charged against the `enqueue_batch`
+    rate budget. Returns a job ID or an error per item, in request order.
+    """
+    if not req.items:
+        raise HTTPException(status_code=400, detail="Batch is empty.")
+    if len(req.items) > ENQUEUE_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"Batch too large: at most {ENQUEUE_BATCH_MAX} items.")
+    limiter.enforce(request, response, "enqueue_batch", cost=len(req.items))
+
+    results = [None] * len(req.items)
+    first = {}  # identical request -> index of its first occurrence
+    served = {}
+    for i, item in enumerate(req.items):
+        invalid = _invalid_url(item.url) or _invalid_sections(item) or _unroutable(item, served)
+        if invalid:
+            results[i] = {"index": i, "status": "error", "error": invalid}
+            continue
+        key = (probe.video_id(item.url), item.video, item.audio, item.transcribe, item.callback_url, item.db_id,
+               item.whisper_model, tuple(item.sections or ()))
+        if key in first:
+            results[i] = {"index": i, "status": "duplicate", "duplicate_of": first[key]}
+        else:
+            first[key] = i
+
+    eligibility = _check_eligibility(list(dict.fromkeys(req.items[i].url for i in first.values())))
+    stats = scheduler.stats(r)
+    added = {}  # expected seconds accepted per lane earlier in this batch
+    retry_after = 0
+    pipe = r.pipeline()
+    for i in first.values():
+        item = req.items[i]
+        meta, rejected = eligibility[item.url]
+        rejected = rejected or _beyond_end(item, meta)
+        if rejected:
+            metrics.inc("yt_enqueue_rejections_total", reason=rejected[0])
+            results[i] = {"index": i, "status": "error", "error": f"Video not eligible: {rejected[1]}"}
+            continue
+        media, expected, lane = _classify(item, meta or {})
+        eta = scheduler.estimate(stats, lane, expected, added)
+        wait = _backpressure(eta)
+        if wait:
+            metrics.inc("yt_enqueue_rejections_total", reason="backlog")
+            retry_after = max(retry_after, wait)
+            results[i] = {"index": i, "status": "error", "error": "Queue backlog too large", "retry_after": wait}
+            continue
+        added[lane] = added.get(lane, 0) + expected
+        job_id = _queue_job(pipe, item, media, expected, lane, eta)
+        results[i] = {"index": i, "status": "queued", "job_id": job_id, "lane": lane, **eta}
+    if retry_after:
+        response.headers["Retry-After"] = str(retry_after)
+    if len(pipe):
+        pipe.execute()
+
+    for x in results:
+        if x["status"] == "duplicate":
+            original = results[x["duplicate_of"]]
+            if original["status"] == "queued":
+                x["job_id"] = original["job_id"]
+            else:
+                x.update(status="error", error=original["error"])
+    queued = sum(1 for x in results if x["status"] == "queued")
+    if queued:
+        metrics.inc("yt_jobs_total", queued, status="queued")
+    return {"queued": queued, "failed": sum(1 for x in results if x["status"] == "error"), "items": results}
 
 
 @app.get("/status/{job_id}")
 def get_status(job_id: str):
-    data = r.hgetall(f"job:{job_id}")
+    data = jobstore.get(r, job_id)
+    if not data and archive.enabled():
+        # Finished jobs leave Redis after JOB_TTL_S (sooner once archived)
+        try:
+            data = archive.get(job_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"archive error: {e}")
     if not data:
         raise HTTPException(404, "job not found")
     
@@ -358,8 +682,38 @@ def get_status(job_id: str):
     return data
 
 
-@app.post("/check_channel")
-@limiter.limit("5/minute")
+def _require_archive():
+    if not archive.enabled():
+        raise HTTPException(404, "job archive is disabled (ARCHIVE_PATH is empty)")
+
+
+@app.get("/history")
+def history(video_id: str | None = None, db_id: str | None = None, status: str | None = None,
+            since: int | None = None, until: int | None = None, limit: int = 100, cursor: str | None = None):
+    """Archived (finished) jobs, newest first; `since`/`until` are unix timestamps of the finish time."""
+    _require_archive()
+    try:
+        return archive.query(video_id, db_id, status, since, until, limit, cursor)
+    except ValueError:
+        raise HTTPException(400, "invalid cursor")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"archive error: {e}")
+
+
+@app.get("/history/stats")
+def history_stats(since: int | None = None, until: int | None = None, bucket: str = "day",
+                  db_id: str | None = None, status: str | None = None):
+    """Archived job counts per status, per hour or day (UTC)."""
+    _require_archive()
+    if bucket not in HISTORY_BUCKETS:
+        raise HTTPException(400, f"Unknown bucket. Use one of: {', '.join(HISTORY_BUCKETS)}")
+    try:
+        return archive.stats(since, until, HISTORY_BUCKETS[bucket], db_id, status)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"archive error: {e}")
+
+
+@app.post("/check_channel", dependencies=[limiter.dependency("check_channel")])
 def check_channel(request: Request, req: ChannelCheckReq):
     
     seen = channel_key(req.channel_url)
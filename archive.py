@@ -0,0 +1,202 @@
+# archive.py
+"""Durable job history in SQLite.
+
+Redis only keeps finished jobs for JOB_TTL_S, and loses them on restart.
+The archiver (a thread in the API process, or `python archive.py`) moves
+them into an SQLite file at ARCHIVE_PATH in batches:
+
+    every ARCHIVE_INTERVAL seconds, take up to ARCHIVE_BATCH jobs from
+    jobs:finished that finished more than ARCHIVE_DELAY_S ago (so late
+    callback updates are included), insert them in one transaction, then
+    drop them from jobs:finished and shorten their Redis TTL to
+    ARCHIVE_REDIS_TTL_S
+
+A row is inserted before the job leaves jobs:finished, so a crash at worst
+archives a job twice (the insert is idempotent). The full job is stored as
+zlib-compressed JSON, next to indexed columns for lookups by video_id, db_id,
+status and finish time. /status falls back to the archive, and /history
+and /history/stats query it.
+
+Only one archiver may write a given file. Run it in one API instance and set
+ARCHIVE_PATH empty on the others; they then have no history.
+"""
+import os, json, time, zlib, sqlite3, threading
+from contextlib import closing
+import jobstore
+import metrics
+
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", "/data/archive/jobs.sqlite3")
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", "30"))
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))
+ARCHIVE_DELAY_S = int(os.getenv("ARCHIVE_DELAY_S", "300"))
+ARCHIVE_REDIS_TTL_S = int(os.getenv("ARCHIVE_REDIS_TTL_S", "3600"))
+QUERY_MAX_LIMIT = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    video_id TEXT,
+    db_id TEXT,
+    status TEXT NOT NULL,
+    enqueued_at INTEGER,
+    finished_at INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at, status);
+CREATE INDEX IF NOT EXISTS jobs_video_id ON jobs (video_id, finished_at);
+CREATE INDEX IF NOT EXISTS jobs_db_id ON jobs (db_id, finished_at);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, finished_at);
+"""
+
+_init_lock = threading.Lock()
+_initialized = False
+
+
+def enabled() -> bool:
+    return bool(ARCHIVE_PATH)
+
+
+def _connect() -> sqlite3.Connection:
+    global _initialized
+    if not _initialized:
+        os.makedirs(os.path.dirname(ARCHIVE_PATH) or ".", exist_ok=True)
+    db = sqlite3.connect(ARCHIVE_PATH, timeout=30)
+    db.row_factory = sqlite3.Row
+    with _init_lock:
+        if not _initialized:
+            # WAL: readers (API requests) do not block the archiver and vice versa
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+            _initialized = True
+    return db
+
+
+def _int(value) -> int | None:
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _row(job_id: str, data: dict, finished: float) -> tuple:
+    blob = zlib.compress(json.dumps(data, separators=(",", ":")).encode())
+    return (job_id, data.get("video_id") or None, data.get("db_id") or None, data.get("status") or "unknown",
+            _int(data.get("enqueued_at")), _int(data.get("finished_at")) or int(finished), blob)
+
+
+def archive_batch(r_local) -> int:
+    """Move one batch of finished jobs into the archive; returns the number archived."""
+    due = r_local.zrangebyscore(jobstore.FINISHED_KEY, 0, time.time() - ARCHIVE_DELAY_S,
+                                start=0, num=ARCHIVE_BATCH, withscores=True)
+    if not due:
+        return 0
+    ids = [job_id for job_id, _ in due]
+    rows = [_row(job_id, data, finished)
+            for (job_id, finished), data in zip(due, jobstore.get_many(r_local, ids)) if data]
+    if rows:
+        with closing(_connect()) as db, db:
+            db.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    pipe = r_local.pipeline(transaction=False)
+    pipe.zrem(jobstore.FINISHED_KEY, *ids)
+    for job_id, *_ in rows:
+        jobstore.expire(pipe, job_id, min(ARCHIVE_REDIS_TTL_S, jobstore.JOB_TTL_S or ARCHIVE_REDIS_TTL_S))
+    pipe.execute()
+    metrics.inc("yt_archive_jobs_total", len(rows))
+    return len(rows)
+
+
+def run(redis_factory, stop: threading.Event | None = None):
+    """Archive finished jobs until `stop` is set."""
+    stop = stop or threading.Event()
+    print(f"[CONFIG] Job archive: {ARCHIVE_PATH} (every {ARCHIVE_INTERVAL}s, batches of {ARCHIVE_BATCH})")
+    r_local = None
+    while not stop.is_set():
+        try:
+            if r_local is None:
+                r_local = redis_factory()
+            # Keep going while full batches come back, so a backlog is worked off quickly
+            while archive_batch(r_local) >= ARCHIVE_BATCH and not stop.is_set():
+                pass
+        except Exception as e:
+            print(f"[WARN] Job archive failed: {e}")
+            r_local = None
+        stop.wait(ARCHIVE_INTERVAL)
+
+
+def start(redis_factory) -> threading.Event:
+    """Run the archiver in a daemon thread; set the returned event to stop it."""
+    stop = threading.Event()
+    threading.Thread(target=run, args=(redis_factory, stop), name="job-archive", daemon=True).start()
+    return stop
+
+
+def _decode(row: sqlite3.Row) -> dict:
+    return json.loads(zlib.decompress(row["data"]))
+
+
+def get(job_id: str) -> dict:
+    """An archived job ({} if it is not in the archive)."""
+    with closing(_connect()) as db:
+        row = db.execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return _decode(row) if row else {}
+
+
+def _where(video_id=None, db_id=None, status=None, since=None, until=None) -> tuple[str, list]:
+    clauses, params = ["1 = 1"], []
+    for column, value in (("video_id", video_id), ("db_id", db_id), ("status", status)):
+        if value:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        clauses.append("finished_at >= ?")
+        params.append(int(since))
+    if until is not None:
+        clauses.append("finished_at < ?")
+        params.append(int(until))
+    return " AND ".join(clauses), params
+
+
+def query(video_id=None, db_id=None, status=None, since=None, until=None,
+          limit: int = 100, cursor: str | None = None) -> dict:
+    """Archived jobs matching the filters, newest first.
+
+    Pages are keyset-paginated: pass the returned `next_cursor` to get the next one.
+    """
+    limit = max(1, min(int(limit), QUERY_MAX_LIMIT))
+    where, params = _where(video_id, db_id, status, since, until)
+    if cursor:
+        finished, job_id = cursor.split(":", 1)
+        where += " AND (finished_at < ? OR (finished_at = ? AND job_id < ?))"
+        params += [int(finished), int(finished), job_id]
+    with closing(_connect()) as db:
+        rows = db.execute(
+            f"SELECT job_id, finished_at, data FROM jobs WHERE {where} "
+            f"ORDER BY finished_at DESC, job_id DESC LIMIT ?", params + [limit + 1]).fetchall()
+    jobs = [{"job_id": row["job_id"], **_decode(row)} for row in rows[:limit]]
+    next_cursor = f"{rows[limit - 1]['finished_at']}:{rows[limit - 1]['job_id']}" if len(rows) > limit else None
+    return {"count": len(jobs), "jobs": jobs, "next_cursor": next_cursor}
+
+
+def stats(since=None, until=None, bucket_s: int = 86400, db_id=None, status=None) -> dict:
+    """Job counts per status and time bucket (UTC), from the indexed columns only."""
+    where, params = _where(None, db_id, status, since, until)
+    with closing(_connect()) as db:
+        rows = db.execute(
+            f"SELECT (finished_at / ?) * ? AS period, status, COUNT(*) AS jobs FROM jobs WHERE {where} "
+            f"GROUP BY period, status ORDER BY period", [bucket_s, bucket_s] + params).fetchall()
+    periods = {}
+    totals = {}
+    for row in rows:
+        periods.setdefault(row["period"], {})[row["status"]] = row["jobs"]
+        totals[row["status"]] = totals.get(row["status"], 0) + row["jobs"]
+    return {
+        "bucket_s": bucket_s,
+        "totals": totals,
+        "periods": [{"start": period, "jobs": counts} for period, counts in periods.items()],
+    }
+
+
+if __name__ == "__main__":
+    import redis
+    run(lambda: redis.from_url(os.getenv("REDIS_URL", "redis://yt-redis:6379/0"), decode_responses=True))
@@ -0,0 +1,164 @@
+# autoscale.py
+"""Autoscaling of worker slots for the process-mode supervisor.
+
+Every AUTOSCALE_INTERVAL seconds the supervisor in worker.main() samples the
+queue (scheduler.stats) and the host, and moves the number of active worker
+processes one step between WORKER_MIN and WORKER_MAX:
+
+    down  CPU load per core >= AUTOSCALE_MAX_LOAD, available memory below
+          AUTOSCALE_MIN_FREE_MEM_MB or free disk below AUTOSCALE_MIN_FREE_DISK
+          (the host is saturated; more slots would only slow every job down)
+    up    no pressure, and jobs are queued with an expected wait above
+          AUTOSCALE_TARGET_WAIT_S or more than AUTOSCALE_QUEUE_PER_SLOT queued
+          jobs per active slot
+    down  the queues have been empty for AUTOSCALE_IDLE_S
+
+Changes are at least AUTOSCALE_COOLDOWN_S apart so the effect of the last
+one shows up in the load before the next. A slot being scaled down finishes
+its current job before the process exits.
+
+Autoscaling is on when WORKER_MAX is greater than WORKER_MIN; otherwise the
+supervisor keeps WORKER_CONCURRENCY processes running as before.
+"""
+import os, time, shutil, socket
+import disk
+import metrics
+import scheduler
+
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "3"))
+WORKER_MIN = int(os.getenv("WORKER_MIN", str(WORKER_CONCURRENCY)))
+WORKER_MAX = int(os.getenv("WORKER_MAX", str(max(WORKER_MIN, WORKER_CONCURRENCY))))
+AUTOSCALE_INTERVAL = int(os.getenv("AUTOSCALE_INTERVAL", "15"))
+AUTOSCALE_COOLDOWN_S = int(os.getenv("AUTOSCALE_COOLDOWN_S", "60"))
+AUTOSCALE_TARGET_WAIT_S = float(os.getenv("AUTOSCALE_TARGET_WAIT_S", "300"))
+AUTOSCALE_QUEUE_PER_SLOT = float(os.getenv("AUTOSCALE_QUEUE_PER_SLOT", "2"))
+AUTOSCALE_IDLE_S = int(os.getenv("AUTOSCALE_IDLE_S", "300"))
+AUTOSCALE_MAX_LOAD = float(os.getenv("AUTOSCALE_MAX_LOAD", "0.9"))
+AUTOSCALE_MIN_FREE_MEM_MB = int(os.getenv("AUTOSCALE_MIN_FREE_MEM_MB", "1024"))
+AUTOSCALE_MIN_FREE_DISK = int(os.getenv("AUTOSCALE_MIN_FREE_DISK", str(2 * disk.DISK_HEADROOM_BYTES)))
+
+HOSTNAME = socket.gethostname()
+
+
+def enabled() -> bool:
+    return WORKER_MAX > WORKER_MIN
+
+
+def _available_memory() -> int | None:
+    """Available memory in bytes: MemAvailable, capped by the cgroup (v2) limit if there is one."""
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        pass
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        with open("/sys/fs/cgroup/memory.current") as f:
+            current = int(f.read().strip())
+        if limit != "max":
+            headroom = int(limit) - current
+            available = headroom if available is None else min(available, headroom)
+    except (OSError, ValueError):
+        pass
+    return available
+
+
+def load_per_cpu() -> float | None:
+    """1-minute load average per core (None where unknown)."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except OSError:
+        return None
+
+
+def host_resources() -> dict:
+    """CPU load per core, available memory and free disk of this host (None where unknown)."""
+    load = load_per_cpu()
+    try:
+        os.makedirs(disk.JOBS_DIR, exist_ok=True)
+        free_disk = shutil.disk_usage(disk.JOBS_DIR).free
+    except OSError:
+        free_disk = None
+    return {"load_per_cpu": load, "mem_available": _available_memory(), "disk_free": free_disk}
+
+
+def _pressure(host: dict) -> str | None:
+    if host.get("load_per_cpu") is not None and host["load_per_cpu"] >= AUTOSCALE_MAX_LOAD:
+        return "cpu"
+    if host.get("mem_available") is not None and host["mem_available"] < AUTOSCALE_MIN_FREE_MEM_MB * 1024 * 1024:
+        return "memory"
+    if host.get("disk_free") is not None and host["disk_free"] < AUTOSCALE_MIN_FREE_DISK:
+        return "disk"
+    return None
+
+
+def decide(active: int, queue_stats: dict, host: dict, idle_for: float) -> tuple[int, str | None]:
+    """Target number of slots and the reason for changing it (None: keep `active`)."""
+    lanes = queue_stats["lanes"].values()
+    depth = sum(l["depth"] for l in lanes)
+    wait = max((l["expected_wait_s"] for l in lanes if l["depth"]), default=0.0)
+
+    pressure = _pressure(host)
+    if pressure:
+        return (active - 1, pressure) if active > WORKER_MIN else (active, None)
+    if active < WORKER_MAX and depth:
+        if wait > AUTOSCALE_TARGET_WAIT_S:
+            return active + 1, "wait"
+        if depth > AUTOSCALE_QUEUE_PER_SLOT * active:
+            return active + 1, "queue"
+    if active > WORKER_MIN and not depth and idle_for >= AUTOSCALE_IDLE_S:
+        return active - 1, "idle"
+    return active, None
+
+
+class Autoscaler:
+    """Rate-limits `decide` for the supervisor and records each decision."""
+
+    def __init__(self, redis_factory):
+        self.redis_factory = redis_factory
+        self.r = None
+        self.last_check = 0.0
+        self.last_change = 0.0
+        self.idle_since = None
+
+    def target(self, active: int) -> int:
+        """Number of slots the supervisor should run; `active` unless a change is due."""
+        now = time.monotonic()
+        if now - self.last_check < AUTOSCALE_INTERVAL:
+            return active
+        self.last_check = now
+        try:
+            if self.r is None:
+                self.r = self.redis_factory()
+            queue_stats = scheduler.stats(self.r)
+        except Exception as e:
+            print(f"[WARN] Autoscaler could not read queue stats: {e}")
+            self.r = None
+            return active
+
+        if any(l["depth"] for l in queue_stats["lanes"].values()):
+            self.idle_since = None
+        elif self.idle_since is None:
+            self.idle_since = now
+        idle_for = now - self.idle_since if self.idle_since is not None else 0.0
+
+        host = host_resources()
+        target, reason = decide(active, queue_stats, host, idle_for)
+        if reason is None or now - self.last_change < AUTOSCALE_COOLDOWN_S:
+            return active
+
+        self.last_change = now
+        if reason == "idle":
+            self.idle_since = now
+        action = "up" if target > active else "down"
+        print(f"[INFO] Autoscaler: scaling {action} {active} -> {target} slots ({reason}; host {host})")
+        metrics.inc("yt_autoscale_decisions_total", action=action, reason=reason)
+        return target
+
+    def report(self, active: int):
+        metrics.gauge_set("yt_worker_slots", active, host=HOSTNAME)
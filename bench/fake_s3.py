@@ -0,0 +1,136 @@
+# bench/fake_s3.py
+"""Minimal S3-compatible stand-in for the benchmark harness.
+
+Implements just enough of the S3 REST API for the MinIO client used by the
+worker and API: bucket location/existence, single PUT uploads and multipart
+uploads. Object bodies are read and discarded; only their sizes are kept.
+Request signatures are not verified.
+"""
+import threading, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+class FakeS3:
+    """Holds object sizes and serves the S3 subset on a background thread."""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.objects = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        store = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code=200, body=b"", headers=None):
+                self.send_response(code)
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body and self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _drain(self) -> int:
+                length = int(self.headers.get("Content-Length") or 0)
+                remaining = length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                return length
+
+            def _parts(self):
+                u = urlparse(self.path)
+                segs = u.path.lstrip("/").split("/", 1)
+                bucket = segs[0]
+                key = segs[1] if len(segs) > 1 else ""
+                return bucket, key, parse_qs(u.query, keep_blank_values=True)
+
+            def do_HEAD(self):
+                bucket, key, _ = self._parts()
+                if key:
+                    size = store.objects.get((bucket, key))
+                    if size is None:
+                        return self._reply(404)
+                    return self._reply(200, headers={"ETag": '"bench"', "X-Bench-Size": str(size)})
+                self._reply(200)
+
+            def do_GET(self):
+                bucket, key, qs = self._parts()
+                if "location" in qs:
+                    body = f'<LocationConstraint xmlns="{S3_NS}"></LocationConstraint>'.encode()
+                    return self._reply(200, body, {"Content-Type": "application/xml"})
+                self._reply(200, b"", {"Content-Type": "application/xml"})
+
+            def do_PUT(self):
+                bucket, key, qs = self._parts()
+                size = self._drain()
+                if "uploadId" in qs:
+                    upload_id = qs["uploadId"][0]
+                    with store.lock:
+                        store.uploads.setdefault(upload_id, 0)
+                        store.uploads[upload_id] += size
+                    return self._reply(200, headers={"ETag": f'"part-{qs["partNumber"][0]}"'})
+                with store.lock:
+                    store.objects[(bucket, key)] = size
+                self._reply(200, headers={"ETag": '"bench"'})
+
+            def do_POST(self):
+                bucket, key, qs = self._parts()
+                self._drain()
+                if "uploads" in qs:
+                    upload_id = uuid.uuid4().hex
+                    with store.lock:
+                        store.uploads[upload_id] = 0
+                    body = (
+                        f'<InitiateMultipartUploadResult xmlns="{S3_NS}"><Bucket>{bucket}</Bucket>'
+                        f"<Key>{key}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>"
+                    ).encode()
+                    return self._reply(200, body, {"Content-Type": "application/xml"})
+                if "uploadId" in qs:
+                    with store.lock:
+                        store.objects[(bucket, key)] = store.uploads.pop(qs["uploadId"][0], 0)
+                    body = (
+                        f'<CompleteMultipartUploadResult xmlns="{S3_NS}"><Location>/{bucket}/{key}</Location>'
+                        f'<Bucket>{bucket}</Bucket><Key>{key}</Key><ETag>"bench"</ETag></CompleteMultipartUploadResult>'
+                    ).encode()
+                    return self._reply(200, body, {"Content-Type": "application/xml"})
+                self._reply(400)
+
+            def do_DELETE(self):
+                bucket, key, qs = self._parts()
+                with store.lock:
+                    if "uploadId" in qs:
+                        store.uploads.pop(qs["uploadId"][0], None)
+                    else:
+                        store.objects.pop((bucket, key), None)
+                self._reply(204)
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def total_bytes(self) -> int:
+        with self.lock:
+            return sum(self.objects.values())
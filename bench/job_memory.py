@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# bench/job_memory.py
+"""Measure the Redis memory used per job record.
+
+Starts a private redis-server and stores --jobs jobs twice: as the single
+hash with every field that older versions wrote, and in the jobstore.py
+layout (state hash + spec + result). Memory per job is reported for queued
+jobs and again once they are done.
+
+Usage:
+    python bench/job_memory.py --jobs 20000
+"""
+import argparse, json, os, shutil, subprocess, sys, tempfile, time, uuid
+import redis
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from run import free_port, wait_for, stop_process
+
+PUBLIC_BASE = "https://cdn.example.com/yt-downloads"
+
+
+def spec_and_state(i: int, job_id: str) -> tuple[dict, dict]:
+    """What /enqueue stores for a transcribed audio+video job with a callback."""
+    spec = {
+        "url": f"https://www.youtube.com/watch?v=bench{i:06d}",
+        "filename": job_id,
+        "format": "",
+        "media": "both",
+        "audio_format": "mp3",
+        "transcribe": "true",
+        "include_subs": "false",
+        "sub_langs": "",
+        "transcribe_lang": "id",
+        "transcribe_prompt": "",
+        "callback_url": "https://n8n.example.com/webhook/yt-done",
+        "db_id": str(100000 + i),
+        "video_id": f"bench{i:06d}",
+        "whisper_model": "",
+    }
+    now = int(time.time())
+    state = {"status": "queued", "enqueued_at": now, "lane": "default", "expected_s": 1250.0,
+             "estimated_finish_at": now + 1800}
+    return spec, state
+
+
+def result_and_state(job_id: str) -> tuple[dict, dict]:
+    """What a worker stores while and after running the job."""
+    now = int(time.time())
+    result = {
+        "video_file": f"{PUBLIC_BASE}/{job_id}.mp4",
+        "audio_file": f"{PUBLIC_BASE}/{job_id}.mp3",
+        "transcript_file": f"{PUBLIC_BASE}/{job_id}.srt",
+        "subtitles": json.dumps({}),
+    }
+    state = {
+        "status": "done", "progress": "100", "retry_count": 0, "node": "worker-1",
+        "started_at": now - 600, "heartbeat": now, "finished_at": now,
+        "video_duration": 1250, "audio_duration": 1250, "video_quality": "1080p", "video_fps": "30",
+        "audio_quality": "128kbps", "stage_probe_s": 1.4, "stage_download_s": 212.8, "stage_ffmpeg_s": 18.2,
+        "stage_upload_s": 9.7, "stage_transcribe_s": 281.3, "download_bytes": 412345678, "download_bps": 1938000,
+        "whisper_rtf": "0.225", "callback_status": "delivered", "stage_callback_s": 0.12,
+    }
+    return result, state
+
+
+def used_memory(r) -> int:
+    return r.info("memory")["used_memory"]
+
+
+def measure(r, n: int, ids: list[str], enqueue, finish) -> tuple[float, float]:
+    r.flushdb()
+    base = used_memory(r)
+    for start in range(0, n, 500):
+        pipe = r.pipeline(transaction=False)
+        for i in range(start, min(n, start + 500)):
+            enqueue(pipe, i, ids[i])
+        pipe.execute()
+    queued = (used_memory(r) - base) / n
+    for start in range(0, n, 500):
+        pipe = r.pipeline(transaction=False)
+        for i in range(start, min(n, start + 500)):
+            finish(pipe, ids[i])
+        pipe.execute()
+    done = (used_memory(r) - base) / n
+    return queued, done
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark Redis memory per job record.")
+    p.add_argument("--jobs", type=int, default=20000, help="jobs to store per layout (default: 20000)")
+    p.add_argument("--redis-server", default=shutil.which("redis-server") or "redis-server", help="redis-server binary")
+    args = p.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="yt-bench-mem-")
+    port = free_port()
+    proc = subprocess.Popen(
+        [args.redis_server, "--port", str(port), "--save", "", "--appendonly", "no", "--dir", workdir],
+        stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, start_new_session=True,
+    )
+    try:
+        os.environ["REDIS_URL"] = f"redis://127.0.0.1:{port}/0"
+        r = redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
+        wait_for(r.ping, 10, "redis-server")
+        import jobstore
+
+        ids = [str(uuid.uuid4()) for _ in range(args.jobs)]
+
+        def single_enqueue(pipe, i, job_id):
+            spec, state = spec_and_state(i, job_id)
+            pipe.hset(f"job:{job_id}", mapping={**spec, **state, "tag": ""})
+
+        def single_finish(pipe, job_id):
+            result, state = result_and_state(job_id)
+            pipe.hset(f"job:{job_id}", mapping={**result, **state})
+
+        def store_enqueue(pipe, i, job_id):
+            jobstore.create(pipe, job_id, *spec_and_state(i, job_id))
+
+        def store_finish(pipe, job_id):
+            jobstore.complete(pipe, job_id, *result_and_state(job_id))
+            jobstore.expire(pipe, job_id, jobstore.JOB_TTL_S or 86400)
+
+        rows = [
+            ("single hash", *measure(r, args.jobs, ids, single_enqueue, single_finish),
+             r.object("encoding", f"job:{ids[0]}")),
+            ("jobstore", *measure(r, args.jobs, ids, store_enqueue, store_finish),
+             r.object("encoding", jobstore.key(ids[0]))),
+        ]
+        print(f"{'layout':<12} {'queued B/job':>13} {'done B/job':>11}  hash encoding (done)")
+        for name, queued, done, encoding in rows:
+            print(f"{name:<12} {queued:13.0f} {done:11.0f}  {encoding}")
+        print(f"done jobs: {rows[0][2] / rows[1][2]:.2f}x smaller; they now expire after JOB_TTL_S={jobstore.JOB_TTL_S}s")
+    finally:
+        stop_process(proc)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# bench/ratelimit_overhead.py
+"""Measure the per-request overhead of the Redis rate limiter.
+
+Starts a private redis-server and times RedisRateLimiter.hit() (one EVALSHA)
+against a bare PING round trip, so the cost the limiter adds to /enqueue is
+visible separately from network latency.
+
+Usage:
+    python bench/ratelimit_overhead.py --requests 20000 --clients 50
+"""
+import argparse, os, shutil, subprocess, sys, tempfile, time
+import redis
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from run import free_port, wait_for, percentile, stop_process
+
+
+def timed(fn, n: int) -> list[float]:
+    samples = []
+    for i in range(n):
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1e6)
+    return samples
+
+
+def report(name: str, samples: list[float]):
+    print(f"{name:<14} p50={percentile(samples, 50):8.1f}us  p95={percentile(samples, 95):8.1f}us  "
+          f"p99={percentile(samples, 99):8.1f}us  ops/s={len(samples) / (sum(samples) / 1e6):10.0f}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the Redis sliding-window rate limiter.")
+    p.add_argument("--requests", type=int, default=20000, help="checks to time (default: 20000)")
+    p.add_argument("--clients", type=int, default=50, help="distinct client identities (default: 50)")
+    p.add_argument("--limit", default="1000000/minute", help="limit applied while measuring (default: never reject)")
+    p.add_argument("--redis-server", default=shutil.which("redis-server") or "redis-server", help="redis-server binary")
+    args = p.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="yt-bench-rl-")
+    port = free_port()
+    proc = subprocess.Popen(
+        [args.redis_server, "--port", str(port), "--save", "", "--appendonly", "no", "--dir", workdir],
+        stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT, start_new_session=True,
+    )
+    try:
+        os.environ["REDIS_URL"] = f"redis://127.0.0.1:{port}/0"
+        r = redis.from_url(os.environ["REDIS_URL"], decode_responses=True)
+        wait_for(r.ping, 10, "redis-server")
+
+        from ratelimit import RedisRateLimiter, parse_limit
+        limiter = RedisRateLimiter(r)
+        limit = parse_limit(args.limit)
+        identities = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(args.clients)]
+
+        # warm up the script cache and connection
+        timed(lambda i: limiter.hit("enqueue", identities[i % args.clients], limit), 200)
+
+        report("redis PING", timed(lambda i: r.ping(), args.requests))
+        report("limiter.hit", timed(lambda i: limiter.hit("enqueue", identities[i % args.clients], limit), args.requests))
+    finally:
+        stop_process(proc)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# bench/run.py
+"""End-to-end throughput benchmark for the API + worker pipeline.
+
+Launches a private redis-server, an in-process S3 stand-in (bench/fake_s3.py),
+the FastAPI app under uvicorn and `worker.main()`, with stub `yt-dlp` and
+`ffmpeg` binaries (bench/bin) first on PATH. Jobs are submitted through
+POST /enqueue and followed until they reach a terminal status. Nothing
+touches the network, so results are reproducible on any machine.
+
+For every mode (worker concurrency x media type) it reports throughput in
+jobs/minute, p50/p95 end-to-end job latency and the mean time per stage
+taken from the `stage_<name>_s` fields the worker records.
+
+Usage:
+    python bench/run.py --jobs 20 --concurrency 1,3 --media video,audio
+    python bench/run.py --jobs 10 --file-size 100MB --speed 20MB --json bench_output.txt
+    python bench/run.py --jobs 40 --concurrency 16 --media video --worker-mode async
+    FRAGMENTS_MAX=4 python bench/run.py --protocol http_dash_segments --speed 4MB --link-speed 64MB --request-latency 0.05
+
+Requires `redis-server` on PATH (or --redis-server) and the packages from
+requirements.txt. Whisper is not needed unless --transcribe is passed.
+"""
+import argparse, json, os, shutil, socket, statistics, subprocess, sys, tempfile, time
+import httpx, redis
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+BIN_DIR = os.path.join(BENCH_DIR, "bin")
+sys.path.insert(0, BENCH_DIR)
+from fake_s3 import FakeS3
+
+STAGES = ("probe", "download", "ffmpeg", "upload", "transcribe", "callback")
+TERMINAL = ("done", "error", "skipped")
+BUCKET = "bench"
+
+
+def parse_size(value: str) -> int:
+    """Parse sizes like 512KB, 20MB, 1GB (binary multiples) into bytes."""
+    units = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "B": 1}
+    v = value.strip().upper()
+    for suffix, mult in units.items():
+        if v.endswith(suffix):
+            return int(float(v[: -len(suffix)]) * mult)
+    return int(v)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except Exception:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"timed out waiting for {what}")
+
+
+def percentile(values, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _group_alive(pgid: int) -> bool:
+    try:
+        os.killpg(pgid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+
+
+def stop_process(proc: subprocess.Popen, timeout: float = 10):
+    """Stop a process started with start_new_session=True, including its children.
+
+    Waits for the whole process group: a worker child still blocked in BRPOP
+    would otherwise pop the next mode's first job and die with it.
+    """
+    if proc.poll() is None:
+        try:
+            os.killpg(proc.pid, 15)
+            proc.wait(timeout=timeout)
+        except Exception:
+            try:
+                os.killpg(proc.pid, 9)
+            except Exception:
+                pass
+            proc.wait()
+    deadline = time.monotonic() + timeout
+    while _group_alive(proc.pid):
+        if time.monotonic() > deadline:
+            os.killpg(proc.pid, 9)
+            deadline = time.monotonic() + timeout
+        time.sleep(0.05)
+
+
+class Harness:
+    """Owns the long-lived services (Redis, S3 stand-in, API) shared by all modes."""
+
+    def __init__(self, args):
+        self.args = args
+        self.workdir = tempfile.mkdtemp(prefix="yt-bench-")
+        self.procs = []
+        self.s3 = None
+
+    def log(self, name: str):
+        return open(os.path.join(self.workdir, f"{name}.log"), "ab")
+
+    def start(self):
+        redis_port = free_port()
+        redis_proc = subprocess.Popen(
+            [self.args.redis_server, "--port", str(redis_port), "--save", "", "--appendonly", "no",
+             "--dir", self.workdir],
+            stdout=self.log("redis"), stderr=subprocess.STDOUT, start_new_session=True,
+        )
+        self.procs.append(redis_proc)
+        self.redis_url = f"redis://127.0.0.1:{redis_port}/0"
+        self.r = redis.from_url(self.redis_url, decode_responses=True)
+        wait_for(self.r.ping, 10, "redis-server")
+
+        self.s3 = FakeS3().start()
+
+        self.env = dict(os.environ)
+        self.env.update({
+            "PATH": BIN_DIR + os.pathsep + os.environ.get("PATH", ""),
+            "PYTHONUNBUFFERED": "1",
+            "REDIS_URL": self.redis_url,
+            "ROLE": "api",
+            "MINIO_ENDPOINT": self.s3.endpoint,
+            "MINIO_ACCESS_KEY": "bench",
+            "MINIO_SECRET_KEY": "benchbench",
+            "MINIO_BUCKET": BUCKET,
+            "MINIO_SECURE": "false",
+            "MINIO_PUBLIC_BASE_URL": f"http://{self.s3.endpoint}/{BUCKET}",
+            "COOKIES_PATH": os.path.join(self.workdir, "cookies", "cookies.txt"),
+            "YTDLP_CACHE_DIR": os.path.join(self.workdir, "ytdlp-cache"),
+            "HOST_RATE_DEFAULT": "1000/second",
+            "RATE_LIMIT_ENQUEUE": "100000/minute",
+            "MAX_RETRIES": "1",
+            "RETRY_BACKOFF_BASE": "1",
+            "AUTO_DELETE_LOCAL": "true",
+            "BENCH_DURATION": str(self.args.duration),
+            "BENCH_FILE_SIZE": str(self.args.file_size),
+            "BENCH_AUDIO_SIZE": str(self.args.audio_size),
+            "BENCH_SPEED": str(self.args.speed),
+            "BENCH_LINK_SPEED": str(self.args.link_speed),
+            "BENCH_REQUEST_LATENCY": str(self.args.request_latency),
+            "BENCH_PROTOCOL": self.args.protocol,
+            "BENCH_FRAGMENT_SIZE": str(self.args.fragment_size),
+            "BENCH_PROBE_SECONDS": str(self.args.probe_seconds),
+            "BENCH_FFMPEG_SECONDS": str(self.args.ffmpeg_seconds),
+        })
+
+        api_port = free_port()
+        api_proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(api_port),
+             "--log-level", "warning"],
+            cwd=REPO_DIR, env=self.env, stdout=self.log("api"), stderr=subprocess.STDOUT, start_new_session=True,
+        )
+        self.procs.append(api_proc)
+        self.api = httpx.Client(base_url=f"http://127.0.0.1:{api_port}", timeout=30.0)
+        wait_for(lambda: self.api.get("/health").status_code == 200, 30, "API")
+
+    def stop(self):
+        for proc in reversed(self.procs):
+            stop_process(proc)
+        if self.s3:
+            self.s3.stop()
+        if not self.args.keep:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+        else:
+            print(f"[INFO] Benchmark logs kept in {self.workdir}")
+
+    def run_mode(self, concurrency: int, media: str) -> dict:
+        args = self.args
+        self.r.flushall()
+        download_dir = os.path.join(self.workdir, f"downloads-{concurrency}-{media}")
+        os.makedirs(download_dir, exist_ok=True)
+
+        env = dict(self.env, ROLE="worker", WORKER_CONCURRENCY=str(concurrency), DOWNLOAD_DIR=download_dir,
+                   WORKER_MODE=args.worker_mode, ASYNC_JOBS=str(concurrency))
+        worker = subprocess.Popen(
+            [sys.executable, "-c", "import worker; worker.main()"],
+            cwd=REPO_DIR, env=env, stdout=self.log(f"worker-{concurrency}-{media}"), stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+        submitted = {}
+        try:
+            bench_start = time.monotonic()
+            for i in range(args.jobs):
+                payload = {
+                    "url": f"https://www.youtube.com/watch?v=bench{i:06d}",
+                    "video": media in ("video", "both"),
+                    "audio": media in ("audio", "both"),
+                    "transcribe": args.transcribe,
+                }
+                if args.sections:
+                    payload["sections"] = args.sections.split(",")
+                resp = self.api.post("/enqueue", json=payload)
+                resp.raise_for_status()
+                submitted[resp.json()["job_id"]] = time.monotonic()
+
+            finished = {}
+            deadline = time.monotonic() + args.timeout
+            while len(finished) < len(submitted) and time.monotonic() < deadline:
+                pending = [j for j in submitted if j not in finished]
+                pipe = self.r.pipeline(transaction=False)
+                for job_id in pending:
+                    pipe.hget(f"job:{job_id}", "status")
+                for job_id, status in zip(pending, pipe.execute()):
+                    if status in TERMINAL:
+                        finished[job_id] = time.monotonic()
+                time.sleep(0.1)
+            elapsed = max((max(finished.values()) if finished else time.monotonic()) - bench_start, 1e-6)
+        finally:
+            stop_process(worker)
+
+        pipe = self.r.pipeline(transaction=False)
+        for job_id in submitted:
+            pipe.hgetall(f"job:{job_id}")
+        jobs = dict(zip(submitted, pipe.execute()))
+
+        done = [j for j, d in jobs.items() if d.get("status") == "done"]
+        latencies = [finished[j] - submitted[j] for j in done if j in finished]
+        stages = {}
+        for stage in STAGES:
+            values = [float(jobs[j].get(f"stage_{stage}_s", 0) or 0) for j in done]
+            if any(values):
+                stages[stage] = statistics.mean(values)
+
+        download_bps = [int(jobs[j].get("download_bps") or 0) for j in done]
+        return {
+            "concurrency": concurrency,
+            "media": media,
+            "jobs": len(submitted),
+            "done": len(done),
+            "failed": len(submitted) - len(done),
+            "elapsed_s": round(elapsed, 3),
+            "jobs_per_minute": round(len(done) / elapsed * 60, 2),
+            "latency_p50_s": round(percentile(latencies, 50), 3),
+            "latency_p95_s": round(percentile(latencies, 95), 3),
+            "stage_mean_s": {k: round(v, 3) for k, v in stages.items()},
+            "download_mbps_mean": round(statistics.mean(download_bps) / 1024 ** 2, 2) if download_bps else 0.0,
+            "fragments": sorted({jobs[j].get("dl_fragments", "") for j in done}),
+            "uploaded_bytes": self.s3.total_bytes(),
+        }
+
+
+def print_report(results):
+    header = f"{'conc':>4} {'media':>6} {'done':>6} {'jobs/min':>9} {'p50 s':>8} {'p95 s':>8} {'dl MB/s':>8}  stage means (s)"
+    print(header)
+    print("-" * len(header))
+    for res in results:
+        stages = " ".join(f"{k}={v:.2f}" for k, v in res["stage_mean_s"].items())
+        print(f"{res['concurrency']:>4} {res['media']:>6} {res['done']:>3}/{res['jobs']:<2} "
+              f"{res['jobs_per_minute']:>9.2f} {res['latency_p50_s']:>8.2f} {res['latency_p95_s']:>8.2f} {res['download_mbps_mean']:>8.2f}  {stages}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark API + worker throughput against local stand-ins.")
+    p.add_argument("--jobs", type=int, default=20, help="jobs per mode (default: 20)")
+    p.add_argument("--concurrency", default="1,3", help="comma-separated WORKER_CONCURRENCY values (default: 1,3)")
+    p.add_argument("--media", default="video,audio,both", help="comma-separated media modes (default: video,audio,both)")
+    p.add_argument("--worker-mode", choices=("process", "async"), default="process",
+                   help="worker runtime; in async mode the concurrency is ASYNC_JOBS of one process")
+    p.add_argument("--transcribe", action="store_true", help="request transcription (needs faster-whisper)")
+    p.add_argument("--sections", help="comma-separated clip ranges per job, e.g. 10:00-15:00,40:00-42:00")
+    p.add_argument("--duration", type=int, default=1800, help="video duration reported by the stub (default: 1800)")
+    p.add_argument("--file-size", type=parse_size, default=parse_size("20MB"), help="video file size (default: 20MB)")
+    p.add_argument("--audio-size", type=parse_size, default=parse_size("2MB"), help="audio file size (default: 2MB)")
+    p.add_argument("--speed", type=parse_size, default=parse_size("50MB"), help="stub download speed per second (default: 50MB)")
+    p.add_argument("--link-speed", type=parse_size, default=0, help="stub cap on all connections of a download (default: none)")
+    p.add_argument("--request-latency", type=float, default=0.0, help="stub latency of each HTTP request (default: 0)")
+    p.add_argument("--protocol", default="https", help="stub format protocol, e.g. https, http_dash_segments (default: https)")
+    p.add_argument("--fragment-size", type=parse_size, default=parse_size("1MB"), help="stub fragment size (default: 1MB)")
+    p.add_argument("--probe-seconds", type=float, default=0.2, help="stub metadata probe latency (default: 0.2)")
+    p.add_argument("--ffmpeg-seconds", type=float, default=0.5, help="stub ffmpeg processing time (default: 0.5)")
+    p.add_argument("--timeout", type=float, default=600, help="max seconds to wait per mode (default: 600)")
+    p.add_argument("--redis-server", default=shutil.which("redis-server") or "redis-server", help="redis-server binary")
+    p.add_argument("--json", dest="json_path", help="also write results as JSON to this file")
+    p.add_argument("--keep", action="store_true", help="keep the temp dir with service logs")
+    args = p.parse_args()
+
+    harness = Harness(args)
+    results = []
+    try:
+        harness.start()
+        for concurrency in [int(c) for c in args.concurrency.split(",") if c]:
+            for media in [m.strip() for m in args.media.split(",") if m.strip()]:
+                print(f"[INFO] Running mode concurrency={concurrency} media={media} ({args.jobs} jobs)...")
+                sys.stdout.flush()
+                results.append(harness.run_mode(concurrency, media))
+    finally:
+        harness.stop()
+
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"[INFO] Wrote results to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+# callbacks.py
+"""Callback outbox and asynchronous dispatcher.
+
+Workers never POST webhooks themselves: when a job reaches a terminal status
+they snapshot the job hash into a Redis outbox (`enqueue_callback`) and go
+back to the queue. A dispatcher process (`run_dispatcher`) drains the outbox
+with a pooled async HTTP client, limits concurrency per receiving host and
+retries transient failures with exponential backoff. Each (job, terminal
+status) pair is enqueued at most once.
+
+Run standalone with `python callbacks.py`; by default worker.main() also
+starts one embedded dispatcher process per worker container.
+"""
+import os, sys, json, time, random, socket, asyncio
+from urllib.parse import urlparse
+import redis
+import jobstore
+import metrics
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://yt-redis:6379/0")
+
+CALLBACK_OUTBOX = "callback:outbox"
+CALLBACK_RETRY = "callback:retry"
+CALLBACK_DEAD = "callback:dead"
+CALLBACK_TIMEOUT = float(os.getenv("CALLBACK_TIMEOUT", "30"))
+CALLBACK_MAX_ATTEMPTS = int(os.getenv("CALLBACK_MAX_ATTEMPTS", "8"))
+CALLBACK_RETRY_BASE = float(os.getenv("CALLBACK_RETRY_BASE", "5"))
+CALLBACK_MAX_BACKOFF = float(os.getenv("CALLBACK_MAX_BACKOFF", "900"))
+CALLBACK_PER_HOST_CONCURRENCY = int(os.getenv("CALLBACK_PER_HOST_CONCURRENCY", "4"))
+CALLBACK_MAX_INFLIGHT = int(os.getenv("CALLBACK_MAX_INFLIGHT", "64"))
+CALLBACK_DEDUP_TTL = int(os.getenv("CALLBACK_DEDUP_TTL", str(7 * 24 * 3600)))
+CALLBACK_DEAD_MAX = 1000
+CALLBACK_DISPATCHER_ID = os.getenv("CALLBACK_DISPATCHER_ID", socket.gethostname())
+
+TERMINAL_STATUSES = ("done", "error", "skipped", "cancelled")
+
+
+def enqueue_callback(r_local: redis.Redis, job_id: str) -> bool:
+    """Snapshot a terminal job into the outbox. Returns True if a callback was queued."""
+    data = jobstore.get(r_local, job_id)
+    callback_url = data.get("callback_url")
+    status = data.get("status")
+    if not callback_url or status not in TERMINAL_STATUSES:
+        return False
+
+    # Each terminal state fires once, no matter how many code paths report it
+    if not r_local.set(f"callback:sent:{job_id}:{status}", int(time.time()), nx=True, ex=CALLBACK_DEDUP_TTL):
+        print(f"[CALLBACK] Already queued for job {job_id} ({status}); skipping duplicate")
+        return False
+
+    payload = data.copy()
+    payload["job_id"] = job_id
+    payload.pop("heartbeat", None)
+
+    envelope = {
+        "id": f"{job_id}:{status}",
+        "job_id": job_id,
+        "url": callback_url,
+        "payload": payload,
+        "attempt": 0,
+        "queued_at": time.time(),
+    }
+    r_local.lpush(CALLBACK_OUTBOX, json.dumps(envelope))
+    r_local.hset(f"job:{job_id}", "callback_status", "queued")
+    print(f"[CALLBACK] Queued for job {job_id} ({status}) to {callback_url}")
+    return True
+
+
+def next_delay(attempt: int) -> float:
+    """Exponential backoff with jitter for the given (1-based) failed attempt."""
+    delay = min(CALLBACK_MAX_BACKOFF, CALLBACK_RETRY_BASE * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def is_retryable(status_code: int | None) -> bool:
+    """Network errors, timeouts, 408, 429 and 5xx are worth retrying; other 4xx are not."""
+    if status_code is None:
+        return True
+    return status_code in (408, 429) or status_code >= 500
+
+
+class Dispatcher:
+    """Drains the outbox and delivers callbacks with per-host concurrency limits."""
+
+    def __init__(self, dispatcher_id: str = CALLBACK_DISPATCHER_ID):
+        import redis.asyncio as aioredis
+        self.r = aioredis.from_url(REDIS_URL, decode_responses=True)
+        self.processing = f"callback:processing:{dispatcher_id}"
+        self.inflight = asyncio.Semaphore(CALLBACK_MAX_INFLIGHT)
+        self.host_limits: dict[str, asyncio.Semaphore] = {}
+        self.client = None
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlparse(url).netloc
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(CALLBACK_PER_HOST_CONCURRENCY)
+        return self.host_limits[host]
+
+    async def recover(self):
+        """Return envelopes this dispatcher had in flight when it last stopped."""
+        moved = 0
+        while await self.r.lmove(self.processing, CALLBACK_OUTBOX, "RIGHT", "LEFT"):
+            moved += 1
+        if moved:
+            print(f"[CALLBACK] Recovered {moved} in-flight callbacks")
+
+    async def promote_due(self):
+        """Move retries whose backoff has elapsed back into the outbox."""
+        due = await self.r.zrangebyscore(CALLBACK_RETRY, 0, time.time(), start=0, num=100)
+        for raw in due:
+            # Only the dispatcher that wins the ZREM re-queues the envelope
+            if await self.r.zrem(CALLBACK_RETRY, raw):
+                await self.r.lpush(CALLBACK_OUTBOX, raw)
+
+    async def deliver(self, raw: str):
+        try:
+            envelope = json.loads(raw)
+        except Exception:
+            await self.r.lrem(self.processing, 1, raw)
+            return
+
+        job_id = envelope["job_id"]
+        envelope["attempt"] += 1
+        status_code = None
+        error = ""
+        started = time.monotonic()
+        async with self._host_limit(envelope["url"]):
+            try:
+                resp = await self.client.post(envelope["url"], json=envelope["payload"])
+                status_code = resp.status_code
+                if status_code >= 400:
+                    error = resp.text[:500]
+            except Exception as e:
+                error = str(e)
+        elapsed = time.monotonic() - started
+        # metrics uses a blocking Redis client; keep it off the event loop
+        await asyncio.to_thread(metrics.observe, "yt_stage_seconds", elapsed, stage="callback")
+
+        if status_code is not None and status_code < 400:
+            result = "delivered"
+            print(f"[CALLBACK] Delivered job {job_id} to {envelope['url']}: {status_code}")
+        elif envelope["attempt"] < CALLBACK_MAX_ATTEMPTS and is_retryable(status_code):
+            result = "retrying"
+            delay = next_delay(envelope["attempt"])
+            print(f"[CALLBACK] Job {job_id} attempt {envelope['attempt']} failed ({status_code or error}); retrying in {delay:.0f}s")
+            await self.r.zadd(CALLBACK_RETRY, {json.dumps(envelope): time.time() + delay})
+        else:
+            result = "failed"
+            print(f"[CALLBACK] Giving up on job {job_id} after {envelope['attempt']} attempts: {status_code or error}")
+            envelope["last_error"] = error
+            envelope["last_status"] = status_code
+            await self.r.lpush(CALLBACK_DEAD, json.dumps(envelope))
+            await self.r.ltrim(CALLBACK_DEAD, 0, CALLBACK_DEAD_MAX - 1)
+
+        await asyncio.to_thread(metrics.inc, "yt_callbacks_total", result=result)
+        mapping = {"callback_status": result, "callback_attempts": envelope["attempt"]}
+        if status_code is not None:
+            mapping["callback_http_status"] = status_code
+        if await self.r.exists(f"job:{job_id}"):
+            await self.r.hset(f"job:{job_id}", mapping=mapping)
+            await self.r.hincrbyfloat(f"job:{job_id}", "stage_callback_s", round(elapsed, 3))
+        await self.r.lrem(self.processing, 1, raw)
+
+    async def _run_one(self, raw: str):
+        try:
+            await self.deliver(raw)
+        except Exception as e:
+            print(f"[CALLBACK] Dispatcher error: {e}")
+        finally:
+            self.inflight.release()
+
+    async def run(self):
+        import httpx
+        limits = httpx.Limits(max_connections=CALLBACK_MAX_INFLIGHT, max_keepalive_connections=CALLBACK_MAX_INFLIGHT)
+        async with httpx.AsyncClient(timeout=CALLBACK_TIMEOUT, limits=limits) as client:
+            self.client = client
+            await self.recover()
+            print(f"[CALLBACK] Dispatcher {os.getpid()} started")
+            sys.stdout.flush()
+            last_promote = 0.0
+            tasks = set()
+            while True:
+                if time.monotonic() - last_promote >= 1:
+                    try:
+                        await self.promote_due()
+                    except Exception as e:
+                        print(f"[CALLBACK] Failed to promote retries: {e}")
+                    last_promote = time.monotonic()
+
+                await self.inflight.acquire()
+                try:
+                    raw = await self.r.blmove(CALLBACK_OUTBOX, self.processing, 1, "RIGHT", "LEFT")
+                except Exception as e:
+                    self.inflight.release()
+                    print(f"[CALLBACK] Dispatcher loop error: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                if raw is None:
+                    self.inflight.release()
+                    continue
+                task = asyncio.create_task(self._run_one(raw))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+
+def run_dispatcher():
+    """Process entry point for the callback dispatcher."""
+    try:
+        asyncio.run(Dispatcher().run())
+    except KeyboardInterrupt:
+        print("[CALLBACK] Dispatcher shutting down...")
+
+
+if __name__ == "__main__":
+    run_dispatcher()
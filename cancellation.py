@@ -0,0 +1,96 @@
+# cancellation.py
+"""Job cancellation (DELETE /jobs/{id}).
+
+`request` marks the job with `cancelled_at` and status `cancelled` and takes
+it out of its queue and of the retry schedule (`yt_delayed`). If the job was
+still waiting there, the API queues its `cancelled` callback right away.
+Otherwise a worker holds it: its ID is published on CANCEL_CHANNEL and that
+worker owns the cancellation.
+
+Every worker process runs a listener (`start_listener`) that hands the IDs
+of its own running jobs to the worker, which kills their subprocesses,
+deletes the workspace and reports `cancelled`. The listener also re-checks
+the `cancelled_at` flag of running jobs every CANCEL_POLL_S seconds, in case
+it missed a message while reconnecting. Workers check the flag before every
+attempt too, so a job popped from the queue just before the cancellation is
+stopped as well.
+"""
+import time, threading
+import callbacks
+import jobstore
+import scheduler
+
+CANCEL_CHANNEL = "jobs:cancel"
+CANCEL_POLL_S = 5
+DELAYED_KEY = "yt_delayed"
+
+
+def requested(r_local, job_id: str) -> bool:
+    return bool(r_local.hexists(f"job:{job_id}", "cancelled_at"))
+
+
+def request(r_local, job_id: str) -> dict | None:
+    """Cancel a job. Returns None for an unknown job, else its previous status and whether a worker owns it."""
+    key = f"job:{job_id}"
+    result = {}
+
+    def cancel(pipe):
+        # Watched: a job that reaches another terminal status meanwhile is left alone
+        status, lane, expected, tag = pipe.hmget(key, "status", "lane", "expected_s", "tag")
+        result.clear()
+        result.update(previous_status=status, cancelled=False, running=False)
+        if status is None or status in callbacks.TERMINAL_STATUSES:
+            return
+        pipe.multi()
+        pipe.hset(key, mapping={"status": "cancelled", "cancelled_at": int(time.time()), "error": "Cancelled by request"})
+        pipe.lrem(scheduler.queue_key(lane or "default", tag or ""), 0, job_id)
+        pipe.zrem(DELAYED_KEY, job_id)
+        result.update(cancelled=True, lane=lane or "default", expected=float(expected or 0))
+
+    res = r_local.transaction(cancel, key)
+    if result["previous_status"] is None:
+        return None
+    if not result["cancelled"]:
+        return result
+
+    _, unqueued, undelayed = res
+    if unqueued:
+        r_local.hincrbyfloat(scheduler.BACKLOG_KEY, result["lane"], -result["expected"])
+    # A job no longer waiting anywhere is held by a worker, which stops it and reports it
+    result["running"] = not (unqueued or undelayed)
+    if result["running"]:
+        r_local.publish(CANCEL_CHANNEL, job_id)
+    else:
+        callbacks.enqueue_callback(r_local, job_id)
+        jobstore.finish(r_local, job_id)
+    del result["lane"], result["expected"]
+    return result
+
+
+def start_listener(redis_factory, running_jobs, on_cancel):
+    """Call `on_cancel(job_id)` for cancelled jobs among `running_jobs()` (daemon thread)."""
+
+    def listen():
+        pubsub = None
+        last_poll = time.monotonic()
+        while True:
+            try:
+                if pubsub is None:
+                    r_ls = redis_factory()
+                    pubsub = r_ls.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(CANCEL_CHANNEL)
+                msg = pubsub.get_message(timeout=1)
+                running = set(running_jobs())
+                if msg and msg["data"] in running:
+                    on_cancel(msg["data"])
+                if time.monotonic() - last_poll >= CANCEL_POLL_S:
+                    last_poll = time.monotonic()
+                    for job_id in running:
+                        if requested(r_ls, job_id):
+                            on_cancel(job_id)
+            except Exception as e:
+                print(f"[WARN] Cancellation listener failed: {e}")
+                pubsub = None
+                time.sleep(1)
+
+    threading.Thread(target=listen, name="cancel-listener", daemon=True).start()
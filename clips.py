@@ -0,0 +1,111 @@
+# clips.py
+"""Clip jobs: only the requested time ranges of a video.
+
+POST /enqueue accepts `sections`, a list of "start-end" ranges such as
+"10:00-15:00", "1:02:03-1:05:00" or "600-900.5". They are normalised to
+seconds, sorted and merged, and stored in the job spec as "600-900,3723-3900".
+
+The worker passes every range to yt-dlp (`--download-sections "*600-900"`
+with `--force-keyframes-at-cuts`, so ffmpeg cuts exactly at the range
+edges). yt-dlp writes one file per range, named with OUTTMPL_SUFFIX, which
+the worker concatenates into the job's output file. The clip's length stands
+in for the video duration when a job is scheduled, sized on disk and
+recorded; the transcript covers the clip, and `shift_srt` maps its
+timestamps back to the original video.
+"""
+import os, re
+
+CLIP_MAX_SECTIONS = int(os.getenv("CLIP_MAX_SECTIONS", "10"))
+# Inserted before .%(ext)s in the output template: one file per range, in start order
+OUTTMPL_SUFFIX = ".s%(section_start)06d"
+
+SRT_CUE_RE = re.compile(r"^(\d{2}:\d{2}:\d{2},\d{3}) --> (\d{2}:\d{2}:\d{2},\d{3})", re.M)
+
+
+def _seconds(value: str) -> float:
+    """Seconds from "SS(.s)", "MM:SS(.s)" or "HH:MM:SS(.s)"."""
+    parts = value.strip().split(":")
+    if not 1 <= len(parts) <= 3 or not all(re.fullmatch(r"\d+(\.\d+)?", p) for p in parts):
+        raise ValueError(f"Invalid time '{value}'")
+    seconds = 0.0
+    for p in parts:
+        seconds = seconds * 60 + float(p)
+    return seconds
+
+
+def _num(seconds: float) -> str:
+    return f"{seconds:.3f}".rstrip("0").rstrip(".")
+
+
+def parse(sections: list[str]) -> list[tuple[float, float]]:
+    """Sorted, merged (start, end) ranges in seconds; ValueError on bad input."""
+    if len(sections) > CLIP_MAX_SECTIONS:
+        raise ValueError(f"At most {CLIP_MAX_SECTIONS} sections are allowed.")
+    ranges = []
+    for section in sections:
+        start, sep, end = section.partition("-")
+        if not sep:
+            raise ValueError(f"Invalid section '{section}': expected start-end")
+        start, end = _seconds(start), _seconds(end)
+        if end <= start:
+            raise ValueError(f"Invalid section '{section}': end must be after start")
+        ranges.append((start, end))
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def to_spec(ranges: list[tuple[float, float]]) -> str:
+    return ",".join(f"{_num(start)}-{_num(end)}" for start, end in ranges)
+
+
+def from_spec(spec: str) -> list[tuple[float, float]]:
+    return [tuple(float(t) for t in part.split("-")) for part in spec.split(",")] if spec else []
+
+
+def length(ranges: list[tuple[float, float]]) -> float:
+    return sum(end - start for start, end in ranges)
+
+
+def beyond_end(ranges: list[tuple[float, float]], duration: float) -> str | None:
+    """Message if a range starts past the end of a video of `duration` seconds (unknown: None)."""
+    if duration and ranges and ranges[-1][0] >= duration:
+        return f"Clip section {to_spec(ranges[-1:])} is beyond the end of the video ({duration}s)."
+    return None
+
+
+def args(ranges: list[tuple[float, float]]) -> list[str]:
+    """yt-dlp options that download only the ranges."""
+    if not ranges:
+        return []
+    args = []
+    for start, end in ranges:
+        args += ["--download-sections", f"*{_num(start)}-{_num(end)}"]
+    return args + ["--force-keyframes-at-cuts"]
+
+
+def to_source(t: float, ranges: list[tuple[float, float]], is_end: bool = False) -> float:
+    """Map a time in the concatenated clip to the original video (`is_end`: a cue's end stays in its range)."""
+    clip_start = 0.0
+    for start, end in ranges:
+        if t < clip_start + (end - start) or (is_end and t <= clip_start + (end - start)):
+            return start + t - clip_start
+        clip_start += end - start
+    return ranges[-1][1] if ranges else t
+
+
+def _srt_time(stamp: str, ranges: list[tuple[float, float]], is_end: bool) -> str:
+    h, m, s, ms = (int(g) for g in re.split(r"[:,]", stamp))
+    t = round(to_source(h * 3600 + m * 60 + s + ms / 1000, ranges, is_end) * 1000)
+    return f"{t // 3600000:02d}:{t // 60000 % 60:02d}:{t // 1000 % 60:02d},{t % 1000:03d}"
+
+
+def shift_srt(text: str, ranges: list[tuple[float, float]]) -> str:
+    """Rewrite the timestamps of a transcript of the clip onto the original video."""
+    if not ranges:
+        return text
+    return SRT_CUE_RE.sub(lambda m: f"{_srt_time(m[1], ranges, False)} --> {_srt_time(m[2], ranges, True)}", text)
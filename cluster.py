@@ -0,0 +1,199 @@
+# cluster.py
+"""Worker node registry and capability tags.
+
+Every worker container (node) registers itself in Redis and refreshes its
+entry every NODE_TTL / 3 seconds from a heartbeat thread in the supervisor:
+
+    cluster:nodes               zset  node_id -> last heartbeat
+    cluster:node:<node_id>      hash  capabilities and current load
+    cluster:inflight:<node_id>  hash  job_id -> started_at
+    cluster:done:<minute>       hash  per-node finished jobs and work seconds
+
+A node serves the tags in WORKER_TAGS plus `whisper:<model>` for the Whisper
+model it has loaded. A job that asks for a specific Whisper model is tagged
+`whisper:<model>` at enqueue time and queued in the tagged copy of its lane
+(see scheduler.py), so only nodes with that model pick it up. Untagged jobs
+run anywhere.
+
+Nodes whose heartbeat is older than NODE_TTL are left out of the cluster
+view; NODE_ID defaults to the container hostname.
+
+A node that stops without handing its jobs back (killed, crashed, host lost)
+leaves them in its in-flight hash. Once its heartbeat is older than
+ORPHAN_AFTER_S, and always for the node's own entries when it starts again,
+the jobs are claimed back (`claim_orphans`) and re-queued by a live node.
+"""
+import os, time, socket, threading
+import autoscale
+import scheduler
+
+NODES_KEY = "cluster:nodes"
+NODE_PREFIX = "cluster:node"
+INFLIGHT_PREFIX = "cluster:inflight"
+DONE_PREFIX = "cluster:done"
+NODE_TTL = 30
+ORPHAN_AFTER_S = 4 * NODE_TTL
+ORPHAN_CHECK_INTERVAL = 60
+# Registry entries of nodes gone this long are dropped
+NODE_FORGET_S = 7 * 86400
+NODE_ID = os.getenv("NODE_ID", socket.gethostname())
+WORKER_TAGS = [t.strip() for t in os.getenv("WORKER_TAGS", "").split(",") if t.strip()]
+
+
+def whisper_tag(model: str) -> str:
+    return f"whisper:{model}"
+
+
+def node_tags(whisper_model: str) -> tuple[str, ...]:
+    """Capability tags this node serves."""
+    tags = list(WORKER_TAGS)
+    if whisper_model:
+        tags.append(whisper_tag(whisper_model))
+    return tuple(dict.fromkeys(tags))
+
+
+def job_tag(transcribe: bool, whisper_model: str | None) -> str:
+    """Tag a job must be routed by ('' for any node)."""
+    return whisper_tag(whisper_model) if transcribe and whisper_model else ""
+
+
+def _total_memory() -> int | None:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError):
+        return None
+
+
+def capabilities(whisper_model: str, slots: int) -> dict:
+    """This node's static capabilities and current load, as stored in its registry hash."""
+    host = autoscale.host_resources()
+    return {
+        "node": NODE_ID,
+        "cores": os.cpu_count() or 1,
+        "ram_bytes": _total_memory() or "",
+        "mem_available": host["mem_available"] if host["mem_available"] is not None else "",
+        "disk_free": host["disk_free"] if host["disk_free"] is not None else "",
+        "load_per_cpu": round(host["load_per_cpu"], 3) if host["load_per_cpu"] is not None else "",
+        "whisper_model": whisper_model,
+        "tags": ",".join(node_tags(whisper_model)),
+        "slots": slots,
+        "updated_at": int(time.time()),
+    }
+
+
+def start_heartbeat(redis_factory, whisper_model: str, slots, recover=None, interval: float = NODE_TTL / 3):
+    """Register this node and keep its entry fresh (daemon thread). `slots` returns the current slot count.
+
+    `recover(r)` is called every ORPHAN_CHECK_INTERVAL seconds to re-queue jobs of dead nodes.
+    """
+
+    def beat():
+        r_hb = redis_factory()
+        last_check = time.monotonic()
+        while True:
+            try:
+                pipe = r_hb.pipeline(transaction=False)
+                pipe.hset(f"{NODE_PREFIX}:{NODE_ID}", mapping=capabilities(whisper_model, slots()))
+                pipe.expire(f"{NODE_PREFIX}:{NODE_ID}", NODE_TTL * 2)
+                pipe.zadd(NODES_KEY, {NODE_ID: time.time()})
+                pipe.execute()
+                if recover is not None and time.monotonic() - last_check >= ORPHAN_CHECK_INTERVAL:
+                    last_check = time.monotonic()
+                    recover(r_hb)
+            except Exception as e:
+                print(f"[WARN] Node heartbeat failed: {e}")
+            time.sleep(interval)
+
+    print(f"[CONFIG] Node: {NODE_ID}, tags: {', '.join(node_tags(whisper_model)) or '-'}")
+    threading.Thread(target=beat, name="cluster-heartbeat", daemon=True).start()
+
+
+def job_started(r_local, job_id: str):
+    pipe = r_local.pipeline(transaction=False)
+    pipe.hset(f"{INFLIGHT_PREFIX}:{NODE_ID}", job_id, int(time.time()))
+    pipe.hset(f"job:{job_id}", "node", NODE_ID)
+    pipe.execute()
+
+
+def job_finished(r_local, job_id: str, expected: float | None):
+    """Drop the job from this node's in-flight jobs; count it as done unless `expected` is None (deferred)."""
+    key = f"{DONE_PREFIX}:{int(time.time() // 60)}"
+    pipe = r_local.pipeline(transaction=False)
+    pipe.hdel(f"{INFLIGHT_PREFIX}:{NODE_ID}", job_id)
+    if expected is not None:
+        pipe.hincrby(key, NODE_ID, 1)
+        pipe.hincrbyfloat(key, f"{NODE_ID}:s", expected)
+        pipe.expire(key, scheduler.THROUGHPUT_WINDOW_S + 120)
+    pipe.execute()
+
+
+def running_jobs(r_local) -> int:
+    """Number of jobs this node is running."""
+    return int(r_local.hlen(f"{INFLIGHT_PREFIX}:{NODE_ID}") or 0)
+
+
+def live_nodes(r_local) -> list[str]:
+    now = time.time()
+    r_local.zremrangebyscore(NODES_KEY, 0, now - NODE_FORGET_S)
+    return sorted(r_local.zrangebyscore(NODES_KEY, now - NODE_TTL, "+inf"))
+
+
+def claim_orphans(r_local, own: bool = False) -> list[str]:
+    """Take over the in-flight jobs of nodes that stopped heartbeating; `own` also claims this node's.
+
+    Each job is claimed by exactly one caller (whoever wins its HDEL).
+    """
+    claimed = []
+    cutoff = time.time() - ORPHAN_AFTER_S
+    for key in r_local.scan_iter(f"{INFLIGHT_PREFIX}:*", count=100):
+        node = key[len(INFLIGHT_PREFIX) + 1:]
+        if node == NODE_ID:
+            if not own:
+                continue
+        else:
+            last = r_local.zscore(NODES_KEY, node)
+            if last is not None and last > cutoff:
+                continue
+        for job_id in r_local.hkeys(key):
+            if r_local.hdel(key, job_id):
+                claimed.append(job_id)
+    return claimed
+
+
+def serving(r_local, tag: str) -> bool:
+    """Whether a live node serves `tag`."""
+    nodes = live_nodes(r_local)
+    pipe = r_local.pipeline(transaction=False)
+    for node in nodes:
+        pipe.hget(f"{NODE_PREFIX}:{node}", "tags")
+    return any(tag in (tags or "").split(",") for tags in pipe.execute())
+
+
+def nodes(r_local) -> list[dict]:
+    """Live nodes with their capabilities, in-flight jobs and throughput over the scheduler window."""
+    ids = live_nodes(r_local)
+    minute = int(time.time() // 60)
+    minutes = range(minute - scheduler.THROUGHPUT_WINDOW_S // 60 + 1, minute + 1)
+    pipe = r_local.pipeline(transaction=False)
+    for node in ids:
+        pipe.hgetall(f"{NODE_PREFIX}:{node}")
+        pipe.hgetall(f"{INFLIGHT_PREFIX}:{node}")
+    for m in minutes:
+        pipe.hgetall(f"{DONE_PREFIX}:{m}")
+    res = pipe.execute()
+    buckets = res[2 * len(ids):]
+
+    result = []
+    for i, node in enumerate(ids):
+        info, inflight = res[2 * i], res[2 * i + 1]
+        done = sum(int(b.get(node) or 0) for b in buckets)
+        work_s = sum(float(b.get(f"{node}:s") or 0) for b in buckets)
+        result.append({
+            **info,
+            "tags": [t for t in (info.get("tags") or "").split(",") if t],
+            "inflight": [{"job_id": jid, "started_at": int(at)} for jid, at in sorted(inflight.items(), key=lambda x: x[1])],
+            "jobs_done": done,
+            "jobs_per_hour": round(done * 3600 / scheduler.THROUGHPUT_WINDOW_S, 2),
+            "throughput_s_per_s": round(work_s / scheduler.THROUGHPUT_WINDOW_S, 3),
+        })
+    return result
@@ -0,0 +1,334 @@
+# disk.py
+"""Per-job working directories and the disk manager.
+
+Every job runs in its own directory (`<DOWNLOAD_DIR>/jobs/<job_id>`) with a
+`manifest.json` recording the artifacts it produced, its owner and when it
+was last used. Finding a job's outputs therefore only lists that job's
+directory, cleaning up a job is a single rmtree, and concurrent workers never
+see each other's files.
+
+A job that stops without reaching a terminal status (deferred, interrupted)
+parks its workspace so the next attempt, in any worker process, resumes from
+the partial downloads left in it.
+
+The disk manager (`sweep`) walks job directories, not files: it removes
+finished and parked workspaces older than CLEANUP_MAX_AGE and, when
+DISK_QUOTA_BYTES is set, evicts the least recently used ones (finished
+before parked) until the total is back under quota. Workspaces owned by a
+live worker are never evicted.
+
+Small audio-only jobs can be placed on a tmpfs (TMPFS_DIR) instead of the
+shared volume.
+
+Before downloading, a worker reserves the job's estimated peak bytes in a
+Redis ledger shared by every worker on the volume (`reserve`). Admission
+compares free space against what other jobs have reserved but not yet
+written; when it does not fit, the job is deferred (`DeferJob`) instead of
+failing halfway through a download.
+"""
+import os, json, time, shutil, socket
+
+DOWNLOAD_DIR = os.getenv("DOWNLOAD_DIR", "/data/downloads")
+JOBS_DIR = os.path.join(DOWNLOAD_DIR, "jobs")
+TMPFS_DIR = os.getenv("TMPFS_DIR", "")
+TMPFS_MAX_BYTES = int(os.getenv("TMPFS_MAX_BYTES", str(256 * 1024 * 1024)))
+DISK_QUOTA_BYTES = int(os.getenv("DISK_QUOTA_BYTES", "0"))  # 0 = no quota
+CLEANUP_MAX_AGE = int(os.getenv("CLEANUP_MAX_AGE", "7200"))
+# Active workspaces owned by another host are only treated as orphaned after this long
+ORPHAN_MAX_AGE = int(os.getenv("ORPHAN_MAX_AGE", "86400"))
+DISK_SWEEP_INTERVAL = int(os.getenv("DISK_SWEEP_INTERVAL", "60"))
+MANIFEST = "manifest.json"
+HOSTNAME = socket.gethostname()
+
+# Reservation ledger; share DISK_LEDGER_KEY between containers that mount the same volume
+DISK_LEDGER_KEY = os.getenv("DISK_LEDGER_KEY", f"disk:ledger:{HOSTNAME}")
+DISK_HEADROOM_BYTES = int(os.getenv("DISK_HEADROOM_BYTES", str(1024 ** 3)))
+DISK_DEFER_SECONDS = int(os.getenv("DISK_DEFER_SECONDS", "120"))
+
+
+class DeferJob(Exception):
+    """Raised when a job cannot start yet and should be re-queued after `delay` seconds."""
+
+    def __init__(self, message: str, delay: int = DISK_DEFER_SECONDS):
+        super().__init__(message)
+        self.delay = delay
+
+
+def _roots() -> list[str]:
+    roots = [JOBS_DIR]
+    if TMPFS_DIR:
+        roots.append(os.path.join(TMPFS_DIR, "jobs"))
+    return roots
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except Exception:
+        return True
+
+
+class Workspace:
+    """A job's private working directory and its manifest."""
+
+    def __init__(self, job_id: str, root: str):
+        self.job_id = job_id
+        self.root = root
+        self.path = os.path.join(root, job_id)
+        self.manifest_path = os.path.join(self.path, MANIFEST)
+        self.manifest = {}
+
+    @classmethod
+    def open(cls, job_id: str, expected_bytes: int = 0, prefer_tmpfs: bool = False) -> "Workspace":
+        """Open the job's existing workspace or create one, on tmpfs if requested and it fits."""
+        existing = find(job_id)
+        if existing:
+            existing.manifest.update({"state": "active", "host": HOSTNAME, "pid": os.getpid()})
+            existing.save()
+            return existing
+
+        root = JOBS_DIR
+        if prefer_tmpfs and TMPFS_DIR and 0 < expected_bytes <= TMPFS_MAX_BYTES:
+            tmpfs_root = os.path.join(TMPFS_DIR, "jobs")
+            try:
+                os.makedirs(tmpfs_root, exist_ok=True)
+                if shutil.disk_usage(tmpfs_root).free > expected_bytes * 2:
+                    root = tmpfs_root
+            except Exception as e:
+                print(f"[WARN] tmpfs {TMPFS_DIR} unavailable, using {JOBS_DIR}: {e}")
+
+        ws = cls(job_id, root)
+        os.makedirs(ws.path, exist_ok=True)
+        now = time.time()
+        ws.manifest = {
+            "job_id": job_id,
+            "state": "active",
+            "host": HOSTNAME,
+            "pid": os.getpid(),
+            "created_at": now,
+            "updated_at": now,
+            "artifacts": {},
+        }
+        ws.save()
+        return ws
+
+    @classmethod
+    def load(cls, job_id: str, root: str) -> "Workspace":
+        ws = cls(job_id, root)
+        try:
+            with open(ws.manifest_path, encoding="utf-8") as f:
+                ws.manifest = json.load(f)
+        except Exception:
+            # Directory without a readable manifest: treat as finished and age it by mtime
+            mtime = os.path.getmtime(ws.path) if os.path.exists(ws.path) else 0
+            ws.manifest = {"job_id": job_id, "state": "finished", "created_at": mtime,
+                           "updated_at": mtime, "artifacts": {}}
+        return ws
+
+    def save(self):
+        self.manifest["updated_at"] = time.time()
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp, self.manifest_path)
+
+    def file(self, name: str) -> str:
+        """Absolute path for a file inside the workspace."""
+        return os.path.join(self.path, name)
+
+    def files(self) -> list[str]:
+        """Names of the files currently in the workspace (excluding the manifest)."""
+        try:
+            return sorted(f for f in os.listdir(self.path) if not f.startswith(MANIFEST))
+        except FileNotFoundError:
+            return []
+
+    def add(self, path: str, kind: str):
+        """Record an artifact produced by the job."""
+        if not path or not os.path.exists(path):
+            return
+        self.manifest.setdefault("artifacts", {})[os.path.basename(path)] = {
+            "kind": kind,
+            "bytes": os.path.getsize(path),
+        }
+        self.save()
+
+    def size(self) -> int:
+        """Bytes of job data currently on disk in this workspace."""
+        total = 0
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False) and not entry.name.startswith(MANIFEST):
+                        total += entry.stat().st_size
+        except FileNotFoundError:
+            pass
+        return total
+
+    def is_live(self) -> bool:
+        """True if a worker may still be using this workspace."""
+        if self.manifest.get("state") != "active":
+            return False
+        if self.manifest.get("host") == HOSTNAME:
+            return _pid_alive(int(self.manifest.get("pid") or 0))
+        return time.time() - float(self.manifest.get("updated_at") or 0) < ORPHAN_MAX_AGE
+
+    def _set_state(self, state: str):
+        self.manifest["state"] = state
+        try:
+            self.save()
+        except FileNotFoundError:
+            pass
+
+    def release(self):
+        """Mark the workspace finished; its files stay until the disk manager evicts them."""
+        self._set_state("finished")
+
+    def park(self):
+        """Keep partial downloads for the job's next attempt."""
+        self._set_state("parked")
+
+    def destroy(self):
+        """Remove the workspace and everything in it."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def find(job_id: str) -> Workspace | None:
+    """Return the job's workspace if one exists on any root."""
+    for root in _roots():
+        if os.path.isdir(os.path.join(root, job_id)):
+            return Workspace.load(job_id, root)
+    return None
+
+
+def discard(job_id: str):
+    """Remove a job's workspace, wherever it lives."""
+    ws = find(job_id)
+    if ws:
+        ws.destroy()
+
+
+def iter_workspaces():
+    for root in _roots():
+        try:
+            with os.scandir(root) as it:
+                entries = [e.name for e in it if e.is_dir(follow_symlinks=False)]
+        except FileNotFoundError:
+            continue
+        for name in entries:
+            yield Workspace.load(name, root)
+
+
+def sweep(max_age: int = CLEANUP_MAX_AGE, quota_bytes: int = DISK_QUOTA_BYTES) -> dict:
+    """Evict finished workspaces by age, then by LRU until under quota. Returns counters."""
+    now = time.time()
+    stats = {"workspaces": 0, "evicted": 0, "freed_bytes": 0, "total_bytes": 0}
+    candidates = []
+    for ws in iter_workspaces():
+        stats["workspaces"] += 1
+        size = ws.size()
+        if ws.is_live():
+            stats["total_bytes"] += size
+            continue
+        if now - float(ws.manifest.get("updated_at") or 0) > max_age:
+            ws.destroy()
+            stats["evicted"] += 1
+            stats["freed_bytes"] += size
+            continue
+        stats["total_bytes"] += size
+        parked = ws.manifest.get("state") == "parked"
+        candidates.append(((parked, float(ws.manifest.get("updated_at") or 0)), size, ws))
+
+    if quota_bytes > 0 and stats["total_bytes"] > quota_bytes:
+        for _, size, ws in sorted(candidates, key=lambda c: c[0]):
+            if stats["total_bytes"] <= quota_bytes:
+                break
+            ws.destroy()
+            stats["evicted"] += 1
+            stats["freed_bytes"] += size
+            stats["total_bytes"] -= size
+
+    # Loose files from the pre-workspace layout directly under DOWNLOAD_DIR
+    try:
+        with os.scandir(DOWNLOAD_DIR) as it:
+            for entry in it:
+                if entry.is_file(follow_symlinks=False) and now - entry.stat().st_mtime > max_age:
+                    stats["freed_bytes"] += entry.stat().st_size
+                    os.remove(entry.path)
+                    stats["evicted"] += 1
+    except FileNotFoundError:
+        pass
+
+    return stats
+
+
+def maybe_sweep(r_local) -> dict | None:
+    """Run `sweep` at most once per DISK_SWEEP_INTERVAL per host, whichever worker gets there first."""
+    try:
+        if not r_local.set(f"disk:sweep:{HOSTNAME}", os.getpid(), nx=True, ex=DISK_SWEEP_INTERVAL):
+            return None
+        stats = sweep()
+        if stats["evicted"]:
+            print(f"[DISK] Evicted {stats['evicted']} workspaces ({stats['freed_bytes']} bytes); "
+                  f"{stats['total_bytes']} bytes in use")
+        return stats
+    except Exception as e:
+        print(f"[WARN] Disk sweep failed: {e}")
+        return None
+
+
+def _reservation_stale(entry: dict) -> bool:
+    if entry.get("host") == HOSTNAME:
+        return not _pid_alive(int(entry.get("pid") or 0))
+    return time.time() - float(entry.get("at") or 0) > ORPHAN_MAX_AGE
+
+
+def reserve(r_local, job_id: str, nbytes: int, path: str = JOBS_DIR) -> tuple[bool, int]:
+    """Reserve `nbytes` on the volume holding `path` for a job. Returns (admitted, bytes_available).
+
+    Other jobs' reservations count only for the part they have not written yet.
+    Entries left by dead workers are dropped on the way.
+    """
+    os.makedirs(path, exist_ok=True)
+    usage = shutil.disk_usage(path)
+    if nbytes > usage.total - DISK_HEADROOM_BYTES:
+        raise Exception(f"Estimated size {nbytes} bytes exceeds disk capacity of {DOWNLOAD_DIR}")
+
+    def txn(pipe):
+        outstanding = 0
+        stale = []
+        for other, raw in pipe.hgetall(DISK_LEDGER_KEY).items():
+            if other == job_id:
+                continue
+            try:
+                entry = json.loads(raw)
+            except Exception:
+                stale.append(other)
+                continue
+            if _reservation_stale(entry):
+                stale.append(other)
+                continue
+            ws = find(other)
+            outstanding += max(0, int(entry["bytes"]) - (ws.size() if ws else 0))
+        available = shutil.disk_usage(path).free - DISK_HEADROOM_BYTES - outstanding
+        admitted = nbytes <= available
+        pipe.multi()
+        if stale:
+            pipe.hdel(DISK_LEDGER_KEY, *stale)
+        if admitted:
+            pipe.hset(DISK_LEDGER_KEY, job_id, json.dumps(
+                {"bytes": nbytes, "host": HOSTNAME, "pid": os.getpid(), "at": int(time.time())}))
+        return admitted, int(available)
+
+    return r_local.transaction(txn, DISK_LEDGER_KEY, value_from_callable=True)
+
+
+def unreserve(r_local, job_id: str):
+    """Drop a job's reservation once its download is over."""
+    try:
+        r_local.hdel(DISK_LEDGER_KEY, job_id)
+    except Exception as e:
+        print(f"[WARN] Failed to release disk reservation for {job_id}: {e}")
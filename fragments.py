@@ -0,0 +1,72 @@
+# fragments.py
+"""Per-job download tuning: fragment concurrency and HTTP chunk size.
+
+yt-dlp fetches DASH/HLS fragments one at a time unless told otherwise, and
+one connection rarely fills the link. Before a download the worker asks
+`choose` for settings based on the probed format protocol and on this host:
+
+    fragmented (DASH, HLS)  --concurrent-fragments N, where N is
+                            FRAGMENTS_HOST_BUDGET shared by the jobs running
+                            on this node, capped at FRAGMENTS_MAX, and halved
+                            while the CPU load is at AUTOSCALE_MAX_LOAD or more
+    progressive (https)     --http-chunk-size DOWNLOAD_CHUNK_SIZE, so one long
+                            connection is not throttled; fragments do not apply
+    unknown (no probe)      the fragment setting only, which is harmless for
+                            progressive formats
+
+The chosen settings are stored in the job hash (dl_protocol, dl_fragments,
+dl_chunk_size) next to the achieved download_bps. The defaults come from
+bench/run.py against the stub yt-dlp (see README, "Benchmark").
+"""
+import os
+import autoscale
+
+FRAGMENTS_MAX = int(os.getenv("FRAGMENTS_MAX", "8"))
+FRAGMENTS_HOST_BUDGET = int(os.getenv("FRAGMENTS_HOST_BUDGET", "16"))
+DOWNLOAD_CHUNK_SIZE = os.getenv("DOWNLOAD_CHUNK_SIZE", "10M")
+
+FRAGMENTED_PROTOCOLS = ("http_dash_segments", "m3u8", "ism", "f4m")
+
+
+def _kind(protocol: str | None) -> str:
+    if not protocol:
+        return "unknown"
+    if any(p.startswith(FRAGMENTED_PROTOCOLS) for p in protocol.split("+")):
+        return "fragmented"
+    return "progressive"
+
+
+def protocol(meta: dict, media: str) -> str | None:
+    """Protocol of the format(s) the job downloads, from the probe ('' parts are unknown)."""
+    if media == "audio":
+        audio = [f for f in meta.get("formats") or [] if f.get("protocol")]
+        best = max(audio, key=lambda f: f.get("abr") or f.get("tbr") or 0, default=None)
+        return best["protocol"] if best else None
+    requested = meta.get("requested_formats") or []
+    if requested and all(f.get("protocol") for f in requested):
+        return "+".join(f["protocol"] for f in requested)
+    return meta.get("protocol")
+
+
+def choose(meta: dict, media: str, running: int = 1, load_per_cpu: float | None = None) -> dict:
+    """Download settings for a job; `running` is the number of jobs on this node."""
+    proto = protocol(meta, media)
+    kind = _kind(proto)
+    fragments = max(1, min(FRAGMENTS_MAX, FRAGMENTS_HOST_BUDGET // max(1, running)))
+    if load_per_cpu is not None and load_per_cpu >= autoscale.AUTOSCALE_MAX_LOAD:
+        fragments = max(1, fragments // 2)
+    return {
+        "protocol": proto or "",
+        "fragments": fragments if kind != "progressive" else 1,
+        "chunk_size": DOWNLOAD_CHUNK_SIZE if kind == "progressive" else "",
+    }
+
+
+def args(settings: dict) -> list[str]:
+    """yt-dlp options for `choose`'s settings."""
+    args = []
+    if settings["fragments"] > 1:
+        args += ["--concurrent-fragments", str(settings["fragments"])]
+    if settings["chunk_size"]:
+        args += ["--http-chunk-size", settings["chunk_size"]]
+    return args
@@ -0,0 +1,142 @@
+# hostlimit.py
+"""Cluster-wide request rate limit per remote host.
+
+`--sleep-requests` only paces the requests of one yt-dlp process, so the
+rate a site sees grows with every worker process and channel scan. Every
+yt-dlp invocation (probe, flat listing, subtitle fetch, download) first
+takes a token from a token bucket in Redis for the host it is about to
+contact:
+
+    hostlimit:<host>   hash  tokens, ts (ms)
+
+A bucket refills at its rate up to `burst` tokens. `acquire` reserves its
+token even when the bucket is empty and then sleeps until the token is due,
+so callers across the cluster are served in arrival order with a single
+EVALSHA each. Hosts are normalised (www./m./music. dropped, youtu.be is
+youtube.com).
+
+API request threads must not sleep for long: they pass `max_wait`
+(HOST_RATE_API_MAX_WAIT_S), and when the token is due later than that it is
+refunded and HostBusy raised, so the caller can skip the request (the
+enqueue probe is left to the worker) or answer 503.
+
+The default rate is HOST_RATE_DEFAULT with HOST_RATE_BURST tokens of burst.
+HOST_RATE_LIMITS (JSON or path to a JSON file) overrides it per host, e.g.
+{"youtube.com": "2/second", "vimeo.com": {"rate": "30/minute", "burst": 3}}.
+Like the API limiter, it lets requests through when Redis is unavailable.
+"""
+import os, json, time
+from urllib.parse import urlparse
+import metrics
+import ratelimit
+
+PREFIX = "hostlimit"
+HOST_RATE_DEFAULT = os.getenv("HOST_RATE_DEFAULT", "1/second")
+HOST_RATE_BURST = int(os.getenv("HOST_RATE_BURST", "5"))
+HOST_RATE_API_MAX_WAIT_S = float(os.getenv("HOST_RATE_API_MAX_WAIT_S", "2"))
+HOST_ALIASES = {"youtu.be": "youtube.com", "youtube-nocookie.com": "youtube.com"}
+
+# KEYS[1]: bucket. ARGV: tokens per ms, burst, cost. Returns the wait in ms (0 = token available now).
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate) - cost
+local wait = 0
+if tokens < 0 then wait = math.ceil(-tokens / rate) end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate) + wait + 1000)
+return wait
+"""
+# Registered with the first client that uses it; runs on whichever client is passed in
+_token_bucket = None
+
+
+class HostBusy(Exception):
+    """The host's next token is due later than the caller is willing to wait."""
+
+    def __init__(self, host: str, wait: float):
+        super().__init__(f"Host rate limit: no token for {host} within {wait:.1f}s")
+        self.host = host
+        self.wait = wait
+
+
+def _parse(spec) -> tuple[float, int]:
+    """(tokens per second, burst) from "2/second" or {"rate": "2/second", "burst": 10}."""
+    if isinstance(spec, dict):
+        count, window = ratelimit.parse_limit(spec["rate"])
+        return count / window, int(spec.get("burst", HOST_RATE_BURST))
+    count, window = ratelimit.parse_limit(spec)
+    return count / window, HOST_RATE_BURST
+
+
+def _load_limits() -> dict:
+    raw = os.getenv("HOST_RATE_LIMITS", "").strip()
+    if not raw:
+        return {}
+    try:
+        if os.path.exists(raw):
+            with open(raw, encoding="utf-8") as f:
+                raw = f.read()
+        return {host: _parse(spec) for host, spec in json.loads(raw).items()}
+    except Exception as e:
+        print(f"[WARN] Invalid HOST_RATE_LIMITS, using HOST_RATE_DEFAULT for every host: {e}")
+        return {}
+
+
+DEFAULT_LIMIT = _parse(HOST_RATE_DEFAULT)
+LIMITS = _load_limits()
+
+
+def host(url: str) -> str:
+    """The normalised host of a URL."""
+    name = (urlparse(url if "//" in url else f"//{url}").hostname or "").lower()
+    for prefix in ("www.", "m.", "music."):
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+            break
+    return HOST_ALIASES.get(name, name) or "unknown"
+
+
+def reserve(r_local, url: str, cost: int = 1) -> tuple[str, float]:
+    """Take `cost` tokens for the URL's host. Returns (host, seconds until they are due)."""
+    name = host(url)
+    rate, burst = LIMITS.get(name, DEFAULT_LIMIT)
+    global _token_bucket
+    try:
+        if _token_bucket is None:
+            _token_bucket = r_local.register_script(TOKEN_BUCKET_LUA)
+        wait_ms = _token_bucket(keys=[f"{PREFIX}:{name}"], args=[rate / 1000, burst, cost], client=r_local)
+    except Exception as e:
+        print(f"[WARN] Host rate limiter unavailable, not waiting: {e}")
+        return name, 0.0
+    return name, int(wait_ms) / 1000
+
+
+def refund(r_local, name: str, cost: int = 1):
+    """Give back tokens taken by reserve() for a request that will not be made."""
+    try:
+        r_local.hincrbyfloat(f"{PREFIX}:{name}", "tokens", cost)
+    except Exception as e:
+        print(f"[WARN] Could not refund host token for {name}: {e}")
+
+
+def acquire(r_local, url: str, cost: int = 1, sleep=time.sleep, max_wait: float | None = None) -> float:
+    """Wait for the URL's host to allow one more request; returns the seconds waited.
+
+    With `max_wait`, a token due later than that is refunded and HostBusy raised instead.
+    """
+    name, wait = reserve(r_local, url, cost)
+    if max_wait is not None and wait > max_wait:
+        refund(r_local, name, cost)
+        raise HostBusy(name, wait)
+    if wait > 0:
+        print(f"[INFO] Host rate limit: waiting {wait:.1f}s for {name}")
+        sleep(wait)
+    metrics.observe("yt_host_wait_seconds", wait, host=name)
+    return wait
@@ -0,0 +1,212 @@
+# identities.py
+"""Pool of YouTube identities (cookie file + client profile) leased per job.
+
+An identity is what YouTube sees of a worker: its cookies, user agent,
+player clients and request pacing. IDENTITIES (a JSON list, or the path of a
+JSON file) defines the pool:
+
+    [{"name": "acc1", "cookies": "/data/cookies/acc1.txt",
+      "user_agent": "Mozilla/5.0 ...", "player_client": "android,web",
+      "sleep_requests": 1, "budget": "60/hour"}]
+
+Every field but `name` is optional. `budget` caps how many job attempts may
+use the identity per window (same format as RATE_LIMIT_*). Without
+IDENTITIES the pool is one `default` identity made of COOKIES_PATH and the
+built-in profile, without a budget.
+
+State lives in Redis, so it holds across processes and nodes:
+
+    identity:<name>                 hash  cooldown_until, strikes, last_error
+    identity:<name>:leases          zset  job_id -> leased at
+    identity:<name>:budget:<start>  sliding-window budget counters (ratelimit.py)
+    identity:<name>:stats:<start>   hash  runs, throttled per STATS_WINDOW_S
+
+Before each attempt a worker leases the healthiest identity: not cooling
+down, budget left, then the lowest recent throttle rate and the fewest
+active leases. An attempt that fails with a throttling error (HTTP 403/429,
+"not a bot" checks) puts the identity in a cool-down of IDENTITY_COOLDOWN_S,
+doubled for every further throttle in a row, and the job is retried with
+another identity. When no identity is available the worker waits.
+
+With a single identity there is no other one to retry with, so a throttle
+never cools it down (that would stall every worker): the worker treats
+HTTP 403 as fatal for the job instead, as it did before identities.
+"""
+import os, json, math, time, random
+import metrics
+import ratelimit
+
+COOKIES_PATH = os.getenv("COOKIES_PATH", "/data/cookies/cookies.txt")
+IDENTITY_COOLDOWN_S = int(os.getenv("IDENTITY_COOLDOWN_S", "600"))
+IDENTITY_COOLDOWN_MAX_S = int(os.getenv("IDENTITY_COOLDOWN_MAX_S", str(6 * 3600)))
+# Leases older than this belong to workers that died without releasing them
+IDENTITY_LEASE_TTL_S = int(os.getenv("JOB_TIMEOUT", "14400")) + 600
+STATS_WINDOW_S = 3600
+
+DEFAULT_PROFILE = {
+    "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
+    "player_client": "android,web",
+    "sleep_requests": 1,
+}
+
+THROTTLE_PATTERNS = (
+    "HTTP Error 403",
+    "HTTP Error 429",
+    "Too Many Requests",
+    "not a bot",
+    "rate-limited",
+    "This content isn't available, try again later",
+)
+
+
+class Identity:
+    """One cookie file and client profile."""
+
+    def __init__(self, name: str, cookies: str = "", user_agent: str = "", player_client: str = "",
+                 sleep_requests: float | None = None, budget: str = ""):
+        self.name = name
+        self.cookies = cookies
+        self.user_agent = user_agent or DEFAULT_PROFILE["user_agent"]
+        self.player_client = player_client or DEFAULT_PROFILE["player_client"]
+        self.sleep_requests = DEFAULT_PROFILE["sleep_requests"] if sleep_requests is None else sleep_requests
+        self.budget = ratelimit.parse_limit(budget) if budget else None
+
+    def args(self) -> list[str]:
+        """yt-dlp options that make a request as this identity."""
+        args = []
+        if self.cookies and os.path.exists(self.cookies):
+            args += ["--cookies", self.cookies]
+        args += ["--user-agent", self.user_agent,
+                 "--extractor-args", f"youtube:player_client={self.player_client}"]
+        if self.sleep_requests:
+            args += ["--sleep-requests", str(self.sleep_requests)]
+        return args
+
+
+def _load() -> list[Identity]:
+    raw = os.getenv("IDENTITIES", "").strip()
+    if raw:
+        try:
+            if os.path.exists(raw):
+                with open(raw, encoding="utf-8") as f:
+                    raw = f.read()
+            pool = [Identity(**entry) for entry in json.loads(raw)]
+            if pool:
+                return pool
+        except Exception as e:
+            print(f"[WARN] Invalid IDENTITIES, using the default identity: {e}")
+    return [Identity("default", cookies=COOKIES_PATH)]
+
+
+POOL = _load()
+BY_NAME = {ident.name: ident for ident in POOL}
+
+
+def key(name: str) -> str:
+    return f"identity:{name}"
+
+
+def is_throttled(message: str) -> bool:
+    return any(p in message for p in THROTTLE_PATTERNS)
+
+
+def single() -> bool:
+    """True when the pool has one identity, which must never cool down."""
+    return len(POOL) == 1
+
+
+def _stats_keys(name: str, now: float) -> tuple[str, str]:
+    start = int(now // STATS_WINDOW_S) * STATS_WINDOW_S
+    return f"{key(name)}:stats:{start}", f"{key(name)}:stats:{start - STATS_WINDOW_S}"
+
+
+def _health(r_local, now: float) -> list[dict]:
+    """Per identity: cool-down, active leases and runs/throttles of the current and previous window."""
+    pipe = r_local.pipeline(transaction=False)
+    for ident in POOL:
+        pipe.hmget(key(ident.name), "cooldown_until", "strikes", "last_error")
+        pipe.zremrangebyscore(f"{key(ident.name)}:leases", 0, now - IDENTITY_LEASE_TTL_S)
+        pipe.zcard(f"{key(ident.name)}:leases")
+        for stats_key in _stats_keys(ident.name, now):
+            pipe.hmget(stats_key, "runs", "throttled")
+    res = pipe.execute()
+    health = []
+    for i, ident in enumerate(POOL):
+        (cooldown_until, strikes, last_error), _, leases, cur, prev = res[5 * i:5 * i + 5]
+        runs = int(cur[0] or 0) + int(prev[0] or 0)
+        throttled = int(cur[1] or 0) + int(prev[1] or 0)
+        health.append({
+            "name": ident.name,
+            "cooldown_until": float(cooldown_until or 0),
+            "strikes": int(strikes or 0),
+            "leases": leases,
+            "runs": runs,
+            "throttled": throttled,
+            "throttle_rate": round(throttled / runs, 3) if runs else 0.0,
+            "last_error": last_error or "",
+        })
+    return health
+
+
+def lease(r_local, job_id: str) -> tuple[Identity | None, float]:
+    """Lease the healthiest available identity for one attempt.
+
+    Returns (identity, 0), or (None, seconds until one may become available).
+    """
+    now = time.time()
+    health = _health(r_local, now)
+    ready = [h for h in health if h["cooldown_until"] <= now]
+    random.shuffle(ready)
+    ready.sort(key=lambda h: (h["throttle_rate"], h["leases"]))
+    waits = [h["cooldown_until"] - now for h in health if h["cooldown_until"] > now]
+    budget = r_local.register_script(ratelimit.SLIDING_WINDOW_LUA)
+    for h in ready:
+        ident = BY_NAME[h["name"]]
+        if ident.budget:
+            count, window = ident.budget
+            allowed, _, retry_ms = budget(keys=[f"{key(ident.name)}:budget"], args=[count, window * 1000, 1])
+            if not allowed:
+                waits.append(math.ceil(int(retry_ms) / 1000))
+                continue
+        r_local.zadd(f"{key(ident.name)}:leases", {job_id: now})
+        return ident, 0
+    return None, max(1.0, min(waits or [IDENTITY_COOLDOWN_S]))
+
+
+def release(r_local, ident: Identity, job_id: str, error: str | None = None) -> str:
+    """Return a lease with the attempt's outcome: `ok`, `throttled` or `error` (not the identity's fault)."""
+    now = time.time()
+    result = "throttled" if error and is_throttled(error) else "error" if error else "ok"
+    stats_key = _stats_keys(ident.name, now)[0]
+    pipe = r_local.pipeline(transaction=False)
+    pipe.zrem(f"{key(ident.name)}:leases", job_id)
+    pipe.hincrby(stats_key, "runs", 1)
+    if result == "throttled":
+        pipe.hincrby(stats_key, "throttled", 1)
+    pipe.expire(stats_key, 2 * STATS_WINDOW_S)
+    if result == "ok":
+        pipe.hset(key(ident.name), "strikes", 0)
+    pipe.execute()
+
+    if result == "throttled" and single():
+        print(f"[WARN] Identity {ident.name} throttled; it is the only identity, so it does not cool down")
+    elif result == "throttled":
+        strikes = r_local.hincrby(key(ident.name), "strikes", 1)
+        cooldown = min(IDENTITY_COOLDOWN_MAX_S, IDENTITY_COOLDOWN_S * 2 ** (strikes - 1))
+        r_local.hset(key(ident.name), mapping={"cooldown_until": now + cooldown, "last_error": error[:500]})
+        print(f"[WARN] Identity {ident.name} throttled ({strikes} in a row); cooling down for {cooldown}s")
+    metrics.inc("yt_identity_runs_total", identity=ident.name, result=result)
+    return result
+
+
+def status(r_local) -> list[dict]:
+    """The pool with each identity's health, for GET /identities."""
+    now = time.time()
+    health = _health(r_local, now)
+    for h in health:
+        ident = BY_NAME[h["name"]]
+        h["available"] = h["cooldown_until"] <= now
+        h["cooldown_until"] = int(h["cooldown_until"]) if h["cooldown_until"] > now else None
+        h["budget"] = f"{ident.budget[0]}/{ident.budget[1]}s" if ident.budget else None
+        h["cookies"] = bool(ident.cookies and os.path.exists(ident.cookies))
+    return health
@@ -0,0 +1,122 @@
+# jobstore.py
+"""Job records in Redis.
+
+A job is kept in up to three keys:
+
+    job:<id>          hash    mutable state: status, progress, scheduling, timings
+    job:<id>:spec     string  the request, fixed at enqueue (compact JSON)
+    job:<id>:result   string  output URLs and subtitles, written once when done
+
+The spec leaves out empty and default values. Long write-once values stay
+out of the hash, so the hash fits Redis's compact listpack encoding
+(hash-max-listpack-value, 64 bytes by default) for the job's whole life.
+`get` merges the three keys into the flat dict of strings the API and the
+callbacks have always returned. Jobs stored as a single hash by older
+versions read the same way.
+
+When a job reaches a terminal status, `finish` gives its keys a TTL of
+JOB_TTL_S seconds, so finished jobs no longer pile up in Redis (0 keeps
+them forever), and lists it in FINISHED_KEY (by finish time) for the
+archive (archive.py). bench/job_memory.py measures the bytes per job.
+"""
+import os, json, time
+
+JOB_TTL_S = int(os.getenv("JOB_TTL_S", str(7 * 86400)))
+FINISHED_KEY = "jobs:finished"
+
+# Value a spec field has when it is not stored; filename defaults to the job ID
+SPEC_DEFAULTS = {
+    "url": "",
+    "filename": "",
+    "format": "",
+    "media": "video",
+    "audio_format": "mp3",
+    "transcribe": "false",
+    "include_subs": "false",
+    "sub_langs": "",
+    "transcribe_lang": "",
+    "transcribe_prompt": "",
+    "callback_url": "",
+    "db_id": "",
+    "video_id": "",
+    "whisper_model": "",
+    "sections": "",
+}
+
+
+def key(job_id: str) -> str:
+    return f"job:{job_id}"
+
+
+def spec_key(job_id: str) -> str:
+    return f"job:{job_id}:spec"
+
+
+def result_key(job_id: str) -> str:
+    return f"job:{job_id}:result"
+
+
+def _spec_defaults(job_id: str) -> dict:
+    return {**SPEC_DEFAULTS, "filename": job_id}
+
+
+def create(pipe, job_id: str, spec: dict, state: dict):
+    """Add a new job's spec and initial state to `pipe`."""
+    defaults = _spec_defaults(job_id)
+    compact = {k: str(v) for k, v in spec.items() if str(v) != defaults.get(k, "")}
+    pipe.set(spec_key(job_id), json.dumps(compact, separators=(",", ":")))
+    pipe.hset(key(job_id), mapping=state)
+
+
+def complete(r_local, job_id: str, result: dict, state: dict):
+    """Store a finished job's output, then its final state (works on a client or a pipeline).
+
+    The output is written first, so a reader that sees status done also sees the files.
+    """
+    r_local.set(result_key(job_id), json.dumps({k: str(v) for k, v in result.items()}, separators=(",", ":")))
+    r_local.hset(key(job_id), mapping=state)
+
+
+def get(r_local, job_id: str) -> dict:
+    """The job as one flat dict of strings ({} for an unknown or expired job)."""
+    return get_many(r_local, [job_id])[0]
+
+
+def get_many(r_local, job_ids: list[str]) -> list[dict]:
+    """`get` for several jobs in one round trip."""
+    pipe = r_local.pipeline(transaction=False)
+    for job_id in job_ids:
+        pipe.hgetall(key(job_id))
+        pipe.get(spec_key(job_id))
+        pipe.get(result_key(job_id))
+    res = pipe.execute()
+    return [_merge(job_id, *res[3 * i:3 * i + 3]) for i, job_id in enumerate(job_ids)]
+
+
+def _merge(job_id: str, state: dict, spec: str | None, result: str | None) -> dict:
+    if not state:
+        return {}
+    data = {}
+    if spec is not None:
+        data.update(_spec_defaults(job_id))
+        data.update(json.loads(spec))
+    if result:
+        data.update(json.loads(result))
+    data.update(state)
+    return data
+
+
+def expire(r_local, job_id: str, seconds: int):
+    """Set a TTL on all keys of a job (works on a client or a pipeline)."""
+    for k in (key(job_id), spec_key(job_id), result_key(job_id)):
+        r_local.expire(k, seconds)
+
+
+def finish(r_local, job_id: str):
+    """A job reached a terminal status: list it for the archive and let it expire after JOB_TTL_S."""
+    now = time.time()
+    r_local.zadd(FINISHED_KEY, {job_id: now})
+    if JOB_TTL_S:
+        expire(r_local, job_id, JOB_TTL_S)
+        # Jobs gone from Redis can no longer be archived (e.g. no archive is running)
+        r_local.zremrangebyscore(FINISHED_KEY, 0, now - JOB_TTL_S)
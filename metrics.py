@@ -0,0 +1,173 @@
+# metrics.py
+"""Redis-backed metrics shared by the API and all worker processes.
+
+Every worker process records its observations into Redis hashes so that
+histograms aggregate across processes and containers. The API renders the
+aggregated series in the Prometheus text exposition format on /metrics.
+
+Recording a metric must never break a job, so every write swallows errors.
+"""
+import os, time, redis
+from contextlib import contextmanager
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://yt-redis:6379/0")
+METRICS_PREFIX = "metrics"
+
+SECONDS_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200, 14400)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+THROUGHPUT_BUCKETS = (1e5, 2.5e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7, 5e7, 1e8)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5)
+WAIT_BUCKETS = (0, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# name -> (help text, buckets)
+HISTOGRAMS = {
+    "yt_stage_seconds": ("Wall-clock time spent in each job stage", SECONDS_BUCKETS),
+    "yt_job_seconds": ("Total processing time per job attempt sequence", SECONDS_BUCKETS),
+    "yt_queue_wait_seconds": ("Time between enqueue and pickup by a worker", SECONDS_BUCKETS),
+    "yt_download_bytes_per_second": ("Achieved download throughput", THROUGHPUT_BUCKETS),
+    "yt_whisper_realtime_factor": ("Transcription time divided by audio duration", RTF_BUCKETS),
+    "yt_redis_latency_seconds": ("Latency of Redis operations on the job path", LATENCY_BUCKETS),
+    "yt_minio_upload_seconds": ("Latency of MinIO object uploads", SECONDS_BUCKETS),
+    "yt_ratelimit_check_seconds": ("Latency added by the API rate limiter (sampled)", LATENCY_BUCKETS),
+    "yt_host_wait_seconds": ("Time yt-dlp calls waited for the per-host rate limiter", WAIT_BUCKETS),
+}
+
+# name -> help text
+COUNTERS = {
+    "yt_jobs_total": "Jobs that reached a given status",
+    "yt_minio_upload_bytes_total": "Bytes uploaded to MinIO",
+    "yt_download_resumed_bytes_total": "Bytes reused from partial downloads of earlier attempts",
+    "yt_callbacks_total": "Callback delivery attempts by result",
+    "yt_ratelimit_rejections_total": "Requests rejected by the API rate limiter",
+    "yt_enqueue_rejections_total": "Enqueue requests rejected as ineligible, by reason",
+    "yt_autoscale_decisions_total": "Worker slot scaling decisions, by action and reason",
+    "yt_identity_runs_total": "Job attempts per identity, by outcome (ok, throttled, error)",
+    "yt_ytdlp_cache_total": "yt-dlp runs that solved JS challenges, by shared cache hit or miss",
+    "yt_archive_jobs_total": "Finished jobs moved from Redis to the SQLite archive",
+}
+
+GAUGES = {
+    "yt_jobs_in_progress": "Jobs currently being processed by a worker",
+    "yt_worker_slots": "Active worker slots per host, as set by the supervisor",
+}
+
+_client = None
+_client_pid = None
+
+
+def _redis():
+    """Return a per-process Redis client (re-created after fork)."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = redis.from_url(REDIS_URL, decode_responses=True)
+        _client_pid = os.getpid()
+    return _client
+
+
+def _label_key(labels: dict) -> str:
+    return ",".join(f"{k}={labels[k]}" for k in sorted(labels))
+
+
+def _format_labels(label_key: str, extra: dict | None = None) -> str:
+    pairs = [p.split("=", 1) for p in label_key.split(",") if p]
+    if extra:
+        pairs += [[k, v] for k, v in extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def observe(name: str, value: float, **labels):
+    """Add one observation to a histogram."""
+    _, buckets = HISTOGRAMS[name]
+    lk = _label_key(labels)
+    bound = next((b for b in buckets if value <= b), "+Inf")
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        key = f"{METRICS_PREFIX}:hist:{name}"
+        pipe.hincrby(key, f"{lk}|le|{bound}", 1)
+        pipe.hincrbyfloat(key, f"{lk}|sum", value)
+        pipe.hincrby(key, f"{lk}|count", 1)
+        pipe.execute()
+    except Exception as e:
+        print(f"[WARN] metrics observe {name} failed: {e}")
+
+
+def inc(name: str, amount: float = 1, **labels):
+    """Increment a counter."""
+    try:
+        _redis().hincrbyfloat(f"{METRICS_PREFIX}:counter:{name}", _label_key(labels), amount)
+    except Exception as e:
+        print(f"[WARN] metrics inc {name} failed: {e}")
+
+
+def gauge_add(name: str, amount: float, **labels):
+    """Move a gauge up or down by `amount`."""
+    try:
+        _redis().hincrbyfloat(f"{METRICS_PREFIX}:gauge:{name}", _label_key(labels), amount)
+    except Exception as e:
+        print(f"[WARN] metrics gauge {name} failed: {e}")
+
+
+def gauge_set(name: str, value: float, **labels):
+    """Set a gauge to `value`."""
+    try:
+        _redis().hset(f"{METRICS_PREFIX}:gauge:{name}", _label_key(labels), value)
+    except Exception as e:
+        print(f"[WARN] metrics gauge {name} failed: {e}")
+
+
+@contextmanager
+def timer(name: str, **labels):
+    """Observe the wall-clock duration of the wrapped block into histogram `name`."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        observe(name, time.monotonic() - start, **labels)
+
+
+@contextmanager
+def stage_timer(r_local, job_id: str, stage: str):
+    """Time a job stage: accumulate `stage_<stage>_s` in the job hash and observe the stage histogram."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - start
+        try:
+            r_local.hincrbyfloat(f"job:{job_id}", f"stage_{stage}_s", round(elapsed, 3))
+        except Exception as e:
+            print(f"[WARN] Failed to record stage time for {job_id}: {e}")
+        observe("yt_stage_seconds", elapsed, stage=stage)
+
+
+def render(r_local) -> str:
+    """Render all registered metrics in the Prometheus text exposition format."""
+    lines = []
+
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        raw = r_local.hgetall(f"{METRICS_PREFIX}:hist:{name}") or {}
+        series = {}
+        for field, val in raw.items():
+            lk, kind = field.split("|", 1)
+            series.setdefault(lk, {})[kind] = float(val)
+        for lk, fields in sorted(series.items()):
+            cumulative = 0
+            for b in list(buckets) + ["+Inf"]:
+                cumulative += fields.get(f"le|{b}", 0)
+                lines.append(f"{name}_bucket{_format_labels(lk, {'le': b})} {int(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(lk)} {fields.get('sum', 0)}")
+            lines.append(f"{name}_count{_format_labels(lk)} {int(fields.get('count', 0))}")
+
+    for kind, registry in (("counter", COUNTERS), ("gauge", GAUGES)):
+        for name, help_text in registry.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            raw = r_local.hgetall(f"{METRICS_PREFIX}:{kind}:{name}") or {}
+            for lk, val in sorted(raw.items()):
+                lines.append(f"{name}{_format_labels(lk)} {float(val)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,252 @@
+# probe.py
+"""Per-video metadata probe and cache shared by the API and workers.
+
+Metadata from a yt-dlp probe is reduced to the fields the pipeline uses
+(duration, live status, quality, format sizes) and cached in Redis under
+`meta:{video_id}` for META_CACHE_TTL seconds (META_LIVE_TTL for live and
+upcoming streams, whose status changes soon). The API probes at enqueue time
+to reject ineligible videos before they reach a queue; the worker then finds
+the metadata cached and skips its own probe.
+
+Probes of cache misses run in parallel on a shared thread pool
+(PROBE_CONCURRENCY yt-dlp processes per API process), and concurrent
+requests for the same video wait on one probe instead of starting their own.
+
+Videos that failed with a permanent error (private, removed, members-only,
+age-gated) are remembered in a negative cache, `negative:{video_id}`, with a
+TTL per error class, so a dead URL is rejected without another probe.
+"""
+import os, re, json, time, hashlib, subprocess, threading
+from concurrent.futures import ThreadPoolExecutor
+import hostlimit
+import ytcache
+
+META_CACHE_TTL = int(os.getenv("META_CACHE_TTL", str(6 * 3600)))
+META_LIVE_TTL = int(os.getenv("META_LIVE_TTL", "300"))
+PROBE_TIMEOUT = int(os.getenv("PROBE_TIMEOUT", "30"))
+PROBE_CONCURRENCY = int(os.getenv("PROBE_CONCURRENCY", "8"))
+COOKIES_PATH = os.getenv("COOKIES_PATH", "/data/cookies/cookies.txt")
+# Videos shorter than this are not processed
+MIN_DURATION_S = 900
+
+# Negative cache: error class -> (yt-dlp error substrings, TTL seconds)
+NEGATIVE_CLASSES = {
+    "private": (("Private video",), int(os.getenv("NEGATIVE_TTL_PRIVATE", str(7 * 86400)))),
+    "removed": (("Video unavailable", "This video has been removed"),
+                int(os.getenv("NEGATIVE_TTL_REMOVED", str(7 * 86400)))),
+    "members_only": (("Join this channel to get access to members-only content",
+                      "This video is available to this channel's members"),
+                     int(os.getenv("NEGATIVE_TTL_MEMBERS_ONLY", str(86400)))),
+    "age_gate": (("Sign in to confirm your age",), int(os.getenv("NEGATIVE_TTL_AGE_GATE", str(86400)))),
+    "invalid_url": (("is not a valid URL",), int(os.getenv("NEGATIVE_TTL_INVALID_URL", str(30 * 86400)))),
+}
+
+YOUTUBE_ID_RE = re.compile(r"(?:[?&]v=|youtu\.be/|/shorts/|/live/|/embed/)([\w-]{11})")
+FORMAT_FIELDS = ("format_id", "vcodec", "acodec", "protocol", "filesize", "filesize_approx", "tbr", "abr")
+
+
+def video_id(url: str) -> str:
+    """YouTube video ID of a URL, or a stable hash for other URLs."""
+    m = YOUTUBE_ID_RE.search(url or "")
+    if m:
+        return m.group(1)
+    return "url-" + hashlib.sha1((url or "").strip().encode("utf-8")).hexdigest()[:16]
+
+
+class ProbeError(Exception):
+    """yt-dlp could not extract metadata; the message is its last error line."""
+
+
+def compact(info: dict) -> dict:
+    """Keep only the metadata fields the API and worker use."""
+    meta = {k: info.get(k) for k in ("id", "title", "duration", "live_status", "webpage_url",
+                                     "height", "fps", "abr", "upload_date") + FORMAT_FIELDS}
+    meta["requested_formats"] = [{k: f.get(k) for k in FORMAT_FIELDS}
+                                 for f in info.get("requested_formats") or []]
+    audio = [f for f in info.get("formats") or [] if f.get("vcodec") == "none"]
+    meta["formats"] = [{k: f.get(k) for k in FORMAT_FIELDS} for f in audio]
+    return meta
+
+
+def _loads(raw: str | None) -> dict | None:
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except Exception:
+        return None
+
+
+def get_cached(r_local, vid: str) -> dict | None:
+    return _loads(r_local.get(f"meta:{vid}"))
+
+
+def store(r_local, vid: str, info: dict) -> dict:
+    """Cache probe output (compacted) and return the compacted metadata."""
+    meta = compact(info)
+    ttl = META_LIVE_TTL if meta.get("live_status") in ("is_live", "is_upcoming") else META_CACHE_TTL
+    try:
+        r_local.set(f"meta:{vid}", json.dumps(meta), ex=ttl)
+    except Exception as e:
+        print(f"[WARN] Failed to cache metadata for {vid}: {e}")
+    return meta
+
+
+def error_class(message: str) -> str | None:
+    """Negative-cache class of an error message, or None if it may succeed later."""
+    for name, (patterns, _) in NEGATIVE_CLASSES.items():
+        if any(p in message for p in patterns):
+            return name
+    return None
+
+
+def mark_negative(r_local, vid: str, message: str) -> str | None:
+    """Remember a permanent failure of `vid`; returns its class (None if not cacheable).
+
+    An existing entry is kept, so repeated failures do not extend its TTL.
+    """
+    cls = error_class(message)
+    if cls:
+        entry = {"class": cls, "error": message, "at": int(time.time())}
+        try:
+            r_local.set(f"negative:{vid}", json.dumps(entry), ex=NEGATIVE_CLASSES[cls][1], nx=True)
+        except Exception as e:
+            print(f"[WARN] Failed to cache failure of {vid}: {e}")
+    return cls
+
+
+def get_negative(r_local, vid: str) -> dict | None:
+    return _loads(r_local.get(f"negative:{vid}"))
+
+
+def purge_negative(r_local, vid: str | None = None) -> int:
+    """Delete the negative entry of one video, or all entries; returns the number removed."""
+    if vid:
+        return r_local.delete(f"negative:{vid}")
+    removed = 0
+    batch = []
+    for key in r_local.scan_iter(match="negative:*", count=500):
+        batch.append(key)
+        if len(batch) >= 500:
+            removed += r_local.delete(*batch)
+            batch = []
+    if batch:
+        removed += r_local.delete(*batch)
+    return removed
+
+
+def command(url: str, args: list[str] | None = None) -> list[str]:
+    """The probe command; `args` (an identity's options) replace the default cookies."""
+    cmd = ["yt-dlp", *ytcache.args(), "--dump-json", "--flat-playlist", "--socket-timeout", "30", "--", url]
+    if args is not None:
+        cmd[1:1] = args
+    elif COOKIES_PATH and os.path.exists(COOKIES_PATH):
+        cmd[1:1] = ["--cookies", COOKIES_PATH]
+    return cmd
+
+
+def run(url: str, timeout: int = PROBE_TIMEOUT, args: list[str] | None = None) -> dict:
+    """Probe a URL with yt-dlp and return its full info dict; raises ProbeError."""
+    try:
+        proc = subprocess.run(command(url, args), capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise ProbeError(f"Metadata probe timed out after {timeout}s")
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        errors = [l for l in proc.stderr.splitlines() if l.startswith("ERROR")] or proc.stderr.strip().splitlines()
+        raise ProbeError(errors[-1] if errors else f"yt-dlp exited with code {proc.returncode}")
+    try:
+        return json.loads(lines[0])
+    except ValueError as e:
+        raise ProbeError(f"Invalid probe output: {e}")
+
+
+def ineligible(meta: dict) -> tuple[str, str] | None:
+    """Return (reason, message) if the video must not be processed, else None."""
+    if meta.get("live_status") == "is_upcoming":
+        return "upcoming", "Video is an upcoming live stream (waiting for live)."
+    if meta.get("live_status") == "is_live":
+        return "live", "Video is a live stream."
+    if "/shorts/" in (meta.get("webpage_url") or ""):
+        return "short", "Video is a YouTube Short."
+    duration = meta.get("duration") or 0
+    if duration < MIN_DURATION_S:
+        return "duration", f"Video duration ({duration}s) is less than 15 minutes."
+    return None
+
+
+_executor = None
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _probe_and_store(r_local, url: str, vid: str) -> dict | None:
+    try:
+        hostlimit.acquire(r_local, url, max_wait=hostlimit.HOST_RATE_API_MAX_WAIT_S)
+        return store(r_local, vid, run(url))
+    except hostlimit.HostBusy as e:
+        # Accept the job unprobed; the worker probes it when it runs
+        print(f"[INFO] Skipping probe for {url}: {e}")
+        return None
+    except ProbeError as e:
+        print(f"[WARN] Probe failed for {url}: {e}")
+        mark_negative(r_local, vid, str(e))
+        return None
+
+
+def _submit(r_local, url: str, vid: str):
+    """Start a probe for `vid`, or join the one already running in this process."""
+    global _executor
+    with _inflight_lock:
+        if vid in _inflight:
+            return _inflight[vid]
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PROBE_CONCURRENCY, thread_name_prefix="probe")
+        future = _executor.submit(_probe_and_store, r_local, url, vid)
+        _inflight[vid] = future
+    future.add_done_callback(lambda _: _inflight.pop(vid, None))
+    return future
+
+
+def lookup_many(r_local, urls: list[str]) -> dict:
+    """Metadata for each URL (None where the probe failed).
+
+    Cached entries are read with one MGET; the misses are probed in parallel.
+    """
+    if not urls:
+        return {}
+    vids = {url: video_id(url) for url in urls}
+    unique = list(dict.fromkeys(vids.values()))
+    cached = dict(zip(unique, r_local.mget([f"meta:{vid}" for vid in unique])))
+    found = {vid: _loads(raw) for vid, raw in cached.items() if raw}
+    first_url = {vid: url for url, vid in reversed(vids.items())}
+    futures = {vid: _submit(r_local, first_url[vid], vid) for vid in unique if vid not in found}
+    for vid, future in futures.items():
+        found[vid] = future.result()
+    return {url: found.get(vid) for url, vid in vids.items()}
+
+
+def check_many(r_local, urls: list[str]) -> dict:
+    """Eligibility of each URL as (meta, rejected), rejected being (reason, message) or None.
+
+    The negative cache is consulted first; the other URLs are looked up with
+    lookup_many(). A failed probe leaves meta None and the URL accepted,
+    unless the failure was permanent.
+    """
+    vids = {url: video_id(url) for url in urls}
+    unique = list(dict.fromkeys(vids.values()))
+    negative = {vid: _loads(raw) for vid, raw in zip(unique, r_local.mget([f"negative:{vid}" for vid in unique]))}
+    metas = lookup_many(r_local, [url for url, vid in vids.items() if not negative[vid]])
+
+    result = {}
+    for url, vid in vids.items():
+        neg = negative[vid]
+        if not neg and metas.get(url) is None:
+            # The probe may just have failed permanently
+            neg = get_negative(r_local, vid)
+        if neg:
+            result[url] = (None, (neg["class"], neg["error"]))
+        else:
+            meta = metas[url]
+            result[url] = (meta, ineligible(meta) if meta else None)
+    return result
@@ -0,0 +1,158 @@
+# ratelimit.py
+"""Redis-backed sliding-window rate limiter for the API.
+
+Counters live in Redis, so limits hold across uvicorn workers and API
+replicas. Each check is a single EVALSHA of a Lua script implementing the
+sliding-window counter algorithm (current fixed window plus the previous
+window weighted by how much of it still overlaps), which keeps O(1) memory
+per client and endpoint.
+
+Limits are configured per endpoint (RATE_LIMIT_<ENDPOINT>, e.g.
+RATE_LIMIT_ENQUEUE=10/minute) and can be overridden per API key with
+API_KEY_RATE_LIMITS, a JSON object mapping X-API-Key values to
+{"<endpoint>": "<limit>"}. Requests without a configured key are limited
+per client IP. A request may cost more than one unit: POST /enqueue/batch is
+charged one unit per item against the `enqueue_batch` budget. If Redis is
+unreachable the limiter fails open. The latency
+of a sampled fraction of checks is exported as yt_ratelimit_check_seconds;
+bench/ratelimit_overhead.py measures the per-request overhead directly.
+"""
+import os, re, json, time, math, random, hashlib
+from fastapi import Depends, HTTPException, Request, Response
+import metrics
+
+PREFIX = "ratelimit"
+# Fraction of checks whose latency is recorded; recording costs a Redis round trip of its own
+METRICS_SAMPLE = float(os.getenv("RATE_LIMIT_METRICS_SAMPLE", "0.1"))
+
+DEFAULT_LIMITS = {
+    "enqueue": "10/minute",
+    "check_channel": "5/minute",
+    # counted in items, not requests
+    "enqueue_batch": "500/minute",
+}
+
+UNIT_SECONDS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+# KEYS[1]: counter prefix. ARGV: limit, window_ms, cost.
+# Returns {allowed, remaining, retry_after_ms}.
+SLIDING_WINDOW_LUA = """
+local limit = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3] or '1')
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cur_start = now - (now % window)
+local cur_key = KEYS[1] .. ':' .. cur_start
+local prev_key = KEYS[1] .. ':' .. (cur_start - window)
+local cur = tonumber(redis.call('GET', cur_key) or '0')
+local prev = tonumber(redis.call('GET', prev_key) or '0')
+local elapsed = now - cur_start
+local estimated = prev * (window - elapsed) / window + cur
+if estimated + cost > limit then
+  local wait
+  if cur + cost > limit then
+    -- must reach the next window, then wait for this window's weight to decay
+    wait = (window - elapsed) + math.ceil(window * (1 - (limit - cost) / cur))
+  else
+    -- wait for the previous window's weight to decay enough
+    wait = math.ceil(window * (1 - (limit - cost - cur) / prev)) - elapsed
+  end
+  if wait < 1 then wait = 1 end
+  return {0, 0, wait}
+end
+redis.call('INCRBY', cur_key, cost)
+redis.call('PEXPIRE', cur_key, window * 2)
+return {1, math.floor(limit - estimated - cost), 0}
+"""
+
+
+def parse_limit(spec: str) -> tuple[int, int]:
+    """Parse '10/minute', '100 per hour' or '30/10 seconds' into (count, window_seconds)."""
+    m = re.fullmatch(r"\s*(\d+)\s*(?:/|per)\s*(\d+)?\s*(second|minute|hour|day)s?\s*", spec.lower())
+    if not m:
+        raise ValueError(f"Invalid rate limit: {spec!r}")
+    count, multiplier, unit = m.groups()
+    return int(count), int(multiplier or 1) * UNIT_SECONDS[unit]
+
+
+def _load_key_limits() -> dict:
+    raw = os.getenv("API_KEY_RATE_LIMITS", "").strip()
+    if not raw:
+        return {}
+    try:
+        if os.path.exists(raw):
+            with open(raw, encoding="utf-8") as f:
+                raw = f.read()
+        return json.loads(raw)
+    except Exception as e:
+        print(f"[WARN] Invalid API_KEY_RATE_LIMITS, ignoring per-key limits: {e}")
+        return {}
+
+
+class RedisRateLimiter:
+    """Sliding-window limiter shared by every API process through Redis."""
+
+    def __init__(self, r_local):
+        self.r = r_local
+        self.script = r_local.register_script(SLIDING_WINDOW_LUA)
+        self.endpoint_limits = {
+            name: parse_limit(os.getenv(f"RATE_LIMIT_{name.upper()}", spec))
+            for name, spec in DEFAULT_LIMITS.items()
+        }
+        self.key_limits = {
+            key: {name: parse_limit(spec) for name, spec in limits.items()}
+            for key, limits in _load_key_limits().items()
+        }
+
+    def identify(self, request: Request, endpoint: str) -> tuple[str, tuple[int, int]]:
+        """Return (bucket identity, (count, window)) for a request."""
+        api_key = request.headers.get("x-api-key")
+        if api_key and api_key in self.key_limits:
+            limit = self.key_limits[api_key].get(endpoint, self.endpoint_limits[endpoint])
+            return "key:" + hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:16], limit
+        client = request.client.host if request.client else "unknown"
+        return f"ip:{client}", self.endpoint_limits[endpoint]
+
+    def hit(self, endpoint: str, identity: str, limit: tuple[int, int], cost: int = 1) -> tuple[bool, int, int]:
+        """Count `cost` units. Returns (allowed, remaining, retry_after_seconds)."""
+        count, window = limit
+        allowed, remaining, retry_ms = self.script(
+            keys=[f"{PREFIX}:{endpoint}:{identity}"], args=[count, window * 1000, cost]
+        )
+        return bool(allowed), max(0, int(remaining)), math.ceil(int(retry_ms) / 1000)
+
+    def enforce(self, request: Request, response: Response, endpoint: str, cost: int = 1):
+        """Charge `cost` units for this request; raises 429 when the budget is exhausted."""
+        identity, limit = self.identify(request, endpoint)
+        if cost > limit[0]:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Request needs {cost} units but the limit is {limit[0]} per {limit[1]} seconds",
+            )
+        started = time.perf_counter()
+        try:
+            allowed, remaining, retry_after = self.hit(endpoint, identity, limit, cost)
+        except Exception as e:
+            print(f"[WARN] Rate limiter unavailable, allowing request: {e}")
+            return
+        finally:
+            if random.random() < METRICS_SAMPLE:
+                metrics.observe("yt_ratelimit_check_seconds", time.perf_counter() - started, endpoint=endpoint)
+
+        if not allowed:
+            metrics.inc("yt_ratelimit_rejections_total", endpoint=endpoint)
+            raise HTTPException(
+                status_code=429,
+                detail=f"Rate limit exceeded: {limit[0]} per {limit[1]} seconds",
+                headers={"Retry-After": str(retry_after), "X-RateLimit-Limit": str(limit[0]),
+                         "X-RateLimit-Remaining": "0"},
+            )
+        response.headers["X-RateLimit-Limit"] = str(limit[0])
+        response.headers["X-RateLimit-Remaining"] = str(remaining)
+
+    def dependency(self, endpoint: str):
+        """FastAPI dependency enforcing the limit for `endpoint`."""
+        def check(request: Request, response: Response):
+            self.enforce(request, response, endpoint)
+        return Depends(check)
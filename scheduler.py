@@ -0,0 +1,260 @@
+# scheduler.py
+"""Queue lanes and shortest-expected-job-first scheduling.
+
+Jobs are classified at enqueue time by their expected processing time,
+estimated from the video duration (metadata cache), the requested media and
+whether transcription is on:
+
+    short    expected <= LANE_SHORT_MAX_S      yt_queue:short
+    default  everything else, or unknown       yt_queue
+    long     expected >= LANE_LONG_MIN_S       yt_queue:long
+
+Each lane is a FIFO list. A worker looks at the oldest job of every lane and
+takes the one with the lowest `expected_s - SCHED_AGING * waited_s`, so short
+jobs overtake long ones, but a long job's priority keeps improving while it
+waits and it cannot starve.
+
+The processing-seconds-per-media-second rate behind the estimate is learned
+from finished jobs (an EWMA per media/transcribe class), starting from the
+SCHED_RATE_* defaults.
+
+Jobs that need a capability only some worker nodes have (see cluster.py)
+carry a tag and go to a tagged copy of their lane (`yt_queue@whisper:large-v3`).
+A worker only looks at the untagged lanes and the lanes of the tags its node
+serves. Tags in use are kept in the `sched:tags` set.
+
+Wait estimates divide the expected work queued ahead of a job by the drain
+rate: the expected seconds of work that left the queues per second over the
+last SCHED_THROUGHPUT_WINDOW_S, or the number of live workers until enough
+jobs have finished in that window to measure it.
+"""
+import os, time, socket, threading
+
+LANES = ("short", "default", "long")
+LANE_KEYS = {"short": "yt_queue:short", "default": "yt_queue", "long": "yt_queue:long"}
+RATES_KEY = "sched:rates"
+BACKLOG_KEY = "sched:backlog"
+WORKERS_KEY = "sched:workers"
+TAGS_KEY = "sched:tags"
+
+LANE_SHORT_MAX_S = float(os.getenv("LANE_SHORT_MAX_S", "900"))
+LANE_LONG_MIN_S = float(os.getenv("LANE_LONG_MIN_S", "3600"))
+SCHED_AGING = float(os.getenv("SCHED_AGING", "1.0"))
+SCHED_DEFAULT_EXPECTED_S = float(os.getenv("SCHED_DEFAULT_EXPECTED_S", "1800"))
+SCHED_RATE_ALPHA = 0.2
+# Processing seconds per second of media, before any jobs have been observed
+DEFAULT_RATES = {
+    "video": float(os.getenv("SCHED_RATE_VIDEO", "0.05")),
+    "audio": float(os.getenv("SCHED_RATE_AUDIO", "0.02")),
+    "both": float(os.getenv("SCHED_RATE_BOTH", "0.07")),
+}
+DEFAULT_TRANSCRIBE_RATE = float(os.getenv("SCHED_RATE_TRANSCRIBE", "0.3"))
+# Workers without a heartbeat for this long are not counted in wait estimates
+WORKER_TTL = 30
+DRAINED_PREFIX = "sched:drained"
+THROUGHPUT_WINDOW_S = int(os.getenv("SCHED_THROUGHPUT_WINDOW_S", "900"))
+# Below this many jobs in the window the drain rate falls back to the worker count
+THROUGHPUT_MIN_JOBS = 5
+
+
+def _rate_field(media: str, transcribe: bool) -> str:
+    return f"{media}:{int(bool(transcribe))}"
+
+
+def expected_seconds(r_local, duration: float, media: str, transcribe: bool) -> float:
+    """Expected processing time of a job; SCHED_DEFAULT_EXPECTED_S if the duration is unknown."""
+    if not duration:
+        return SCHED_DEFAULT_EXPECTED_S
+    rate = r_local.hget(RATES_KEY, _rate_field(media, transcribe))
+    if rate is None:
+        rate = DEFAULT_RATES.get(media, DEFAULT_RATES["video"]) + (DEFAULT_TRANSCRIBE_RATE if transcribe else 0)
+    return round(float(duration) * float(rate), 1)
+
+
+def lane_for(expected: float) -> str:
+    if expected <= LANE_SHORT_MAX_S:
+        return "short"
+    if expected >= LANE_LONG_MIN_S:
+        return "long"
+    return "default"
+
+
+def queue_key(lane: str, tag: str = "") -> str:
+    key = LANE_KEYS.get(lane, LANE_KEYS["default"])
+    return f"{key}@{tag}" if tag else key
+
+
+def queue_keys(r_local, lane: str) -> list[str]:
+    """The untagged and every tagged queue of a lane."""
+    return [queue_key(lane)] + [queue_key(lane, tag) for tag in sorted(r_local.smembers(TAGS_KEY))]
+
+
+def push(r_local, job_id: str, lane: str, expected: float, front: bool = False, tag: str = ""):
+    """Queue a job in its lane (works on a client or a pipeline). `front` puts it next in line."""
+    key = queue_key(lane, tag)
+    if tag:
+        r_local.sadd(TAGS_KEY, tag)
+    if front:
+        r_local.rpush(key, job_id)
+    else:
+        r_local.lpush(key, job_id)
+    r_local.hincrbyfloat(BACKLOG_KEY, lane, expected)
+
+
+def _popped(r_local, lane: str, job_id: str) -> tuple[str, str]:
+    expected = float(r_local.hget(f"job:{job_id}", "expected_s") or 0)
+    backlog = r_local.hincrbyfloat(BACKLOG_KEY, lane, -expected)
+    if backlog < 0 or not sum(r_local.llen(key) for key in queue_keys(r_local, lane)):
+        # Counter drifted (jobs removed out of band) or lane drained: re-anchor at zero
+        r_local.hset(BACKLOG_KEY, lane, 0)
+    return lane, job_id
+
+
+def pick(r_local, timeout: int, tags: tuple[str, ...] = ()) -> tuple[str, str] | None:
+    """Pop the next job to run as (lane, job_id); blocks up to `timeout` seconds if all lanes are empty.
+
+    `tags` are the capability tags of this worker's node; their queues are considered too.
+    """
+    keys = {queue_key(lane, tag): lane for tag in ("",) + tuple(tags) for lane in LANES}
+    pipe = r_local.pipeline(transaction=False)
+    for key in keys:
+        pipe.lindex(key, -1)
+    heads = {key: job_id for key, job_id in zip(keys, pipe.execute()) if job_id}
+
+    if heads:
+        pipe = r_local.pipeline(transaction=False)
+        for job_id in heads.values():
+            pipe.hmget(f"job:{job_id}", "expected_s", "enqueued_at")
+        now = time.time()
+        scores = {}
+        for key, (expected, enqueued_at) in zip(heads, pipe.execute()):
+            waited = now - float(enqueued_at or now)
+            scores[key] = float(expected or SCHED_DEFAULT_EXPECTED_S) - SCHED_AGING * waited
+        for key in sorted(scores, key=scores.get):
+            # Another worker may have taken the head meanwhile; then try the next lane
+            job_id = r_local.rpop(key)
+            if job_id:
+                return _popped(r_local, keys[key], job_id)
+
+    res = r_local.brpop(list(keys), timeout=timeout)
+    if not res:
+        return None
+    return _popped(r_local, keys[res[0]], res[1])
+
+
+def observe(r_local, duration: float, media: str, transcribe: bool, seconds: float):
+    """Fold a finished job's processing time into the rate for its class."""
+    if not duration or seconds <= 0:
+        return
+    field = _rate_field(media, transcribe)
+    sample = seconds / float(duration)
+    current = r_local.hget(RATES_KEY, field)
+    rate = sample if current is None else (1 - SCHED_RATE_ALPHA) * float(current) + SCHED_RATE_ALPHA * sample
+    r_local.hset(RATES_KEY, field, round(rate, 5))
+
+
+def drained(r_local, lane: str, expected: float):
+    """Record that a job left the queued workload (finished, failed or skipped)."""
+    key = f"{DRAINED_PREFIX}:{int(time.time() // 60)}"
+    pipe = r_local.pipeline(transaction=False)
+    pipe.hincrbyfloat(key, lane, expected)
+    pipe.hincrby(key, f"{lane}:jobs", 1)
+    pipe.expire(key, THROUGHPUT_WINDOW_S + 120)
+    pipe.execute()
+
+
+def start_heartbeat(redis_factory, slots: int = 1, interval: float = WORKER_TTL / 3):
+    """Keep this worker process's job slots counted as live (daemon thread, also during long jobs).
+
+    Returns a function that stops the heartbeat and drops the slots right away.
+    """
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    members = [worker_id] if slots == 1 else [f"{worker_id}:{i}" for i in range(slots)]
+    stopped = threading.Event()
+    r_hb = redis_factory()
+
+    def beat():
+        while not stopped.is_set():
+            try:
+                now = time.time()
+                r_hb.zadd(WORKERS_KEY, {m: now for m in members})
+            except Exception as e:
+                print(f"[WARN] Worker heartbeat failed: {e}")
+            stopped.wait(interval)
+
+    thread = threading.Thread(target=beat, name="scheduler-heartbeat", daemon=True)
+    thread.start()
+
+    def stop():
+        stopped.set()
+        thread.join(timeout=5)
+        try:
+            r_hb.zrem(WORKERS_KEY, *members)
+        except Exception as e:
+            print(f"[WARN] Failed to deregister worker slots: {e}")
+
+    return stop
+
+
+def stats(r_local) -> dict:
+    """Depth, queued work, recent throughput and expected wait per lane.
+
+    A lane's expected wait is the work queued in it and in every lane ahead of
+    it divided by the drain rate (aging is ignored).
+    """
+    now = time.time()
+    minute = int(now // 60)
+    minutes = range(minute - THROUGHPUT_WINDOW_S // 60 + 1, minute + 1)
+    tags = [""] + sorted(r_local.smembers(TAGS_KEY))
+    pipe = r_local.pipeline(transaction=False)
+    for lane in LANES:
+        for tag in tags:
+            pipe.llen(queue_key(lane, tag))
+    pipe.hgetall(BACKLOG_KEY)
+    pipe.zremrangebyscore(WORKERS_KEY, 0, now - WORKER_TTL)
+    pipe.zcard(WORKERS_KEY)
+    for m in minutes:
+        pipe.hgetall(f"{DRAINED_PREFIX}:{m}")
+    res = pipe.execute()
+    n = len(LANES) * len(tags)
+    lens, (backlog, _, workers), buckets = res[:n], res[n:n + 3], res[n + 3:]
+    by_tag = {lane: dict(zip(tags, lens[i * len(tags):(i + 1) * len(tags)])) for i, lane in enumerate(LANES)}
+    depths = [sum(by_tag[lane].values()) for lane in LANES]
+
+    drained_s = {lane: sum(float(b.get(lane) or 0) for b in buckets) for lane in LANES}
+    drained_jobs = sum(int(b.get(f"{lane}:jobs") or 0) for b in buckets for lane in LANES)
+    measured = sum(drained_s.values()) / THROUGHPUT_WINDOW_S
+    drain = measured if drained_jobs >= THROUGHPUT_MIN_JOBS and measured > 0 else max(1, workers)
+
+    result = {"workers": workers, "drain_s_per_s": round(drain, 3), "lanes": {}}
+    for lane, depth in zip(LANES, depths):
+        result["lanes"][lane] = {
+            "queue": LANE_KEYS[lane],
+            "depth": depth,
+            "backlog_s": round(max(0.0, float(backlog.get(lane) or 0)) if depth else 0.0, 1),
+            "throughput_s_per_s": round(drained_s[lane] / THROUGHPUT_WINDOW_S, 3),
+            "tagged": {tag: n for tag, n in by_tag[lane].items() if tag and n},
+        }
+    for lane in LANES:
+        result["lanes"][lane]["expected_wait_s"] = estimate(result, lane, 0)["expected_wait_s"]
+    return result
+
+
+def estimate(stats_result: dict, lane: str, expected: float, extra: dict | None = None) -> dict:
+    """Expected wait, start and finish time of a new job in `lane`.
+
+    `extra` adds expected seconds per lane not yet in the stats (jobs accepted
+    earlier in the same batch).
+    """
+    ahead = 0.0
+    for l in LANES:
+        ahead += stats_result["lanes"][l]["backlog_s"] + (extra or {}).get(l, 0)
+        if l == lane:
+            break
+    wait = ahead / max(stats_result["drain_s_per_s"], 0.001)
+    now = time.time()
+    return {
+        "expected_wait_s": round(wait, 1),
+        "estimated_start_at": int(now + wait),
+        "estimated_finish_at": int(now + wait + expected),
+    }
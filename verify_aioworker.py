@@ -0,0 +1,45 @@
+import time
+import asyncio
+import threading
+import unittest
+from types import SimpleNamespace
+
+import aioworker
+
+
+class TimeoutException(Exception):
+    pass
+
+
+class TestAsyncRuntime(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        w = SimpleNamespace(TimeoutException=TimeoutException)
+        self.job = aioworker.JobContext(aioworker.Runtime(w, self.loop), "job-1")
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def test_output_lines_and_exit_code(self):
+        lines = []
+        code = self.job.run(["sh", "-c", "printf '10%%\\r20%%\\ndone\\n'; exit 3"], on_line=lines.append)
+        self.assertEqual(code, 3)
+        self.assertEqual(lines, ["10%", "20%", "done"])
+        print("SUCCESS: Child output is streamed line by line, including \\r progress updates")
+
+    def test_deadline_kills_process_group(self):
+        started = time.monotonic()
+        with self.assertRaises(TimeoutException):
+            with self.job.deadline(1):
+                # the grandchild shares the process group and must die too
+                self.job.run(["sh", "-c", "sleep 30 & sleep 30"])
+        self.assertLess(time.monotonic() - started, 5)
+        print("SUCCESS: Job deadline kills the child process group")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+import archive
+
+
+class TestArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        archive.ARCHIVE_PATH = os.path.join(self.tmp.name, "history", "jobs.sqlite3")
+        archive._initialized = False
+        archive.ARCHIVE_DELAY_S = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_batch_moves_finished_jobs_into_archive(self):
+        mock_r = MagicMock()
+        mock_r.zrangebyscore.return_value = [("job1", 1700000000.0), ("gone", 1700000100.0)]
+        spec = json.dumps({"url": "https://www.youtube.com/watch?v=abc", "video_id": "abc", "db_id": "7"})
+        mock_r.pipeline.return_value.execute.side_effect = [
+            [{"status": "done", "finished_at": "1700000000"}, spec, json.dumps({"video_file": "http://minio/b/job1.mp4"}),
+             {}, None, None],
+            [],
+        ]
+
+        self.assertEqual(archive.archive_batch(mock_r), 1)
+
+        mock_r.pipeline.return_value.zrem.assert_called_once_with("jobs:finished", "job1", "gone")
+        job = archive.get("job1")
+        self.assertEqual(job["video_file"], "http://minio/b/job1.mp4")
+        self.assertEqual(job["url"], "https://www.youtube.com/watch?v=abc")
+        self.assertEqual(archive.query(db_id="7")["jobs"][0]["job_id"], "job1")
+        self.assertEqual(archive.get("gone"), {})
+        print("SUCCESS: Finished jobs are archived with their result and dropped from the pending set")
+
+    def test_query_pages_and_stats(self):
+        rows = [archive._row(f"job{i}", {"status": "error" if i == 3 else "done", "db_id": "1"}, 1700000000 + i * 3600)
+                for i in range(5)]
+        with archive._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+        page = archive.query(limit=2)
+        self.assertEqual([j["job_id"] for j in page["jobs"]], ["job4", "job3"])
+        rest = archive.query(limit=10, cursor=page["next_cursor"])
+        self.assertEqual([j["job_id"] for j in rest["jobs"]], ["job2", "job1", "job0"])
+        self.assertIsNone(rest["next_cursor"])
+        self.assertEqual(archive.query(since=1700000000 + 3600, until=1700000000 + 3 * 3600)["count"], 2)
+
+        stats = archive.stats(bucket_s=86400)
+        self.assertEqual(stats["totals"], {"done": 4, "error": 1})
+        print("SUCCESS: Archive queries are paginated by cursor and aggregated per period")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+sys.modules["faster_whisper"] = MagicMock()
+sys.modules["minio"] = MagicMock()
+
+with patch.dict("os.environ", {"REDIS_URL": "redis://mock:6379/0", "DOWNLOAD_DIR": "/tmp"}):
+    import worker
+
+
+class FakeWorkspace:
+    def __init__(self, path):
+        self.path = path
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    def files(self):
+        return sorted(os.listdir(self.path))
+
+    def size(self):
+        return sum(os.path.getsize(self.file(name)) for name in self.files())
+
+
+class TestAudioFirst(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.ws = FakeWorkspace(self.tmp.name)
+        self.ident = worker.identities.Identity("default")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def fake_audio_download(self, cmd, job_id, r_local, stage="downloading"):
+        self.assertEqual(cmd[cmd.index("-f") + 1], "bestaudio/best")
+        with open(cmd[cmd.index("-o") + 1].replace("%(ext)s", "m4a"), "wb") as f:
+            f.write(b"\0")
+        with open(self.ws.file("clip_audio.m4a.segments.json"), "w") as f:
+            f.write("[]")
+
+    @patch("worker.metrics")
+    def test_transcribes_while_the_video_downloads(self, mock_metrics):
+        mock_r = MagicMock()
+        mock_r.hget.return_value = "50.0"
+        started, release = threading.Event(), threading.Event()
+
+        def slow_transcribe(audio_path, job_id, r_local, lang=None, prompt=None, report_status=True, stop=None):
+            self.assertFalse(report_status)
+            started.set()
+            release.wait(5)
+            return "1\n00:00:00,000 --> 00:00:01,000\nhello\n"
+
+        with patch("worker.run_command_with_progress", side_effect=self.fake_audio_download), \
+             patch("worker._transcribe", side_effect=slow_transcribe):
+            early = worker._start_early_transcription("job1", mock_r, self.ident, {"fragments": 1, "chunk_size": ""},
+                                                      "https://youtu.be/abcdefghijk", self.ws, "clip")
+            # Transcription is under way before the video download would start
+            self.assertTrue(started.wait(5))
+            self.assertEqual(early.audio_path, self.ws.file("clip_audio.m4a"))
+            release.set()
+            self.assertIn("hello", early.result())
+
+        mock_r.hset.assert_any_call("job:job1", mapping={"status": "transcribing (50.0%)", "progress": "50.0"})
+
+    @patch("worker.metrics")
+    def test_early_audio_is_not_counted_as_resumed(self, mock_metrics):
+        mock_r = MagicMock()
+        with open(self.ws.file("clip.mp4.part"), "wb") as f:
+            f.write(b"\0" * 100)  # left by a previous attempt
+
+        def audio_first(*args, **kwargs):
+            with open(self.ws.file("clip_audio.m4a"), "wb") as f:
+                f.write(b"\0" * 1000)
+            return None
+
+        job = {"url": "https://youtu.be/abcdefghijk", "filename": "clip", "media": "video", "transcribe": "true"}
+        self.ws.root = self.tmp.name
+        with patch("worker.jobstore.get", return_value=job), \
+             patch("worker.probe.get_negative", return_value=None), \
+             patch("worker.probe.get_cached", return_value={"duration": 1200, "height": 1080}), \
+             patch("worker.probe.ineligible", return_value=None), \
+             patch("worker.disk.Workspace.open", return_value=self.ws), \
+             patch("worker.cluster.running_jobs", return_value=0), \
+             patch("worker.autoscale.load_per_cpu", return_value=0), \
+             patch("worker.AUDIO_FIRST_TRANSCRIBE", True), \
+             patch("worker._start_early_transcription", side_effect=audio_first), \
+             patch("worker.run_command_with_progress", side_effect=worker.JobInterrupted()):
+            with self.assertRaises(worker.JobInterrupted):
+                worker._execute_download("job1", mock_r, self.ident)
+
+        mock_r.hincrby.assert_called_once_with("job:job1", "resumed_bytes", 100)
+
+    def test_failed_audio_download_falls_back(self):
+        with patch("worker.run_command_with_progress", side_effect=Exception("Download failed: HTTP Error 404")), \
+             patch("worker.metrics"):
+            early = worker._start_early_transcription("job1", MagicMock(), self.ident, {"fragments": 1, "chunk_size": ""},
+                                                      "https://youtu.be/abcdefghijk", self.ws, "clip")
+        self.assertIsNone(early)
+
+    @patch("worker.metrics")
+    def test_stop_ends_transcription_at_next_segment(self, mock_metrics):
+        stopped = threading.Event()
+
+        def transcribe(audio_path, job_id, r_local, lang=None, prompt=None, report_status=True, stop=None):
+            stop.wait(5)
+            stopped.set()
+            raise worker.JobInterrupted()
+
+        with patch("worker._transcribe", side_effect=transcribe):
+            early = worker.EarlyTranscription(self.ws.file("clip_audio.m4a"), "job1", MagicMock())
+            early.stop()
+        self.assertTrue(stopped.is_set())
+        self.assertIsInstance(early.error, worker.JobInterrupted)
+
+
+if __name__ == "__main__":
+    unittest.main()
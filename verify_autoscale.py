@@ -0,0 +1,42 @@
+import unittest
+
+import autoscale
+
+CALM = {"load_per_cpu": 0.2, "mem_available": 8 * 1024 ** 3, "disk_free": 100 * 1024 ** 3}
+
+
+def queue(depth, wait):
+    lanes = {"short": {"depth": 0, "expected_wait_s": 0.0},
+             "default": {"depth": depth, "expected_wait_s": wait},
+             "long": {"depth": 0, "expected_wait_s": 0.0}}
+    return {"lanes": lanes}
+
+
+class TestAutoscale(unittest.TestCase):
+    def setUp(self):
+        self._limits = autoscale.WORKER_MIN, autoscale.WORKER_MAX
+        autoscale.WORKER_MIN, autoscale.WORKER_MAX = 1, 4
+
+    def tearDown(self):
+        autoscale.WORKER_MIN, autoscale.WORKER_MAX = self._limits
+
+    def test_scales_up_with_backlog(self):
+        self.assertEqual(autoscale.decide(2, queue(1, 3600), CALM, 0), (3, "wait"))
+        self.assertEqual(autoscale.decide(2, queue(5, 10), CALM, 0), (3, "queue"))
+        self.assertEqual(autoscale.decide(4, queue(50, 3600), CALM, 0), (4, None))
+        print("SUCCESS: Slots are added while jobs wait, up to WORKER_MAX")
+
+    def test_host_pressure_scales_down(self):
+        self.assertEqual(autoscale.decide(3, queue(50, 3600), dict(CALM, load_per_cpu=1.5), 0), (2, "cpu"))
+        self.assertEqual(autoscale.decide(3, queue(50, 3600), dict(CALM, mem_available=1024), 0), (2, "memory"))
+        self.assertEqual(autoscale.decide(1, queue(50, 3600), dict(CALM, disk_free=0), 0), (1, None))
+        print("SUCCESS: A saturated host sheds slots even with a backlog, down to WORKER_MIN")
+
+    def test_idle_scales_down(self):
+        self.assertEqual(autoscale.decide(3, queue(0, 0), CALM, 10), (3, None))
+        self.assertEqual(autoscale.decide(3, queue(0, 0), CALM, autoscale.AUTOSCALE_IDLE_S), (2, "idle"))
+        print("SUCCESS: Idle slots are released after AUTOSCALE_IDLE_S")
+
+
+if __name__ == "__main__":
+    unittest.main()
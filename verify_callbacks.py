@@ -0,0 +1,76 @@
+import sys
+import json
+import asyncio
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+import callbacks
+
+
+class TestCallbackOutbox(unittest.TestCase):
+    def setUp(self):
+        self.mock_r = MagicMock()
+        self.mock_r.hgetall.return_value = {
+            "status": "done",
+            "callback_url": "http://n8n:5678/webhook/abc",
+            "heartbeat": "1700000000",
+            "db_id": "1",
+        }
+        # jobstore.get: state hash, spec, result
+        self.mock_r.pipeline.return_value.execute.return_value = [self.mock_r.hgetall.return_value, None, None]
+
+    def test_terminal_job_is_queued_once(self):
+        self.mock_r.set.return_value = True
+        self.assertTrue(callbacks.enqueue_callback(self.mock_r, "job1"))
+
+        key, raw = self.mock_r.lpush.call_args.args
+        self.assertEqual(key, callbacks.CALLBACK_OUTBOX)
+        envelope = json.loads(raw)
+        self.assertEqual(envelope["payload"]["job_id"], "job1")
+        self.assertNotIn("heartbeat", envelope["payload"])
+
+        # Second report of the same terminal state is deduplicated
+        self.mock_r.lpush.reset_mock()
+        self.mock_r.set.return_value = None
+        self.assertFalse(callbacks.enqueue_callback(self.mock_r, "job1"))
+        self.mock_r.lpush.assert_not_called()
+        print("SUCCESS: Callback queued once per terminal state")
+
+    def test_non_terminal_status_not_queued(self):
+        self.mock_r.hgetall.return_value["status"] = "downloading (40.0%)"
+        self.assertFalse(callbacks.enqueue_callback(self.mock_r, "job1"))
+        self.mock_r.lpush.assert_not_called()
+
+    def test_retry_classification(self):
+        self.assertTrue(callbacks.is_retryable(None))
+        self.assertTrue(callbacks.is_retryable(503))
+        self.assertTrue(callbacks.is_retryable(429))
+        self.assertFalse(callbacks.is_retryable(404))
+        self.assertLessEqual(callbacks.next_delay(50), callbacks.CALLBACK_MAX_BACKOFF * 1.2)
+
+
+class TestDispatcher(unittest.TestCase):
+    @patch("callbacks.metrics")
+    def test_metrics_stay_off_the_event_loop(self, mock_metrics):
+        with patch.dict(sys.modules, {"redis.asyncio": MagicMock()}):
+            dispatcher = callbacks.Dispatcher("test")
+        dispatcher.r = AsyncMock()
+        dispatcher.client = AsyncMock()
+        dispatcher.client.post.return_value.status_code = 200
+        threads = []
+        mock_metrics.observe.side_effect = mock_metrics.inc.side_effect = lambda *a, **kw: threads.append(threading.get_ident())
+        envelope = {"job_id": "job1", "url": "http://n8n:5678/webhook/abc", "payload": {}, "attempt": 0}
+
+        asyncio.run(dispatcher.deliver(json.dumps(envelope)))
+
+        mock_metrics.inc.assert_called_once_with("yt_callbacks_total", result="delivered")
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+sys.modules["faster_whisper"] = MagicMock()
+sys.modules["minio"] = MagicMock()
+
+with patch.dict("os.environ", {"REDIS_URL": "redis://mock:6379/0", "DOWNLOAD_DIR": "/tmp"}):
+    import worker
+
+
+class TestCancel(unittest.TestCase):
+    @patch("worker._execute_download")
+    @patch("worker._trigger_callback")
+    def test_cancelled_job_is_not_started(self, mock_callback, mock_execute):
+        mock_r = MagicMock()
+        mock_r.hexists.return_value = True
+
+        self.assertFalse(worker._process_with_retries("job-1", mock_r))
+
+        mock_execute.assert_not_called()
+        mock_r.hset.assert_any_call("job:job-1", mapping={"status": "cancelled", "error": "Cancelled by request"})
+        mock_callback.assert_called_once_with("job-1", mock_r)
+        print("SUCCESS: A job cancelled before its attempt never starts and reports cancelled once")
+
+    @patch("worker._lease_identity")
+    @patch("worker._backoff_sleep")
+    @patch("worker._execute_download")
+    @patch("worker._trigger_callback")
+    def test_cancel_during_retry_backoff(self, mock_callback, mock_execute, mock_sleep, mock_lease):
+        mock_r = MagicMock()
+        mock_r.hexists.return_value = False
+        mock_execute.side_effect = Exception("HTTP Error 503")
+        mock_sleep.side_effect = worker.JobCancelled()
+
+        self.assertFalse(worker._process_with_retries("job-1", mock_r))
+
+        self.assertEqual(mock_execute.call_count, 1)
+        mock_r.hset.assert_any_call("job:job-1", mapping={"status": "cancelled", "error": "Cancelled by request"})
+        mock_callback.assert_called_once_with("job-1", mock_r)
+        print("SUCCESS: Cancelling a job waiting to retry stops it without another attempt")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+import clips
+
+SRT = """1
+00:04:58,000 --> 00:05:00,000
+sebelum potongan
+
+2
+00:05:00,000 --> 00:05:03,500
+sesudah potongan
+"""
+
+
+class TestClips(unittest.TestCase):
+    def test_sections_are_normalised(self):
+        ranges = clips.parse(["1:00:00-1:05:00", "10:00-15:00", "14:30-15:30.5"])
+        self.assertEqual(ranges, [(600, 930.5), (3600, 3900)])
+        self.assertEqual(clips.to_spec(ranges), "600-930.5,3600-3900")
+        self.assertEqual(clips.from_spec("600-930.5,3600-3900"), ranges)
+        self.assertEqual(clips.length(ranges), 630.5)
+        self.assertEqual(clips.args(ranges), ["--download-sections", "*600-930.5", "--download-sections", "*3600-3900",
+                                              "--force-keyframes-at-cuts"])
+
+        for bad in (["10:00"], ["15:00-10:00"], ["a-b"], ["1:2:3:4-5"]):
+            with self.assertRaises(ValueError):
+                clips.parse(bad)
+        self.assertIsNotNone(clips.beyond_end(ranges, 1800))
+        self.assertIsNone(clips.beyond_end(ranges, 3700))
+
+    def test_transcript_timestamps_follow_the_original_video(self):
+        ranges = clips.parse(["10:00-15:00", "1:00:00-1:05:00"])
+        shifted = clips.shift_srt(SRT, ranges)
+        self.assertIn("00:14:58,000 --> 00:15:00,000\nsebelum potongan", shifted)
+        self.assertIn("01:00:00,000 --> 01:00:03,500\nsesudah potongan", shifted)
+        self.assertEqual(clips.shift_srt(SRT, []), SRT)
+
+
+if __name__ == "__main__":
+    unittest.main()
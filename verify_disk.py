@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+TMP_DIR = tempfile.mkdtemp(prefix="verify-disk-")
+os.environ["DOWNLOAD_DIR"] = TMP_DIR
+
+import disk
+
+
+def make_workspace(job_id, size, age, state="finished"):
+    ws = disk.Workspace.open(job_id)
+    with open(ws.file(f"{job_id}.mp4"), "wb") as f:
+        f.write(b"\0" * size)
+    ws.add(ws.file(f"{job_id}.mp4"), "video")
+    ws.manifest["state"] = state
+    ws.save()
+    ws.manifest["updated_at"] = time.time() - age
+    with open(ws.manifest_path, "w") as f:
+        json.dump(ws.manifest, f)
+    return ws
+
+
+class TestDiskManager(unittest.TestCase):
+    def tearDown(self):
+        shutil.rmtree(disk.JOBS_DIR, ignore_errors=True)
+
+    def test_workspace_manifest_and_find(self):
+        ws = make_workspace("job-a", 10, 0)
+        found = disk.find("job-a")
+        self.assertEqual(found.path, ws.path)
+        self.assertEqual(found.manifest["artifacts"]["job-a.mp4"], {"kind": "video", "bytes": 10})
+        self.assertEqual(found.files(), ["job-a.mp4"])
+        print("SUCCESS: Workspace manifest records artifacts")
+
+    def test_sweep_evicts_by_age_then_lru(self):
+        make_workspace("old", 10000, 10000)
+        make_workspace("lru", 10000, 600)
+        make_workspace("recent", 10000, 10)
+        stats = disk.sweep(max_age=7200, quota_bytes=15000)
+        self.assertIsNone(disk.find("old"))
+        self.assertIsNone(disk.find("lru"))
+        self.assertIsNotNone(disk.find("recent"))
+        self.assertEqual(stats["evicted"], 2)
+        print("SUCCESS: Sweep evicts expired then least recently used workspaces")
+
+    def test_sweep_evicts_finished_before_parked(self):
+        make_workspace("parked", 10000, 900, state="parked")
+        make_workspace("finished", 10000, 10)
+        disk.sweep(max_age=7200, quota_bytes=15000)
+        self.assertIsNotNone(disk.find("parked"))
+        self.assertIsNone(disk.find("finished"))
+        print("SUCCESS: Partial downloads of parked jobs outlive finished workspaces")
+
+    def test_sweep_keeps_live_workspaces(self):
+        ws = make_workspace("live", 100, 10000, state="active")
+        self.assertTrue(ws.is_live())
+        disk.sweep(max_age=0, quota_bytes=1)
+        self.assertIsNotNone(disk.find("live"))
+        print("SUCCESS: Sweep never evicts a workspace owned by a live worker")
+
+
+class TestDiskReservations(unittest.TestCase):
+    def run_reserve(self, ledger, nbytes, free):
+        pipe = MagicMock()
+        pipe.hgetall.return_value = ledger
+        mock_r = MagicMock()
+        mock_r.transaction.side_effect = lambda func, *keys, **kw: func(pipe)
+        usage = MagicMock(total=100 * 1024 ** 3, free=free)
+        with patch("disk.shutil.disk_usage", return_value=usage):
+            return disk.reserve(mock_r, "job-new", nbytes), pipe
+
+    def test_outstanding_reservations_reduce_available_space(self):
+        other = json.dumps({"bytes": 6 * 1024 ** 3, "host": disk.HOSTNAME, "pid": os.getpid(), "at": time.time()})
+        free = disk.DISK_HEADROOM_BYTES + 10 * 1024 ** 3
+        (admitted, available), pipe = self.run_reserve({"job-other": other}, 5 * 1024 ** 3, free)
+        self.assertFalse(admitted)
+        self.assertEqual(available, 4 * 1024 ** 3)
+        pipe.hset.assert_not_called()
+        print("SUCCESS: Job deferred when other reservations use the free space")
+
+    def test_stale_reservations_are_dropped(self):
+        stale = json.dumps({"bytes": 6 * 1024 ** 3, "host": disk.HOSTNAME, "pid": 999999999, "at": time.time()})
+        free = disk.DISK_HEADROOM_BYTES + 10 * 1024 ** 3
+        (admitted, _), pipe = self.run_reserve({"job-dead": stale}, 5 * 1024 ** 3, free)
+        self.assertTrue(admitted)
+        pipe.hdel.assert_called_once_with(disk.DISK_LEDGER_KEY, "job-dead")
+        pipe.hset.assert_called_once()
+        print("SUCCESS: Reservations of dead workers are released")
+
+
+if __name__ == "__main__":
+    try:
+        unittest.main()
+    finally:
+        shutil.rmtree(TMP_DIR, ignore_errors=True)
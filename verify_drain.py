@@ -0,0 +1,86 @@
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+sys.modules["faster_whisper"] = MagicMock()
+sys.modules["minio"] = MagicMock()
+
+with patch.dict("os.environ", {"REDIS_URL": "redis://mock:6379/0", "DOWNLOAD_DIR": "/tmp"}):
+    import worker
+
+
+def job_fields(key, *fields):
+    values = {"enqueued_at": None, "lane": "long", "expected_s": "5000", "tag": "whisper:large-v3"}
+    return [values[f] for f in fields]
+
+
+class TestDrain(unittest.TestCase):
+    @patch("worker._lease_identity")
+    @patch("worker.scheduler.push")
+    @patch("worker.get_redis_connection")
+    @patch("worker._execute_download")
+    @patch("worker._trigger_callback")
+    def test_interrupted_job_goes_back_to_front_of_its_lane(self, mock_callback, mock_execute, mock_redis_conn, mock_push, mock_lease):
+        mock_r = MagicMock()
+        mock_r.hmget.side_effect = job_fields
+        mock_r.hget.return_value = "interrupted"
+        mock_r.hexists.return_value = False
+        mock_redis_conn.return_value = mock_r
+        mock_execute.side_effect = worker.JobInterrupted()
+
+        with self.assertRaises(worker.JobInterrupted):
+            worker.process_single_job("job-1")
+
+        mock_r.hset.assert_any_call("job:job-1", "status", "interrupted")
+        mock_push.assert_called_once_with(mock_r, "job-1", "long", 5000.0, front=True, tag="whisper:large-v3")
+        mock_callback.assert_not_called()
+        print("SUCCESS: Interrupted job is re-queued at the head of its lane without a callback")
+
+    def test_transcript_checkpoint_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            audio = os.path.join(tmp, "job.mp3")
+            with open(audio, "wb") as f:
+                f.write(b"\0" * 1000)
+            segments = [SimpleNamespace(start=0.0, end=4.2, text=" Halo"), SimpleNamespace(start=4.2, end=9.0, text=" dunia")]
+            worker._save_transcript_checkpoint(audio, segments)
+            loaded = worker._load_transcript_checkpoint(audio)
+            self.assertEqual([(s.start, s.end, s.text) for s in loaded], [(0.0, 4.2, " Halo"), (4.2, 9.0, " dunia")])
+
+            # A different audio file (e.g. re-extracted) invalidates the checkpoint
+            with open(audio, "ab") as f:
+                f.write(b"\0")
+            self.assertEqual(worker._load_transcript_checkpoint(audio), [])
+        print("SUCCESS: Transcript segments are checkpointed and only reused for the same audio")
+
+
+class TestWarmUp(unittest.TestCase):
+    @patch("worker.get_redis_connection")
+    @patch("worker.hostlimit.acquire")
+    @patch("worker.identities.release")
+    @patch("worker.identities.lease")
+    def test_warm_up_leases_an_identity_after_a_host_token(self, mock_lease, mock_release, mock_acquire, mock_redis_conn):
+        ident = worker.identities.Identity("acc1", cookies="/data/cookies/acc1.txt")
+        mock_lease.return_value = (ident, 0)
+        error = "ERROR: [youtube] jNQXAC9IVRw: HTTP Error 403: Forbidden"
+        with patch("worker.ytcache.warm_up", side_effect=Exception(error)) as mock_warm_up:
+            worker._warm_up_cache()
+
+        mock_acquire.assert_called_once_with(mock_redis_conn.return_value, worker.ytcache.YTDLP_WARMUP_URL)
+        mock_warm_up.assert_called_once_with(ident.args())
+        mock_release.assert_called_once_with(mock_redis_conn.return_value, ident, "warmup", error)
+
+        # No identity available: no warm-up
+        mock_lease.return_value = (None, 300)
+        with patch("worker.ytcache.warm_up") as mock_warm_up:
+            worker._warm_up_cache()
+        mock_warm_up.assert_not_called()
+        print("SUCCESS: The warm-up takes a host token and an identity lease like a job")
+
+
+if __name__ == "__main__":
+    unittest.main()
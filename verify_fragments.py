@@ -0,0 +1,41 @@
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+import fragments
+
+DASH_META = {"requested_formats": [{"format_id": "137", "protocol": "http_dash_segments"},
+                                   {"format_id": "140", "protocol": "https"}]}
+HTTPS_META = {"protocol": "https+https",
+              "formats": [{"format_id": "251", "protocol": "https", "abr": 130},
+                          {"format_id": "233", "protocol": "m3u8_native", "abr": 0}]}
+
+
+@patch.object(fragments, "FRAGMENTS_MAX", 8)
+@patch.object(fragments, "FRAGMENTS_HOST_BUDGET", 16)
+class TestFragments(unittest.TestCase):
+    def test_fragmented_formats_share_the_host_budget(self):
+        dl = fragments.choose(DASH_META, "video", running=1, load_per_cpu=0.2)
+        self.assertEqual(dl, {"protocol": "http_dash_segments+https", "fragments": 8, "chunk_size": ""})
+        self.assertEqual(fragments.args(dl), ["--concurrent-fragments", "8"])
+
+        self.assertEqual(fragments.choose(DASH_META, "video", running=4)["fragments"], 4)
+        # A loaded host halves the setting, never below one connection
+        self.assertEqual(fragments.choose(DASH_META, "video", running=4, load_per_cpu=9)["fragments"], 2)
+        self.assertEqual(fragments.choose(DASH_META, "video", running=32, load_per_cpu=9)["fragments"], 1)
+
+    def test_progressive_formats_use_chunked_requests(self):
+        dl = fragments.choose(HTTPS_META, "audio")
+        self.assertEqual(dl["protocol"], "https")
+        self.assertEqual(fragments.args(dl), ["--http-chunk-size", fragments.DOWNLOAD_CHUNK_SIZE])
+
+        # Without a probe the protocol is unknown: fragments only
+        dl = fragments.choose({}, "video")
+        self.assertEqual(fragments.args(dl), ["--concurrent-fragments", "8"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+import hostlimit
+
+
+@patch.object(hostlimit, "_token_bucket", None)
+class TestHostLimit(unittest.TestCase):
+    def test_hosts_share_one_bucket_per_site(self):
+        self.assertEqual(hostlimit.host("https://www.youtube.com/watch?v=abc"), "youtube.com")
+        self.assertEqual(hostlimit.host("https://m.youtube.com/watch?v=abc"), "youtube.com")
+        self.assertEqual(hostlimit.host("https://youtu.be/abc"), "youtube.com")
+        self.assertEqual(hostlimit.host("https://vimeo.com/123"), "vimeo.com")
+        self.assertEqual(hostlimit._parse({"rate": "30/minute", "burst": 3}), (0.5, 3))
+
+    @patch("hostlimit.metrics")
+    def test_acquire_sleeps_until_token_is_due(self, mock_metrics):
+        mock_r = MagicMock()
+        mock_r.register_script.return_value.return_value = 1500
+        sleep = MagicMock()
+
+        with patch.object(hostlimit, "LIMITS", {"youtube.com": (2.0, 4)}):
+            waited = hostlimit.acquire(mock_r, "https://www.youtube.com/watch?v=abc", sleep=sleep)
+
+        self.assertEqual(waited, 1.5)
+        sleep.assert_called_once_with(1.5)
+        mock_r.register_script.return_value.assert_called_once_with(keys=["hostlimit:youtube.com"], args=[0.002, 4, 1],
+                                                                    client=mock_r)
+
+        # Redis down: fail open
+        mock_r.register_script.return_value.side_effect = Exception("connection refused")
+        self.assertEqual(hostlimit.acquire(mock_r, "https://vimeo.com/1", sleep=sleep), 0)
+        # The script is registered once, not on every call
+        mock_r.register_script.assert_called_once_with(hostlimit.TOKEN_BUCKET_LUA)
+
+    @patch("hostlimit.metrics")
+    def test_max_wait_refunds_the_token(self, mock_metrics):
+        mock_r = MagicMock()
+        mock_r.register_script.return_value.return_value = 5000
+        sleep = MagicMock()
+
+        with self.assertRaises(hostlimit.HostBusy) as busy:
+            hostlimit.acquire(mock_r, "https://youtu.be/abc", sleep=sleep, max_wait=2)
+
+        self.assertEqual(busy.exception.wait, 5.0)
+        sleep.assert_not_called()
+        mock_r.hincrbyfloat.assert_called_once_with("hostlimit:youtube.com", "tokens", 1)
+
+        mock_r.register_script.return_value.return_value = 1000
+        self.assertEqual(hostlimit.acquire(mock_r, "https://youtu.be/abc", sleep=sleep, max_wait=2), 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
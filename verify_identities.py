@@ -0,0 +1,80 @@
+import sys
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+import identities
+
+
+def health_rows(*rows):
+    """Pipeline results of identities._health: (cooldown_until, runs, throttled) per identity."""
+    res = []
+    for cooldown_until, runs, throttled in rows:
+        res += [[cooldown_until, "0", None], 0, 0, [str(runs), str(throttled)], [None, None]]
+    return res
+
+
+class TestIdentities(unittest.TestCase):
+    def setUp(self):
+        pool = [identities.Identity("acc1", budget="10/hour"), identities.Identity("acc2"), identities.Identity("acc3")]
+        self.patches = [patch.object(identities, "POOL", pool),
+                        patch.object(identities, "BY_NAME", {i.name: i for i in pool}),
+                        patch.object(identities, "metrics")]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def test_lease_prefers_healthy_identity_within_budget(self):
+        mock_r = MagicMock()
+        # acc1 is healthy but out of budget, acc2 is cooling down, acc3 was throttled once in 4 runs
+        mock_r.pipeline.return_value.execute.return_value = health_rows(
+            (None, 10, 0), (str(time.time() + 600), 5, 5), (None, 4, 1))
+        mock_r.register_script.return_value.return_value = [0, 0, 120000]
+
+        ident, wait = identities.lease(mock_r, "job1")
+        self.assertEqual(ident.name, "acc3")
+        mock_r.zadd.assert_called_once()
+
+        # Nothing left: the caller is told how long to wait
+        mock_r.pipeline.return_value.execute.return_value = health_rows(
+            (None, 10, 0), (str(time.time() + 600), 5, 5), (str(time.time() + 300), 4, 1))
+        ident, wait = identities.lease(mock_r, "job2")
+        self.assertIsNone(ident)
+        self.assertEqual(wait, 120)
+
+    def test_throttled_attempt_starts_cooldown(self):
+        mock_r = MagicMock()
+        mock_r.hincrby.return_value = 2
+        ident = identities.BY_NAME["acc2"]
+
+        result = identities.release(mock_r, ident, "job1", "ERROR: [youtube] abc: HTTP Error 429: Too Many Requests")
+
+        self.assertEqual(result, "throttled")
+        mapping = mock_r.hset.call_args.kwargs["mapping"]
+        self.assertAlmostEqual(mapping["cooldown_until"], time.time() + 2 * identities.IDENTITY_COOLDOWN_S, delta=5)
+        self.assertEqual(identities.release(mock_r, ident, "job2", "Private video"), "error")
+        self.assertIn("--sleep-requests", ident.args())
+
+
+class TestDefaultIdentity(unittest.TestCase):
+    def test_single_identity_never_cools_down(self):
+        pool = [identities.Identity("default")]
+        mock_r = MagicMock()
+        with patch.object(identities, "POOL", pool), patch.object(identities, "BY_NAME", {"default": pool[0]}), \
+             patch.object(identities, "metrics"):
+            self.assertTrue(identities.single())
+            result = identities.release(mock_r, pool[0], "job1", "ERROR: [youtube] abc: HTTP Error 403: Forbidden")
+
+        self.assertEqual(result, "throttled")
+        mock_r.hincrby.assert_not_called()
+        mock_r.hset.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
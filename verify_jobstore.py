@@ -0,0 +1,55 @@
+import sys
+import json
+import unittest
+from unittest.mock import MagicMock
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+import jobstore
+
+
+class TestJobStore(unittest.TestCase):
+    def test_spec_leaves_out_defaults(self):
+        pipe = MagicMock()
+        jobstore.create(pipe, "job1", {
+            "url": "https://www.youtube.com/watch?v=abc",
+            "filename": "job1",
+            "media": "video",
+            "transcribe": "true",
+            "transcribe_prompt": "",
+        }, {"status": "queued"})
+
+        key, raw = pipe.set.call_args.args
+        self.assertEqual(key, "job:job1:spec")
+        self.assertEqual(json.loads(raw), {"url": "https://www.youtube.com/watch?v=abc", "transcribe": "true"})
+        pipe.hset.assert_called_once_with("job:job1", mapping={"status": "queued"})
+        print("SUCCESS: Job spec is stored without default values")
+
+    def test_get_merges_spec_result_and_state(self):
+        mock_r = MagicMock()
+        spec = json.dumps({"url": "https://www.youtube.com/watch?v=abc", "transcribe": "true"})
+        result = json.dumps({"video_file": "http://minio/b/job1.mp4", "subtitles": "{}"})
+        mock_r.pipeline.return_value.execute.return_value = [{"status": "done", "progress": "100"}, spec, result]
+
+        data = jobstore.get(mock_r, "job1")
+        self.assertEqual(data["status"], "done")
+        self.assertEqual(data["filename"], "job1")
+        self.assertEqual(data["media"], "video")
+        self.assertEqual(data["transcribe"], "true")
+        self.assertEqual(data["callback_url"], "")
+        self.assertEqual(data["video_file"], "http://minio/b/job1.mp4")
+        print("SUCCESS: Job reads back as one flat dict with defaults filled in")
+
+    def test_get_single_hash_and_missing_job(self):
+        mock_r = MagicMock()
+        legacy = {"status": "queued", "url": "https://www.youtube.com/watch?v=abc", "media": "audio"}
+        mock_r.pipeline.return_value.execute.return_value = [legacy, None, None]
+        self.assertEqual(jobstore.get(mock_r, "job1"), legacy)
+
+        mock_r.pipeline.return_value.execute.return_value = [{}, None, None]
+        self.assertEqual(jobstore.get(mock_r, "job1"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import glob
+import re
+import sys
+import unittest
+from unittest.mock import MagicMock
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+import metrics
+
+
+class TestPrometheusRender(unittest.TestCase):
+    def test_histogram_buckets_are_cumulative(self):
+        mock_r = MagicMock()
+
+        def hgetall(key):
+            if key == "metrics:hist:yt_stage_seconds":
+                return {
+                    "stage=download|le|1": "1",
+                    "stage=download|le|5": "2",
+                    "stage=download|sum": "9.5",
+                    "stage=download|count": "3",
+                }
+            if key == "metrics:counter:yt_jobs_total":
+                return {"status=done": "4"}
+            return {}
+
+        mock_r.hgetall.side_effect = hgetall
+        text = metrics.render(mock_r)
+
+        self.assertIn('yt_stage_seconds_bucket{stage="download",le="1"} 1', text)
+        self.assertIn('yt_stage_seconds_bucket{stage="download",le="5"} 3', text)
+        self.assertIn('yt_stage_seconds_bucket{stage="download",le="+Inf"} 3', text)
+        self.assertIn('yt_stage_seconds_count{stage="download"} 3', text)
+        self.assertIn('yt_jobs_total{status="done"} 4.0', text)
+        print("SUCCESS: Rendered cumulative histogram buckets")
+
+    def test_stage_timer_records_job_field(self):
+        mock_r = MagicMock()
+        with metrics.stage_timer(mock_r, "job123", "probe"):
+            pass
+        args = mock_r.hincrbyfloat.call_args.args
+        self.assertEqual(args[0], "job:job123")
+        self.assertEqual(args[1], "stage_probe_s")
+
+
+    def test_every_recorded_metric_is_registered(self):
+        used = set()
+        for path in glob.glob("*.py"):
+            with open(path, encoding="utf-8") as f:
+                used |= set(re.findall(r"metrics\.(?:inc|observe|timer|gauge_add|gauge_set)\(\s*\"(\w+)\"", f.read()))
+        registered = set(metrics.HISTOGRAMS) | set(metrics.COUNTERS) | set(metrics.GAUGES)
+        self.assertEqual(used - registered, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
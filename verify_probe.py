@@ -0,0 +1,63 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import probe
+
+
+class TestProbe(unittest.TestCase):
+    def test_eligibility_rules(self):
+        ok = {"duration": 1800, "live_status": "not_live", "webpage_url": "https://www.youtube.com/watch?v=abcdefghijk"}
+        self.assertIsNone(probe.ineligible(ok))
+        self.assertEqual(probe.ineligible(dict(ok, live_status="is_upcoming"))[0], "upcoming")
+        self.assertEqual(probe.ineligible(dict(ok, webpage_url="https://www.youtube.com/shorts/abcdefghijk"))[0], "short")
+        self.assertEqual(probe.ineligible(dict(ok, duration=300))[0], "duration")
+        print("SUCCESS: Live streams, Shorts and short videos are ineligible")
+
+    @patch("probe.run")
+    def test_lookup_many_probes_each_missing_video_once(self, mock_run):
+        cached = {"id": "aaaaaaaaaaa", "duration": 1200}
+        mock_r = MagicMock()
+        mock_r.mget.side_effect = lambda keys: [json.dumps(cached) if k == "meta:aaaaaaaaaaa" else None for k in keys]
+        mock_run.return_value = {"id": "bbbbbbbbbbb", "duration": 3000, "formats": []}
+        urls = ["https://youtu.be/aaaaaaaaaaa", "https://www.youtube.com/watch?v=bbbbbbbbbbb",
+                "https://youtu.be/bbbbbbbbbbb"]
+        found = probe.lookup_many(mock_r, urls)
+        self.assertEqual(found[urls[0]]["duration"], 1200)
+        self.assertEqual(found[urls[1]]["duration"], 3000)
+        self.assertEqual(found[urls[2]]["duration"], 3000)
+        mock_run.assert_called_once()
+        mock_r.set.assert_called_once()
+        print("SUCCESS: Cached videos are not probed and duplicate URLs share one probe")
+
+    @patch("probe.run")
+    def test_negative_cache_skips_probe(self, mock_run):
+        self.assertEqual(probe.error_class("ERROR: [youtube] abc: Private video. Sign in"), "private")
+        self.assertIsNone(probe.error_class("HTTP Error 403: Forbidden"))
+        dead = {"class": "removed", "error": "ERROR: Video unavailable", "at": 0}
+        mock_r = MagicMock()
+        mock_r.mget.side_effect = lambda keys: [json.dumps(dead) if k.startswith("negative:") else None for k in keys]
+        url = "https://youtu.be/ccccccccccc"
+        meta, rejected = probe.check_many(mock_r, [url])[url]
+        self.assertIsNone(meta)
+        self.assertEqual(rejected, ("removed", "ERROR: Video unavailable"))
+        mock_run.assert_not_called()
+        print("SUCCESS: Videos in the negative cache are rejected without a probe")
+
+
+    @patch("probe.run")
+    @patch("probe.hostlimit.acquire", side_effect=probe.hostlimit.HostBusy("youtube.com", 30))
+    def test_busy_host_leaves_probe_to_worker(self, mock_acquire, mock_run):
+        mock_r = MagicMock()
+        mock_r.mget.return_value = [None]
+        url = "https://youtu.be/ddddddddddd"
+        meta, rejected = probe.check_many(mock_r, [url])[url]
+        self.assertIsNone(meta)
+        self.assertIsNone(rejected)
+        mock_run.assert_not_called()
+        mock_r.set.assert_not_called()
+        print("SUCCESS: A busy host skips the enqueue probe instead of blocking")
+
+
+if __name__ == "__main__":
+    unittest.main()
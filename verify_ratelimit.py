@@ -0,0 +1,63 @@
+import sys
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+with patch.dict("os.environ", {"API_KEY_RATE_LIMITS": '{"ingest-key": {"enqueue": "600/minute"}}'}):
+    from ratelimit import RedisRateLimiter, parse_limit
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit("10/minute"), (10, 60))
+        self.assertEqual(parse_limit("5 per hour"), (5, 3600))
+        self.assertEqual(parse_limit("30/10 seconds"), (30, 10))
+        with self.assertRaises(ValueError):
+            parse_limit("ten a minute")
+
+    def test_identity_per_api_key_and_ip(self):
+        with patch.dict("os.environ", {"API_KEY_RATE_LIMITS": '{"ingest-key": {"enqueue": "600/minute"}}'}):
+            limiter = RedisRateLimiter(MagicMock())
+
+        keyed = MagicMock()
+        keyed.headers = {"x-api-key": "ingest-key"}
+        identity, limit = limiter.identify(keyed, "enqueue")
+        self.assertTrue(identity.startswith("key:"))
+        self.assertNotIn("ingest-key", identity)
+        self.assertEqual(limit, (600, 60))
+
+        # Unknown keys fall back to per-IP limits so random keys cannot bypass them
+        anon = MagicMock()
+        anon.headers = {"x-api-key": "made-up"}
+        anon.client.host = "10.0.0.7"
+        identity, limit = limiter.identify(anon, "enqueue")
+        self.assertEqual(identity, "ip:10.0.0.7")
+        self.assertEqual(limit, (10, 60))
+        print("SUCCESS: Rate limit identity resolved per API key and IP")
+
+    def test_hit_reports_retry_after(self):
+        mock_r = MagicMock()
+        limiter = RedisRateLimiter(mock_r)
+        limiter.script = MagicMock(return_value=[0, 0, 12500])
+        allowed, remaining, retry_after = limiter.hit("enqueue", "ip:1.2.3.4", (10, 60))
+        self.assertFalse(allowed)
+        self.assertEqual(retry_after, 13)
+
+    def test_batch_cost_is_charged(self):
+        limiter = RedisRateLimiter(MagicMock())
+        limiter.script = MagicMock(return_value=[1, 450, 0])
+        request = MagicMock()
+        request.headers = {}
+        request.client.host = "10.0.0.7"
+        response = MagicMock()
+        response.headers = {}
+        limiter.enforce(request, response, "enqueue_batch", cost=50)
+        self.assertEqual(limiter.script.call_args.kwargs["args"], [500, 60000, 50])
+        self.assertEqual(response.headers["X-RateLimit-Remaining"], "450")
+        print("SUCCESS: Batch requests are charged one unit per item")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+
+import scheduler
+
+
+def mock_redis(heads, jobs):
+    """Redis mock whose lanes have the given head job and job hashes."""
+    mock_r = MagicMock()
+    heads_pipe = MagicMock()
+    heads_pipe.execute.return_value = [heads.get(lane) for lane in scheduler.LANES]
+    jobs_pipe = MagicMock()
+    jobs_pipe.execute.side_effect = lambda: [jobs[h] for h in (heads.get(l) for l in scheduler.LANES) if h]
+    mock_r.pipeline.side_effect = [heads_pipe, jobs_pipe]
+    mock_r.rpop.side_effect = lambda key: next(h for l, h in heads.items() if scheduler.LANE_KEYS[l] == key)
+    mock_r.hget.return_value = "0"
+    mock_r.hincrbyfloat.return_value = 0.0
+    return mock_r
+
+
+class TestScheduler(unittest.TestCase):
+    def test_lane_classification(self):
+        mock_r = MagicMock()
+        mock_r.hget.return_value = None
+        self.assertEqual(scheduler.lane_for(scheduler.expected_seconds(mock_r, 300, "audio", False)), "short")
+        self.assertEqual(scheduler.lane_for(scheduler.expected_seconds(mock_r, 0, "video", False)), "default")
+        self.assertEqual(scheduler.lane_for(scheduler.expected_seconds(mock_r, 4 * 3600, "both", True)), "long")
+        print("SUCCESS: Jobs are classified into lanes by expected processing time")
+
+    def test_short_job_overtakes_long_job(self):
+        now = time.time()
+        heads = {"short": "job-short", "long": "job-long"}
+        jobs = {"job-short": ["60", str(now)], "job-long": ["5000", str(now - 60)]}
+        self.assertEqual(scheduler.pick(mock_redis(heads, jobs), 1), ("short", "job-short"))
+        print("SUCCESS: Shortest expected job is picked first")
+
+    def test_aging_prevents_starvation(self):
+        now = time.time()
+        heads = {"short": "job-short", "long": "job-long"}
+        jobs = {"job-short": ["60", str(now)], "job-long": ["5000", str(now - 6000)]}
+        self.assertEqual(scheduler.pick(mock_redis(heads, jobs), 1), ("long", "job-long"))
+        print("SUCCESS: Long job that waited long enough is picked before new short jobs")
+
+    def test_tagged_queues_only_served_by_matching_nodes(self):
+        mock_r = MagicMock()
+        heads_pipe = MagicMock()
+        # keys: untagged short/default/long, then whisper:large-v3 short/default/long
+        heads_pipe.execute.return_value = [None, None, None, None, "job-big", None]
+        jobs_pipe = MagicMock()
+        jobs_pipe.execute.return_value = [["60", str(time.time())]]
+        mock_r.pipeline.side_effect = [heads_pipe, jobs_pipe]
+        mock_r.rpop.return_value = "job-big"
+        mock_r.hget.return_value = "0"
+        mock_r.hincrbyfloat.return_value = 0.0
+        self.assertEqual(scheduler.pick(mock_r, 1, ("whisper:large-v3",)), ("default", "job-big"))
+        mock_r.rpop.assert_called_once_with("yt_queue@whisper:large-v3")
+
+        plain = MagicMock()
+        plain.pipeline.return_value.execute.return_value = [None, None, None]
+        plain.brpop.return_value = None
+        self.assertIsNone(scheduler.pick(plain, 1))
+        plain.brpop.assert_called_once_with(list(scheduler.LANE_KEYS.values()), timeout=1)
+        print("SUCCESS: Tagged jobs are only picked by nodes serving the tag")
+
+    def test_estimate_counts_lanes_ahead_and_batch_work(self):
+        lanes = {lane: {"backlog_s": b} for lane, b in zip(scheduler.LANES, (100.0, 400.0, 5000.0))}
+        stats = {"drain_s_per_s": 2.0, "lanes": lanes}
+        self.assertEqual(scheduler.estimate(stats, "short", 60)["expected_wait_s"], 50.0)
+        eta = scheduler.estimate(stats, "default", 600, extra={"short": 100.0})
+        self.assertEqual(eta["expected_wait_s"], 300.0)
+        self.assertEqual(eta["estimated_finish_at"] - eta["estimated_start_at"], 600)
+        print("SUCCESS: Wait estimate covers work queued ahead, including earlier batch items")
+
+
+if __name__ == "__main__":
+    unittest.main()
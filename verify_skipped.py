@@ -14,12 +14,14 @@ with patch.dict("os.environ", {"REDIS_URL": "redis://mock:6379/0", "DOWNLOAD_DIR
     from worker import process_single_job
 
 class TestSkippedStatus(unittest.TestCase):
+    @patch("worker._lease_identity")
     @patch("worker.get_redis_connection")
     @patch("worker._execute_download")
     @patch("worker._trigger_callback")
-    def test_members_only_error(self, mock_callback, mock_execute, mock_redis_conn):
+    def test_members_only_error(self, mock_callback, mock_execute, mock_redis_conn, mock_lease):
         # Setup mocks
         mock_r = MagicMock()
+        mock_r.hexists.return_value = False  # not cancelled
         mock_redis_conn.return_value = mock_r
         
         # Simulate fatal error in _execute_download
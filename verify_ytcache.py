@@ -0,0 +1,63 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+# Mock modules
+sys.modules["redis"] = MagicMock()
+
+import ytcache
+
+
+class TestYtCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        ytcache.YTDLP_CACHE_DIR = self.tmp.name
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cache_args_on_every_command(self):
+        self.assertEqual(ytcache.args(), ["--cache-dir", self.tmp.name])
+        ytcache.YTDLP_CACHE_DIR = ""
+        self.assertEqual(ytcache.args(), [])
+
+    @patch("ytcache.metrics")
+    def test_run_reports_hit_then_miss(self, mock_metrics):
+        section = os.path.join(self.tmp.name, "youtube-sigfuncs")
+        os.makedirs(section)
+
+        run = ytcache.Run()
+        run.feed("[youtube] abc: Downloading player 1234abcd-main")
+        run.feed("[youtube] [jsc:node] Solving JS challenges using node")
+        run.feed("[info] abc: Downloading 1 format(s): 251")
+        self.assertEqual(run.result(), "hit")
+
+        run = ytcache.Run()
+        run.feed("[youtube] [jsc:node] Solving JS challenges using node")
+        with open(os.path.join(section, "1234abcd-main-104.json"), "w") as f:
+            f.write("[]")
+        mock_r = MagicMock()
+        ytcache.record(mock_r, "job1", run)
+
+        mock_r.pipeline.return_value.hset.assert_called_once_with("job:job1", "ytdlp_cache", "miss")
+        mock_metrics.inc.assert_called_once_with("yt_ytdlp_cache_total", result="miss", source="job")
+
+        # Runs that solve no challenges are not reported
+        run = ytcache.Run()
+        run.feed("[download] 100% of 3.00MiB")
+        self.assertIsNone(run.result())
+
+    @patch("ytcache.subprocess.Popen")
+    def test_failed_warm_up_raises_the_error(self, mock_popen):
+        mock_popen.return_value.stdout = ["[youtube] jNQXAC9IVRw: Downloading webpage\n",
+                                          "ERROR: [youtube] jNQXAC9IVRw: HTTP Error 429: Too Many Requests\n"]
+        mock_popen.return_value.returncode = 1
+        with self.assertRaisesRegex(Exception, "HTTP Error 429"):
+            ytcache.warm_up(["--cookies", "/data/cookies/acc1.txt"])
+        self.assertIn("--cookies", mock_popen.call_args.args[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
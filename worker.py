@@ -1,4 +1,4 @@
-import os, time, subprocess, redis, signal, multiprocessing, json, sys
+import os, re, time, subprocess, redis, signal, multiprocessing, json, sys, threading
 print("[DEBUG] worker.py: imports done")
 sys.stdout.flush()
 
@@ -22,13 +22,30 @@ try:
     get_whisper_model = WhisperingModel
 except ImportError:
     get_whisper_model = lambda: None
+    WHISPER_MODEL_NAME = ""
     print("[WARN] faster-whisper package not found; transcription disabled")
 except Exception as e:
     get_whisper_model = lambda: None
+    WHISPER_MODEL_NAME = ""
     print(f"[ERROR] Failed to load Whisper model: {e}")
 from redis.exceptions import ConnectionError as RedisConnectionError
 from typing import Optional
 from contextlib import contextmanager
+from types import SimpleNamespace
+import metrics
+import callbacks
+import cancellation
+import clips
+import disk
+import fragments
+import hostlimit
+import identities
+import jobstore
+import probe
+import autoscale
+import cluster
+import scheduler
+import ytcache
 
 minio_client = None
 MINIO_BUCKET = None
@@ -97,9 +114,28 @@ AUTO_DELETE_LOCAL = os.getenv("AUTO_DELETE_LOCAL", "true").lower() == "true"
 
 # New configuration for retry and concurrency
 WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "3"))
+# "process": one job per worker process; "async": many jobs per process (aioworker.py)
+WORKER_MODE = os.getenv("WORKER_MODE", "process").lower()
 MAX_RETRIES = int(os.getenv("MAX_RETRIES", "3"))
 JOB_TIMEOUT = int(os.getenv("JOB_TIMEOUT", "7200"))  # 2 hours default
 RETRY_BACKOFF_BASE = int(os.getenv("RETRY_BACKOFF_BASE", "60"))  # 60 seconds
+# Run a callback dispatcher alongside the workers (disable when it runs as its own service)
+CALLBACK_DISPATCHER_EMBEDDED = os.getenv("CALLBACK_DISPATCHER_EMBEDDED", "true").lower() == "true"
+# BRPOP timeout: how long an idle worker blocks before it promotes delayed retries and checks
+# for a drain again. redis-py sets no socket timeout by default; a socket_timeout given in
+# REDIS_URL must stay above this, or a job popped just as the client gives up is lost
+QUEUE_POLL_TIMEOUT = 2
+# Capability tags whose queues this node's workers also serve (see cluster.py)
+NODE_TAGS = cluster.node_tags(WHISPER_MODEL_NAME)
+# Extra room on top of the estimated peak download size, and how often a job may wait for space
+DISK_ESTIMATE_MARGIN = float(os.getenv("DISK_ESTIMATE_MARGIN", "1.1"))
+DISK_MAX_DEFERRALS = int(os.getenv("DISK_MAX_DEFERRALS", "30"))
+# On SIGTERM, running jobs get this long to finish before they are checkpointed and re-queued
+DRAIN_GRACE_S = int(os.getenv("DRAIN_GRACE_S", "30"))
+# How long a child (yt-dlp, ffmpeg) gets to save its state after SIGINT before it is killed
+CHILD_STOP_TIMEOUT = 10
+# Video jobs with transcription fetch the audio stream first and transcribe it while the video downloads
+AUDIO_FIRST_TRANSCRIBE = os.getenv("AUDIO_FIRST_TRANSCRIBE", "true").lower() == "true"
 
 # Redundant init removed
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
@@ -121,9 +157,42 @@ class TimeoutException(Exception):
     pass
 
 
+class JobInterrupted(BaseException):
+    """Raised in a running job when the worker shuts down; the job goes back to its queue.
+
+    A BaseException so that the pipeline's `except Exception` blocks let it through.
+    """
+    pass
+
+
+class JobCancelled(BaseException):
+    """Raised in a running job cancelled through DELETE /jobs/{id}."""
+    pass
+
+
+# Async runtime state: the job handled by the current thread, and a shared client
+_local = threading.local()
+_shared_redis = None
+
+
+def _current_job():
+    """The aioworker.JobContext of the job running in this thread (None in process mode)."""
+    return getattr(_local, "job", None)
+
+
 @contextmanager
 def timeout_handler(seconds: int):
-    """Context manager for timeout protection using signal.alarm (Unix only)"""
+    """Context manager for timeout protection using signal.alarm (Unix only).
+
+    In async mode the job's deadline is a timer on the event loop instead,
+    which kills the job's child process groups.
+    """
+    job = _current_job()
+    if job is not None:
+        with job.deadline(seconds):
+            yield
+        return
+
     def _timeout_handler(signum, frame):
         raise TimeoutException(f"Job exceeded timeout of {seconds} seconds")
     
@@ -140,76 +209,127 @@ def timeout_handler(seconds: int):
 
 
 def get_redis_connection():
-    """Get a fresh Redis connection (for multiprocessing safety)"""
+    """Get a fresh Redis connection (for multiprocessing safety); async mode shares one client."""
+    if _shared_redis is not None:
+        return _shared_redis
     return redis.from_url(REDIS_URL, decode_responses=True)
 
 
-def run_subprocess_safe(cmd):
-    """Run a subprocess and ensure it is killed if an exception (like Timeout) occurs."""
-    print(f"[INFO] Running command: {' '.join(cmd)}")
-    proc = subprocess.Popen(cmd)
+def _stop_child(proc: subprocess.Popen, kill: bool = False):
+    """Interrupt a child so yt-dlp can save its download state, then kill it if it lingers.
+
+    `kill` skips the interrupt (the job was cancelled; its state is not needed).
+    """
+    if proc.poll() is not None:
+        return
+    if kill:
+        print(f"[WARN] Killing subprocess {proc.pid}")
+        proc.kill()
+        proc.wait()
+        return
+    print(f"[WARN] Stopping subprocess {proc.pid}")
+    proc.send_signal(signal.SIGINT)
     try:
+        proc.wait(timeout=CHILD_STOP_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        print(f"[WARN] Killing stuck subprocess {proc.pid}")
+        proc.kill()
         proc.wait()
-    except Exception:
-        if proc.poll() is None:
-            print(f"[WARN] Killing stuck subprocess {proc.pid}")
-            proc.kill()
+
+
+def run_subprocess_safe(cmd, cpu: bool = False):
+    """Run a subprocess and ensure it is killed if an exception (like Timeout) occurs.
+
+    `cpu` marks CPU-heavy commands (ffmpeg), which async mode runs in bounded slots.
+    """
+    print(f"[INFO] Running command: {' '.join(cmd)}")
+    job = _current_job()
+    if job is not None:
+        returncode = job.run(cmd, cpu=cpu)
+    else:
+        # Own session: a group-wide SIGTERM reaches only the worker, which decides how to stop the child
+        proc = subprocess.Popen(cmd, start_new_session=True)
+        try:
             proc.wait()
-        raise
-    if proc.returncode != 0:
-        raise subprocess.CalledProcessError(proc.returncode, cmd)
+        except BaseException as e:
+            _stop_child(proc, kill=isinstance(e, JobCancelled))
+            raise
+        returncode = proc.returncode
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+
+
+def _wait_for_host(r_local: redis.Redis, job_id: str, url: str):
+    """Take a token from the URL host's cluster-wide bucket; the wait adds to `stage_host_wait_s`."""
+    waited = hostlimit.acquire(r_local, url, sleep=_backoff_sleep)
+    if waited:
+        r_local.hincrbyfloat(f"job:{job_id}", "stage_host_wait_s", round(waited, 3))
+
 
 def run_command_with_progress(cmd, job_id, r_local, stage="downloading"):
     """Run a command and parse yt-dlp progress output."""
     import re
     print(f"[INFO] Running command: {' '.join(cmd)}")
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1)
     
     percent_re = re.compile(r"(\d+(?:\.\d+)?)%")
     error_lines = []
-
-    try:
-        for line in proc.stdout:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # Look for percentage in yt-dlp output
-            match = percent_re.search(line)
-            if match:
-                percent_str = match.group(1)
-                try:
-                    # Ensure it's a valid number between 0 and 100
-                    percent = float(percent_str)
-                    if 0 <= percent <= 100:
-                        print(f"[{stage.upper()} PROGRESS] {percent_str}%")
-                        r_local.hset(f"job:{job_id}", mapping={
-                            "status": f"{stage} ({percent_str}%)",
-                            "progress": percent_str,
-                            "heartbeat": int(time.time())
-                        })
-                except ValueError:
-                    pass
-            else:
-                # Log non-progress lines for debugging (errors, info, etc)
-                print(f"[YTDLP] {line}")
-                if "ERROR:" in line:
-                    error_lines.append(line)
-                sys.stdout.flush()
-
-        proc.wait()
-    except Exception:
-        if proc.poll() is None:
-            print(f"[WARN] Killing stuck subprocess {proc.pid}")
-            proc.kill()
+    cache_run = None
+    if cmd[0] == "yt-dlp":
+        _wait_for_host(r_local, job_id, cmd[-1])
+        cache_run = ytcache.Run()
+
+    def handle(line):
+        line = line.strip()
+        if not line:
+            return
+        if cache_run is not None:
+            cache_run.feed(line)
+        
+        # Look for percentage in yt-dlp output
+        match = percent_re.search(line)
+        if match:
+            percent_str = match.group(1)
+            try:
+                # Ensure it's a valid number between 0 and 100
+                percent = float(percent_str)
+                if 0 <= percent <= 100:
+                    print(f"[{stage.upper()} PROGRESS] {percent_str}%")
+                    r_local.hset(f"job:{job_id}", mapping={
+                        "status": f"{stage} ({percent_str}%)",
+                        "progress": percent_str,
+                        "heartbeat": int(time.time())
+                    })
+            except ValueError:
+                pass
+        else:
+            # Log non-progress lines for debugging (errors, info, etc)
+            print(f"[YTDLP] {line}")
+            if "ERROR:" in line:
+                error_lines.append(line)
+            sys.stdout.flush()
+
+    job = _current_job()
+    if job is not None:
+        returncode = job.run(cmd, on_line=handle)
+    else:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1,
+                                start_new_session=True)
+        try:
+            for line in proc.stdout:
+                handle(line)
             proc.wait()
-        raise
+        except BaseException as e:
+            _stop_child(proc, kill=isinstance(e, JobCancelled))
+            raise
+        returncode = proc.returncode
 
-    if proc.returncode != 0:
-        print(f"[ERROR] Command failed with return code {proc.returncode}")
+    if returncode != 0:
+        print(f"[ERROR] Command failed with return code {returncode}")
         if error_lines:
             raise Exception(f"Download failed: {'; '.join(error_lines)}")
-        raise subprocess.CalledProcessError(proc.returncode, cmd)
+        raise subprocess.CalledProcessError(returncode, cmd)
+    if cache_run is not None:
+        ytcache.record(r_local, job_id, cache_run)
     return True
 
 
@@ -233,15 +353,58 @@ def _to_srt(segments) -> str:
     return "\n".join(srt)
 
 
-def _transcribe_audio(audio_path: str, job_id: str, r_local: redis.Redis, lang: str = None, prompt: str = None) -> Optional[str]:
-    """Transcribe audio file using Faster-Whisper and return content in SRT format."""
+def _load_transcript_checkpoint(audio_path: str) -> list:
+    """Segments transcribed by an interrupted earlier attempt on the same audio file."""
+    try:
+        with open(f"{audio_path}.segments.json", encoding="utf-8") as f:
+            ckpt = json.load(f)
+        if ckpt.get("audio_bytes") != os.path.getsize(audio_path):
+            return []
+        return [SimpleNamespace(start=s, end=e, text=t) for s, e, t in ckpt["segments"]]
+    except (OSError, ValueError, KeyError):
+        return []
+
+
+def _save_transcript_checkpoint(audio_path: str, segments: list):
+    """Persist the segments transcribed so far next to the audio (in the job's workspace)."""
+    if not segments:
+        return
+    path = f"{audio_path}.segments.json"
+    try:
+        with open(path + ".part", "w", encoding="utf-8") as f:
+            json.dump({"audio_bytes": os.path.getsize(audio_path),
+                       "segments": [[seg.start, seg.end, seg.text] for seg in segments]}, f)
+        os.replace(path + ".part", path)
+    except OSError as e:
+        print(f"[WARN] Failed to checkpoint transcript: {e}")
+
+
+def _transcribe_audio(audio_path: str, job_id: str, r_local: redis.Redis, lang: str = None, prompt: str = None,
+                      report_status: bool = True, stop: threading.Event = None) -> Optional[str]:
+    """Transcribe audio file using Faster-Whisper and return content in SRT format.
+
+    Segments are checkpointed next to the audio every 10 seconds and when the
+    job is interrupted; a later attempt transcribes only the rest of the audio.
+    Without `report_status` progress goes to `transcribe_progress` instead of
+    the job status; setting `stop` ends the transcription at the next segment.
+    """
     model = get_whisper_model()
     if not model or not os.path.exists(audio_path):
         return None
+    srt_segments = _load_transcript_checkpoint(audio_path)
+    offset = srt_segments[-1].end if srt_segments else 0.0
+    source = audio_path
     try:
-        print(f"[INFO] Transcribing {audio_path} (lang={lang})...")
+        if offset:
+            print(f"[INFO] Resuming transcription at {offset:.1f}s with {len(srt_segments)} checkpointed segments")
+            # .part keeps the trimmed copy out of the pipeline's output file detection
+            source = f"{audio_path}.rest.part"
+            run_subprocess_safe(["ffmpeg", "-y", "-v", "error", "-ss", str(offset), "-i", audio_path,
+                                 "-ac", "1", "-ar", "16000", "-f", "wav", source])
+        print(f"[INFO] Transcribing {source} (lang={lang})...")
+        started = time.monotonic()
         segments, info = model.transcribe(
-            audio_path, 
+            source, 
             language=lang, 
             initial_prompt=prompt, 
             beam_size=1,            # Faster on CPU
@@ -256,75 +419,263 @@ def _transcribe_audio(audio_path: str, job_id: str, r_local: redis.Redis, lang:
         print(f"[INFO] Audio duration: {duration:.2f}s (after VAD: {duration_after_vad:.2f}s)")
         print(f"[INFO] Detected language: {info.language} ({info.language_probability:.2f})")
         
-        srt_segments = []
         last_update = time.time()
         
         # Iterate through segments to provide progress updates
-        for i, seg in enumerate(segments, 1):
-            srt_segments.append(seg)
-            
-            # Detailed per-segment logging for debugging stalls
-            print(f"[TRANSCRIPTION-SEGMENT] {seg.start:.1f}s - {seg.end:.1f}s: {seg.text.strip()}")
-            
-            # Update Redis status every 10 seconds with progress and heartbeat
-            now = time.time()
-            if now - last_update > 10:
-                progress = (seg.end / duration * 100) if duration > 0 else 0
-                progress_str = f"{progress:.1f}"
-                print(f"[TRANSCRIBING PROGRESS] {progress_str}%")
-                r_local.hset(f"job:{job_id}", mapping={
-                    "status": f"transcribing ({progress_str}%)",
-                    "progress": progress_str,
-                    "heartbeat": int(now)
-                })
-                last_update = now
+        try:
+            for seg in segments:
+                seg = SimpleNamespace(start=seg.start + offset, end=seg.end + offset, text=seg.text)
+                srt_segments.append(seg)
+                if stop is not None and stop.is_set():
+                    raise JobInterrupted()
+                
+                # Detailed per-segment logging for debugging stalls
+                print(f"[TRANSCRIPTION-SEGMENT] {seg.start:.1f}s - {seg.end:.1f}s: {seg.text.strip()}")
+                
+                # Update Redis status every 10 seconds with progress and heartbeat
+                now = time.time()
+                if now - last_update > 10:
+                    progress = (seg.end / (duration + offset) * 100) if duration > 0 else 0
+                    progress_str = f"{progress:.1f}"
+                    print(f"[TRANSCRIBING PROGRESS] {progress_str}%")
+                    if report_status:
+                        r_local.hset(f"job:{job_id}", mapping={
+                            "status": f"transcribing ({progress_str}%)",
+                            "progress": progress_str,
+                            "heartbeat": int(now)
+                        })
+                    else:
+                        r_local.hset(f"job:{job_id}", mapping={"transcribe_progress": progress_str, "heartbeat": int(now)})
+                    _save_transcript_checkpoint(audio_path, srt_segments)
+                    last_update = now
+                    # Also stops a transcription running in the async runtime's process pool
+                    if cancellation.requested(r_local, job_id):
+                        raise JobCancelled()
+        except BaseException:
+            _save_transcript_checkpoint(audio_path, srt_segments)
+            raise
                 
         if not srt_segments:
             print("[WARN] No segments found during transcription")
             return None
-            
+
+        if duration > 0:
+            rtf = (time.monotonic() - started) / duration
+            print(f"[INFO] Whisper real-time factor: {rtf:.3f}")
+            r_local.hset(f"job:{job_id}", "whisper_rtf", f"{rtf:.3f}")
+            metrics.observe("yt_whisper_realtime_factor", rtf)
+
+        if os.path.exists(f"{audio_path}.segments.json"):
+            os.remove(f"{audio_path}.segments.json")
         return _to_srt(srt_segments)
     except Exception as e:
         print(f"[ERROR] Transcription failed: {e}")
         return None
+    finally:
+        if source != audio_path and os.path.exists(source):
+            os.remove(source)
+
+
+def _transcribe(audio_path: str, job_id: str, r_local: redis.Redis, lang: str = None, prompt: str = None,
+                report_status: bool = True, stop: threading.Event = None) -> Optional[str]:
+    """Transcribe here, or in the async runtime's CPU process pool (where `stop` does not reach)."""
+    job = _current_job()
+    if job is not None:
+        return job.run_cpu(_transcribe_in_child, audio_path, job_id, lang, prompt, report_status)
+    return _transcribe_audio(audio_path, job_id, r_local, lang=lang, prompt=prompt, report_status=report_status, stop=stop)
+
+
+def _transcribe_in_child(audio_path: str, job_id: str, lang: str = None, prompt: str = None,
+                         report_status: bool = True) -> Optional[str]:
+    return _transcribe_audio(audio_path, job_id, get_redis_connection(), lang=lang, prompt=prompt,
+                             report_status=report_status)
+
+
+class EarlyTranscription:
+    """Whisper on a job's audio stream in a background thread, while the job downloads its video.
+
+    Progress goes to `transcribe_progress` so it does not overwrite the download's
+    status. `stop()` ends the transcription at its next segment, checkpointed for
+    the next attempt; in the async runtime the pool task runs on and its result
+    is discarded, like any task that outlives its job.
+    """
+
+    def __init__(self, audio_path: str, job_id: str, r_local: redis.Redis, lang: str = None, prompt: str = None):
+        self.audio_path = audio_path
+        self.job_id = job_id
+        self.r_local = r_local
+        self.text = None
+        self.error = None
+        self._stop = threading.Event()
+        self._job = _current_job()
+        self._thread = threading.Thread(target=self._run, args=(lang, prompt), name=f"transcribe-{job_id}", daemon=True)
+        self._thread.start()
+
+    def _run(self, lang, prompt):
+        _local.job = self._job
+        try:
+            with metrics.stage_timer(self.r_local, self.job_id, "transcribe"):
+                self.text = _transcribe(self.audio_path, self.job_id, self.r_local, lang=lang, prompt=prompt,
+                                        report_status=False, stop=self._stop)
+        except BaseException as e:
+            self.error = e
+
+    def result(self) -> Optional[str]:
+        """Wait for the transcript; time spent waiting goes to `stage_transcribe_wait_s`."""
+        started = time.monotonic()
+        while self._thread.is_alive():
+            progress = self.r_local.hget(f"job:{self.job_id}", "transcribe_progress") or "0"
+            self.r_local.hset(f"job:{self.job_id}", mapping={"status": f"transcribing ({progress}%)", "progress": progress})
+            self._thread.join(10)
+        waited = time.monotonic() - started
+        if waited >= 0.01:
+            self.r_local.hincrbyfloat(f"job:{self.job_id}", "stage_transcribe_wait_s", round(waited, 3))
+        if self.error is not None:
+            raise self.error
+        return self.text
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(CHILD_STOP_TIMEOUT)
+
+
+def _start_early_transcription(job_id: str, r_local: redis.Redis, ident: identities.Identity, dl: dict,
+                               url: str, ws: "disk.Workspace", filename: str, sections: list = (),
+                               lang: str = None, prompt: str = None) -> Optional[EarlyTranscription]:
+    """Download the audio stream alone (of the clip `sections`, if any) and start transcribing it.
+
+    The stream is named `<filename>_audio.<ext>`, outside the output file detection.
+    Returns None if the download fails.
+    """
+    name = f"{filename}_audio"
+    cmd = [
+        "yt-dlp",
+        *ytcache.args(),
+        "--socket-timeout", "30",
+        *ident.args(),
+        "--geo-bypass",
+        *fragments.args(dl),
+        *clips.args(sections),
+        "-f", "bestaudio/best",
+        "-o", ws.file(f"{name}{clips.OUTTMPL_SUFFIX if sections else ''}.%(ext)s"),
+        "--",
+        url
+    ]
+    try:
+        with metrics.stage_timer(r_local, job_id, "download"):
+            run_command_with_progress(cmd, job_id, r_local, stage="downloading audio")
+        if sections:
+            _join_sections(ws, name, r_local, job_id)
+    except TimeoutException:
+        raise
+    except Exception as e:
+        print(f"[WARN] Audio-first download failed, transcribing after the video: {e}")
+        return None
+    audio_path = next((ws.file(f) for f in ws.files()
+                       if f.startswith(f"{name}.") and not f.endswith((".part", ".ytdl", ".json"))), None)
+    if not audio_path:
+        print(f"[WARN] Audio stream for {job_id} not found; transcribing after the video")
+        return None
+    print(f"[INFO] Transcribing {audio_path} while the video downloads")
+    return EarlyTranscription(audio_path, job_id, r_local, lang=lang, prompt=prompt)
 
 
 def _trigger_callback(job_id: str, r_local: redis.Redis):
-    """Fetch job data and POST it to callback_url if present."""
-    import httpx
+    """Queue the job's callback in the outbox; the dispatcher POSTs it to callback_url."""
     try:
-        data = r_local.hgetall(f"job:{job_id}")
-        callback_url = data.get("callback_url")
-        if not callback_url:
-            return
-
-        print(f"[CALLBACK] Triggering for job {job_id} to {callback_url}")
-        
-        # Prepare payload: include job_id, exclude heartbeat
-        payload = data.copy()
-        payload["job_id"] = job_id
-        if "heartbeat" in payload:
-            del payload["heartbeat"]
-
-        print(f"[CALLBACK] Body: {json.dumps(payload)}")
-        sys.stdout.flush()
-
-        with httpx.Client(timeout=30.0) as client:
-            resp = client.post(callback_url, json=payload)
-            print(f"[CALLBACK] Status: {resp.status_code}")
-            if resp.status_code >= 400:
-                print(f"[CALLBACK] Response Body: {resp.text}")
+        callbacks.enqueue_callback(r_local, job_id)
     except Exception as e:
         print(f"[CALLBACK] Error: {e}")
 
 
-def _upload_file_to_minio(file_path: str, bucket_name: str) -> str:
+def _fput_object(bucket_name: str, obj_name: str, file_path: str, r_local: redis.Redis = None, job_id: str = None):
+    """fput_object wrapper that records upload latency and bytes (and the job's upload stage time)."""
+    started = time.monotonic()
+    with metrics.timer("yt_minio_upload_seconds"):
+        minio_client.fput_object(bucket_name, obj_name, file_path)
+    if r_local is not None and job_id:
+        elapsed = time.monotonic() - started
+        r_local.hincrbyfloat(f"job:{job_id}", "stage_upload_s", round(elapsed, 3))
+        metrics.observe("yt_stage_seconds", elapsed, stage="upload")
+    metrics.inc("yt_minio_upload_bytes_total", os.path.getsize(file_path))
+
+
+def _format_bytes(fmt: dict, duration: float) -> int:
+    """Size of a single yt-dlp format, estimated from its bitrate if the size is not reported."""
+    size = fmt.get("filesize") or fmt.get("filesize_approx")
+    if not size and fmt.get("tbr") and duration:
+        size = fmt["tbr"] * 125 * duration
+    return int(size or 0)
+
+
+def _estimate_peak_bytes(meta: dict, media: str) -> int:
+    """Estimate the most bytes a job holds on disk at once, from probed format sizes (0 if unknown).
+
+    A merged download keeps the video and audio streams plus the merged file until
+    the merge finishes; audio extraction keeps the source next to the converted file.
+    """
+    duration = meta.get("duration") or 0
+    requested = meta.get("requested_formats") or ([meta] if meta.get("format_id") else [])
+    streams = sum(_format_bytes(f, duration) for f in requested)
+    audio_formats = [f for f in (meta.get("formats") or requested) if f.get("vcodec") == "none"]
+    best_audio = max((_format_bytes(f, duration) for f in audio_formats), default=0)
+
+    if media == "audio":
+        return 2 * best_audio
+    if media == "both":
+        return 2 * streams + (best_audio or streams // 10)
+    return 2 * streams
+
+
+def _record_resume(ws: "disk.Workspace", r_local: redis.Redis, job_id: str) -> int:
+    """Record the bytes a previous attempt left in the workspace; yt-dlp continues from them."""
+    resumed = ws.size()
+    if resumed:
+        print(f"[INFO] Resuming job {job_id} with {resumed} bytes from a previous attempt")
+        r_local.hincrby(f"job:{job_id}", "resumed_bytes", resumed)
+        metrics.inc("yt_download_resumed_bytes_total", resumed)
+    return resumed
+
+
+def _join_sections(ws: "disk.Workspace", name: str, r_local: redis.Redis, job_id: str) -> Optional[str]:
+    """Concatenate the per-range files of a clip download (`<name>.sNNNNNN.<ext>`) into `<name>.<ext>`."""
+    piece_re = re.compile(re.escape(name) + r"\.s(\d{6,})\.(\w+)")
+    pieces = sorted((m for m in map(piece_re.fullmatch, ws.files()) if m), key=lambda m: int(m.group(1)))
+    if not pieces:
+        return None
+    output = ws.file(f"{name}.{pieces[0].group(2)}")
+    paths = [ws.file(m.group(0)) for m in pieces]
+    if len(paths) == 1:
+        os.replace(paths[0], output)
+        return output
+    list_path = ws.file(f"{name}.sections.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.writelines(f"file '{p}'\n" for p in paths)
+    with metrics.stage_timer(r_local, job_id, "ffmpeg"):
+        run_subprocess_safe(["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_path,
+                             "-c", "copy", output])
+    for p in paths + [list_path]:
+        os.remove(p)
+    return output
+
+
+def _download_throughput(r_local: redis.Redis, job_id: str, paths, seconds: float, resumed: int = 0, dl: dict | None = None):
+    """Record achieved download bytes/sec for the files produced by a download stage, per fragment setting."""
+    total = sum(os.path.getsize(p) for p in paths if p and os.path.exists(p)) - resumed
+    if total <= 0 or seconds <= 0:
+        return
+    bps = total / seconds
+    r_local.hset(f"job:{job_id}", mapping={"download_bytes": total, "download_bps": int(bps)})
+    metrics.observe("yt_download_bytes_per_second", bps, fragments=str((dl or {}).get("fragments", 1)))
+
+
+def _upload_file_to_minio(file_path: str, bucket_name: str, r_local: redis.Redis = None, job_id: str = None) -> str:
     """Upload a file to MinIO and return its public URL."""
     if not minio_client or not os.path.exists(file_path):
         return ""
     try:
         obj_name = os.path.basename(file_path)
-        minio_client.fput_object(bucket_name, obj_name, file_path)
+        _fput_object(bucket_name, obj_name, file_path, r_local, job_id)
         url = f"{MINIO_PUBLIC_BASE_URL}/{obj_name}" if MINIO_PUBLIC_BASE_URL else ""
         print(f"[INFO] Uploaded {obj_name} to MinIO: {url}")
         return url
@@ -339,25 +690,153 @@ def process_single_job(job_id: str) -> bool:
     Returns True if successful, False otherwise.
     """
     r_local = get_redis_connection()
-    
+    started = time.time()
+    lane, expected = None, None
+    try:
+        with metrics.timer("yt_redis_latency_seconds", op="hset"):
+            r_local.hset(f"job:{job_id}", "started_at", int(started))
+        enqueued_at, lane, expected = r_local.hmget(f"job:{job_id}", "enqueued_at", "lane", "expected_s")
+        if enqueued_at:
+            metrics.observe("yt_queue_wait_seconds", max(0.0, started - float(enqueued_at)), lane=lane or "default")
+        cluster.job_started(r_local, job_id)
+    except Exception as e:
+        print(f"[WARN] Failed to record start of job {job_id}: {e}")
+    metrics.gauge_add("yt_jobs_in_progress", 1)
+
+    try:
+        return _process_with_retries(job_id, r_local)
+    finally:
+        # Parks the workspace of an interrupted job before it is re-queued below
+        _finish_workspace(job_id, r_local)
+        metrics.gauge_add("yt_jobs_in_progress", -1)
+        finished = time.time()
+        try:
+            status = r_local.hget(f"job:{job_id}", "status") or "unknown"
+            if status != "interrupted":
+                r_local.hset(f"job:{job_id}", "finished_at", int(finished))
+            if status in callbacks.TERMINAL_STATUSES:
+                jobstore.finish(r_local, job_id)
+        except Exception:
+            status = "unknown"
+        metrics.observe("yt_job_seconds", finished - started, status=status)
+        metrics.inc("yt_jobs_total", status=status)
+        if status == "done":
+            _observe_job_rate(r_local, job_id, finished - started)
+        # Deferred and interrupted jobs go back to a queue; everything else drained the backlog
+        requeued = status in ("deferred", "interrupted")
+        try:
+            if status == "interrupted":
+                _requeue_front(r_local, job_id)
+            elif not requeued:
+                scheduler.drained(r_local, lane or "default", float(expected or 0))
+            # Only now leave the node's in-flight jobs, so a failed re-queue is recovered as an orphan
+            cluster.job_finished(r_local, job_id, None if requeued else float(expected or 0))
+        except Exception as e:
+            print(f"[WARN] Failed to record throughput for {job_id}: {e}")
+
+
+def _observe_job_rate(r_local: redis.Redis, job_id: str, seconds: float):
+    """Feed the scheduler's expected-time model with a finished job."""
+    try:
+        data = jobstore.get(r_local, job_id)
+        duration = max(float(data.get("video_duration") or 0), float(data.get("audio_duration") or 0))
+        transcribe = data.get("transcribe", "false").lower() == "true"
+        scheduler.observe(r_local, duration, data.get("media", "video"), transcribe, seconds)
+    except Exception as e:
+        print(f"[WARN] Failed to update scheduler rates for {job_id}: {e}")
+
+
+def _remember_failure(r_local: redis.Redis, job_id: str, error_msg: str):
+    """Put the job's video in the negative cache if the error is permanent."""
+    try:
+        data = jobstore.get(r_local, job_id)
+        url, vid = data.get("url"), data.get("video_id")
+        if url or vid:
+            probe.mark_negative(r_local, vid or probe.video_id(url), error_msg)
+    except Exception as e:
+        print(f"[WARN] Failed to record negative cache entry for {job_id}: {e}")
+
+
+def _finish_workspace(job_id: str, r_local: redis.Redis):
+    """Park the workspace of an unfinished job for its next attempt; otherwise drop it
+    (AUTO_DELETE_LOCAL) or leave it to the disk manager's age/quota eviction."""
+    try:
+        disk.unreserve(r_local, job_id)
+        ws = disk.find(job_id)
+        if not ws:
+            return
+        status = r_local.hget(f"job:{job_id}", "status")
+        if status not in callbacks.TERMINAL_STATUSES:
+            print(f"[INFO] Keeping workspace {ws.path} for the next attempt")
+            ws.park()
+        elif AUTO_DELETE_LOCAL or status == "cancelled":
+            print(f"[INFO] Cleaning up workspace {ws.path}")
+            ws.destroy()
+        else:
+            ws.release()
+    except Exception as e:
+        print(f"[WARN] Workspace cleanup failed for {job_id}: {e}")
+
+
+def _process_with_retries(job_id: str, r_local: redis.Redis) -> bool:
+    """Run the retry loop for a job. Returns True if successful, False otherwise."""
+    try:
+        return _run_attempts(job_id, r_local)
+
+    except JobInterrupted:
+        print(f"[INFO] Job {job_id} interrupted by shutdown; returning it to the queue")
+        r_local.hset(f"job:{job_id}", "status", "interrupted")
+        r_local.hincrby(f"job:{job_id}", "interruptions", 1)
+        raise
+
+    except JobCancelled:
+        print(f"[INFO] Job {job_id} cancelled")
+        r_local.hset(f"job:{job_id}", mapping={"status": "cancelled", "error": "Cancelled by request"})
+        _trigger_callback(job_id, r_local)
+        return False
+
+
+def _run_attempts(job_id: str, r_local: redis.Redis) -> bool:
     for attempt in range(MAX_RETRIES):
         try:
+            if cancellation.requested(r_local, job_id):
+                raise JobCancelled()
+
             # Update retry count in Redis
             r_local.hset(f"job:{job_id}", "retry_count", attempt)
             r_local.hset(f"job:{job_id}", "status", "processing")
             
             print(f"[INFO] Processing job {job_id} (attempt {attempt + 1}/{MAX_RETRIES})")
-            
+            ident = _lease_identity(job_id, r_local)
+
             # Process job with timeout protection
-            with timeout_handler(JOB_TIMEOUT):
-                success = _execute_download(job_id, r_local)
-                
+            try:
+                with timeout_handler(JOB_TIMEOUT):
+                    success = _execute_download(job_id, r_local, ident)
+            except BaseException as e:
+                identities.release(r_local, ident, job_id, str(e) or type(e).__name__)
+                raise
+            identities.release(r_local, ident, job_id)
+
+
             # Trigger callback regardless of success/fail (terminal state reached)
             _trigger_callback(job_id, r_local)
 
             if success:
                 print(f"[SUCCESS] Job {job_id} completed successfully")
                 return True
+
+        except disk.DeferJob as e:
+            deferrals = r_local.hincrby(f"job:{job_id}", "disk_deferrals", 1)
+            if deferrals > DISK_MAX_DEFERRALS:
+                print(f"[ERROR] Job {job_id}: {e}; giving up after {deferrals - 1} deferrals")
+                r_local.hset(f"job:{job_id}", mapping={"status": "error", "error": f"Failed: {e}"})
+                _trigger_callback(job_id, r_local)
+                return False
+            print(f"[INFO] Deferring job {job_id} for {e.delay}s: {e}")
+            r_local.hset(f"job:{job_id}", mapping={"status": "deferred", "last_error": str(e)})
+            r_local.zadd("yt_delayed", {job_id: time.time() + e.delay})
+            return False
                 
         except TimeoutException as e:
             error_msg = f"Timeout after {JOB_TIMEOUT}s (attempt {attempt + 1}/{MAX_RETRIES})"
@@ -368,7 +847,7 @@ def process_single_job(job_id: str) -> bool:
                 # Exponential backoff: 60s, 120s, 240s, etc.
                 backoff = min(300, RETRY_BACKOFF_BASE * (2 ** attempt))
                 print(f"[INFO] Retrying job {job_id} in {backoff}s...")
-                time.sleep(backoff)
+                _backoff_sleep(backoff)
             else:
                 # Final attempt failed
                 r_local.hset(f"job:{job_id}", mapping={
@@ -396,17 +875,23 @@ def process_single_job(job_id: str) -> bool:
                 "Video is a YouTube Short",
                 "is less than 15 minutes",
                 "is not a valid URL",
-                "HTTP Error 403: Forbidden",
-                "n challenge solving failed"
+                "n challenge solving failed",
+                "is beyond the end of the video",
+                "exceeds disk capacity"
             ]
+            # A 403 is retried with another identity; with only one there is none (see identities.py)
+            if identities.single():
+                fatal_errors.append("HTTP Error 403: Forbidden")
             is_fatal = any(err in error_msg for err in fatal_errors)
             
             if attempt < MAX_RETRIES - 1 and not is_fatal:
                 backoff = min(300, RETRY_BACKOFF_BASE * (2 ** attempt))
                 print(f"[INFO] Retrying job {job_id} in {backoff}s...")
-                time.sleep(backoff)
+                _backoff_sleep(backoff)
             else:
                 # Final attempt failed or fatal error
+                if is_fatal:
+                    _remember_failure(r_local, job_id, error_msg)
                 try:
                     r_local.hset(f"job:{job_id}", mapping={
                         "status": "skipped" if is_fatal else "error",
@@ -422,12 +907,33 @@ def process_single_job(job_id: str) -> bool:
     return False
 
 
-def _execute_download(job_id: str, r_local: redis.Redis) -> bool:
+def _lease_identity(job_id: str, r_local: redis.Redis) -> identities.Identity:
+    """Lease an identity for the next attempt, waiting while all are cooling down or out of budget."""
+    waited = 0.0
+    while True:
+        ident, wait = identities.lease(r_local, job_id)
+        if ident is not None:
+            r_local.hset(f"job:{job_id}", "identity", ident.name)
+            if waited:
+                r_local.hincrbyfloat(f"job:{job_id}", "stage_identity_wait_s", round(waited, 3))
+                r_local.hset(f"job:{job_id}", "status", "processing")
+            return ident
+        wait = min(wait, 30)
+        print(f"[INFO] Job {job_id}: no identity available; waiting {wait:.0f}s")
+        r_local.hset(f"job:{job_id}", "status", "waiting_identity")
+        _backoff_sleep(wait)
+        waited += wait
+        if cancellation.requested(r_local, job_id):
+            raise JobCancelled()
+
+
+def _execute_download(job_id: str, r_local: redis.Redis, ident: identities.Identity) -> bool:
     """
-    Execute the actual download logic for a job.
+    Execute the actual download logic for a job, as identity `ident`.
     Returns True if successful, False otherwise.
     """
-    data = r_local.hgetall(f"job:{job_id}")
+    with metrics.timer("yt_redis_latency_seconds", op="hgetall"):
+        data = jobstore.get(r_local, job_id)
     if not data:
         print(f"[ERROR] Job {job_id} not found in Redis")
         return False
@@ -451,47 +957,34 @@ def _execute_download(job_id: str, r_local: redis.Redis) -> bool:
     should_transcribe = data.get("transcribe", "false").lower() == "true"
     transcribe_lang = data.get("transcribe_lang") or None
     transcribe_prompt = data.get("transcribe_prompt") or None
-    outtmpl = f"{DOWNLOAD_DIR}/{filename}.%(ext)s"
+    sections = clips.from_spec(data.get("sections", ""))
     
+    # Known permanent failures (private, removed, ...) are skipped without a probe
+    vid = data.get("video_id") or probe.video_id(data["url"])
+    negative = probe.get_negative(r_local, vid)
+    if negative:
+        raise Exception(negative["error"])
+
     # Get metadata including duration and quality
+    meta = {}
     duration = 0
+    a_abr = 0
     video_quality = ""
     video_fps = ""
     audio_quality = ""
     try:
-        if COOKIES_PATH:
-            if os.path.exists(COOKIES_PATH):
-                print(f"[INFO] Using cookies from {COOKIES_PATH} (size: {os.path.getsize(COOKIES_PATH)} bytes)")
-            else:
-                print(f"[WARN] Cookies file NOT FOUND at {COOKIES_PATH}")
-        
-        meta_cmd = ["yt-dlp", "--dump-json", "--flat-playlist", "--socket-timeout", "30", "--", data["url"]]
-        if COOKIES_PATH and os.path.exists(COOKIES_PATH):
-            meta_cmd.insert(1, "--cookies")
-            meta_cmd.insert(2, COOKIES_PATH)
-        meta_proc = subprocess.Popen(meta_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        meta_out, _ = meta_proc.communicate()
-        if meta_out:
-            meta = json.loads(meta_out)
-            
-            # Check for upcoming live streams (waiting for live)
-            if meta.get("live_status") == "is_upcoming":
-                raise Exception("Video is an upcoming live stream (waiting for live).")
-
-            # Check for live streams (currently live)
-            if meta.get("live_status") == "is_live":
-                raise Exception("Video is a live stream.")
-            
-            # Check for Shorts
-            if "/shorts/" in meta.get("webpage_url", ""):
-                raise Exception("Video is a YouTube Short.")
+        print(f"[INFO] Using identity {ident.name}")
 
+        # The API usually probed this video at enqueue time
+        meta = probe.get_cached(r_local, vid)
+        if meta:
+            print(f"[INFO] Using cached metadata for {vid}")
+        else:
+            _wait_for_host(r_local, job_id, data["url"])
+            with metrics.stage_timer(r_local, job_id, "probe"):
+                meta = probe.store(r_local, vid, probe.run(data["url"], args=ident.args()))
+        if meta:
             duration = meta.get("duration") or 0
-            
-            # Check duration < 15 minutes (900 seconds)
-            if duration < 900:
-                raise Exception(f"Video duration ({duration}s) is less than 15 minutes.")
-
             v_height = meta.get("height") or 0
             v_fps = meta.get("fps") or 0
             a_abr = meta.get("abr") or 0
@@ -506,17 +999,60 @@ def _execute_download(job_id: str, r_local: redis.Redis) -> bool:
             if v_fps: video_fps = str(int(v_fps))
             if a_abr: audio_quality = f"{int(a_abr)}kbps"
     except Exception as e:
+        if isinstance(e, probe.ProbeError) and probe.error_class(str(e)):
+            raise
+        meta = meta or {}
         print(f"[WARN] Failed to get video metadata: {e}")
 
+    # Live streams, Shorts and videos under 15 minutes are skipped (see fatal_errors)
+    rejected = probe.ineligible(meta) if meta else None
+    if rejected:
+        raise Exception(rejected[1])
+
+    # Clip jobs: from here on the clip's length stands in for the video's duration
+    clip_fraction = 1.0
+    if sections:
+        beyond = clips.beyond_end(sections, duration)
+        if beyond:
+            raise Exception(beyond)
+        if duration:
+            clip_fraction = min(1.0, clips.length(sections) / duration)
+        duration = clips.length(sections)
+        r_local.hset(f"job:{job_id}", "clip_duration", duration)
+
+    # Every file this job produces lives in its own workspace directory
+    expected_audio_bytes = int(duration * (a_abr or 160) * 125) if duration else 0
+    ws = disk.Workspace.open(job_id, expected_bytes=expected_audio_bytes,
+                             prefer_tmpfs=media == "audio" and not should_transcribe)
+    outtmpl = ws.file(f"{filename}.%(ext)s")
+    if sections:
+        # One file per range, joined after the download (_join_sections)
+        outtmpl = ws.file(f"{filename}{clips.OUTTMPL_SUFFIX}.%(ext)s")
+
+    # Admission control: make sure the volume can hold the download's peak footprint
+    if ws.root == disk.JOBS_DIR:
+        needed = max(0, int(_estimate_peak_bytes(meta, media) * clip_fraction * DISK_ESTIMATE_MARGIN) - ws.size())
+        if needed:
+            admitted, available = disk.reserve(r_local, job_id, needed)
+            if not admitted:
+                raise disk.DeferJob(f"Not enough disk space: need {needed} bytes, {max(0, available)} available")
+            r_local.hset(f"job:{job_id}", "disk_reserved_bytes", needed)
+
+    # Fragment concurrency and chunk size from the format protocol and this node's load
+    dl = fragments.choose(meta, media, cluster.running_jobs(r_local), autoscale.load_per_cpu())
+    r_local.hset(f"job:{job_id}", mapping={
+        "dl_protocol": dl["protocol"], "dl_fragments": dl["fragments"], "dl_chunk_size": dl["chunk_size"]})
+
     if media == "audio":
-        local_file = f"{DOWNLOAD_DIR}/{filename}.{audio_format}"
+        local_file = ws.file(f"{filename}.{audio_format}")
         cmd = [
             "yt-dlp",
+            *ytcache.args(),
             "--socket-timeout", "30",
-            "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            "--extractor-args", "youtube:player_client=android,web",
-            "--sleep-requests", "1",
+            *ident.args(),
             "--geo-bypass",
+            *fragments.args(dl),
+            *clips.args(sections),
             # "--no-progress", # removed to allow parsing
             "-f", "bestaudio/best",
             "-x",
@@ -527,15 +1063,16 @@ def _execute_download(job_id: str, r_local: redis.Redis) -> bool:
         ]
     elif media == "both":
         # first download video (mp4), then extract audio to requested format with ffmpeg
-        video_file = f"{DOWNLOAD_DIR}/{filename}.mp4"
-        audio_file = f"{DOWNLOAD_DIR}/{filename}.{audio_format}"
+        video_file = ws.file(f"{filename}.mp4")
+        audio_file = ws.file(f"{filename}.{audio_format}")
         video_cmd = [
             "yt-dlp",
+            *ytcache.args(),
             "--socket-timeout", "30",
-            "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            "--extractor-args", "youtube:player_client=android,web",
-            "--sleep-requests", "1",
+            *ident.args(),
             "--geo-bypass",
+            *fragments.args(dl),
+            *clips.args(sections),
             # "--no-progress", # removed to allow parsing
             "-f", data.get("format") or "bv*+ba/b",
             "--merge-output-format", "mp4",
@@ -549,11 +1086,12 @@ def _execute_download(job_id: str, r_local: redis.Redis) -> bool:
         local_file = None
         cmd = [
             "yt-dlp",
+            *ytcache.args(),
             "--socket-timeout", "30",
-            "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            "--extractor-args", "youtube:player_client=android,web",
-            "--sleep-requests", "1",
+            *ident.args(),
             "--geo-bypass",
+            *fragments.args(dl),
+            *clips.args(sections),
             # "--no-progress", # removed to allow parsing
             "-f", data.get("format") or "bv*+ba/b",
             "--merge-output-format", "mp4",
@@ -584,363 +1122,547 @@ def _execute_download(job_id: str, r_local: redis.Redis) -> bool:
                 url = cmd[-1]
                 cmd = cmd[:-2] + subs_flags + ["--", url]
 
-    if COOKIES_PATH and os.path.exists(COOKIES_PATH):
-        # insert cookies into the correct command (video_cmd for media==both)
-        if media == "both":
-            if 'video_cmd' in locals() and video_cmd is not None:
-                video_cmd.insert(1, "--cookies")
-                video_cmd.insert(2, COOKIES_PATH)
-        else:
-            if cmd is not None:
-                cmd.insert(1, "--cookies")
-                cmd.insert(2, COOKIES_PATH)
+    # Snapshot what a previous attempt left before the early audio stream lands in the workspace
+    resumed = _record_resume(ws, r_local, job_id)
 
-    # run commands depending on requested media
-    if media == "both":
-        run_command_with_progress(video_cmd, job_id, r_local, stage="downloading")
-        # extract audio using ffmpeg
-        try:
-            run_subprocess_safe(["ffmpeg", "-y", "-i", video_file, audio_file])
-        except Exception:
-            # fallback: try yt-dlp audio extraction if ffmpeg fails
-            fallback_cmd = [
-                "yt-dlp", 
-                "--socket-timeout", "30",
-                "--user-agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-                "--extractor-args", "youtube:player_client=android,web",
-                "--sleep-requests", "1",
-                "-x", "--audio-format", audio_format, "-o", outtmpl, "--", data["url"]
-            ]
-            if COOKIES_PATH and os.path.exists(COOKIES_PATH):
-                fallback_cmd.insert(1, "--cookies")
-                fallback_cmd.insert(2, COOKIES_PATH)
-            run_subprocess_safe(fallback_cmd)
-
-        public_video = ""
-        public_audio = ""
-        if minio_client:
-            try:
-                obj_name_v = os.path.basename(video_file)
-                minio_client.fput_object(MINIO_BUCKET, obj_name_v, video_file)
-                public_video = f"{MINIO_PUBLIC_BASE_URL}/{obj_name_v}" if MINIO_PUBLIC_BASE_URL else ""
-                print(f"[INFO] Uploaded video {obj_name_v} to MinIO: {public_video}")
-            except Exception as e:
-                print(f"[WARN] upload video to minio failed: {e}")
+    # Video jobs with transcription: transcribe the audio stream while the video downloads
+    early = None
+    if should_transcribe and media in ("video", "both") and AUDIO_FIRST_TRANSCRIBE:
+        early = _start_early_transcription(job_id, r_local, ident, dl, data["url"], ws, filename, sections,
+                                           lang=transcribe_lang, prompt=transcribe_prompt)
 
+    try:
+        # run commands depending on requested media
+        if media == "both":
+            download_started = time.monotonic()
+            with metrics.stage_timer(r_local, job_id, "download"):
+                run_command_with_progress(video_cmd, job_id, r_local, stage="downloading")
+            download_seconds = time.monotonic() - download_started
+            if sections:
+                _join_sections(ws, filename, r_local, job_id)
+            _download_throughput(r_local, job_id, [video_file], download_seconds, resumed, dl)
+            # extract audio using ffmpeg
             try:
-                obj_name_a = os.path.basename(audio_file)
-                minio_client.fput_object(MINIO_BUCKET, obj_name_a, audio_file)
-                public_audio = f"{MINIO_PUBLIC_BASE_URL}/{obj_name_a}" if MINIO_PUBLIC_BASE_URL else ""
-                print(f"[INFO] Uploaded audio {obj_name_a} to MinIO: {public_audio}")
-            except Exception as e:
-                print(f"[WARN] upload audio to minio failed: {e}")
+                with metrics.stage_timer(r_local, job_id, "ffmpeg"):
+                    run_subprocess_safe(["ffmpeg", "-y", "-i", video_file, audio_file], cpu=True)
+            except Exception:
+                # fallback: try yt-dlp audio extraction if ffmpeg fails
+                fallback_cmd = [
+                    "yt-dlp",
+                    *ytcache.args(),
+                    "--socket-timeout", "30",
+                    *ident.args(),
+                    *clips.args(sections),
+                    "-x", "--audio-format", audio_format, "-o", outtmpl, "--", data["url"]
+                ]
+                _wait_for_host(r_local, job_id, data["url"])
+                run_subprocess_safe(fallback_cmd)
+                if sections:
+                    _join_sections(ws, filename, r_local, job_id)
+            ws.add(video_file, "video")
+            ws.add(audio_file, "audio")
+
+            public_video = ""
+            public_audio = ""
+            if minio_client:
+                try:
+                    obj_name_v = os.path.basename(video_file)
+                    _fput_object(MINIO_BUCKET, obj_name_v, video_file, r_local, job_id)
+                    public_video = f"{MINIO_PUBLIC_BASE_URL}/{obj_name_v}" if MINIO_PUBLIC_BASE_URL else ""
+                    print(f"[INFO] Uploaded video {obj_name_v} to MinIO: {public_video}")
+                except Exception as e:
+                    print(f"[WARN] upload video to minio failed: {e}")
 
+                try:
+                    obj_name_a = os.path.basename(audio_file)
+                    _fput_object(MINIO_BUCKET, obj_name_a, audio_file, r_local, job_id)
+                    public_audio = f"{MINIO_PUBLIC_BASE_URL}/{obj_name_a}" if MINIO_PUBLIC_BASE_URL else ""
+                    print(f"[INFO] Uploaded audio {obj_name_a} to MinIO: {public_audio}")
+                except Exception as e:
+                    print(f"[WARN] upload audio to minio failed: {e}")
 
 
-        # Subtitle handling for 'both' case
-        subtitles_map = {}
-        local_subtitles_map = {}
-        if include_subs:
-            try:
-                print(f"[DEBUG] Scanning subs in {DOWNLOAD_DIR} for {filename}")
-                all_files = os.listdir(DOWNLOAD_DIR)
-                print(f"[DEBUG] Found files: {all_files}")
-                for f in all_files:
-                    if f.startswith(filename) and f.endswith(".srt"):
-                        local_sub_path = f"{DOWNLOAD_DIR}/{f}"
-                        public_sub_url = ""
+
+            # Subtitle handling for 'both' case
+            subtitles_map = {}
+            local_subtitles_map = {}
+            if include_subs:
+                try:
+                    all_files = ws.files()
+                    print(f"[DEBUG] Found files in {ws.path}: {all_files}")
+                    for f in all_files:
+                        if f.endswith(".srt") and f != f"{filename}.srt":
+                            local_sub_path = ws.file(f)
+                            ws.add(local_sub_path, "subtitle")
+                            public_sub_url = ""
                         
-                        # Store local path before potential deletion
-                        # (Key can be filename or lang code if parsed, but filename is unique)
-                        local_subtitles_map[f] = local_sub_path
-
-                        if minio_client:
-                            try:
-                                minio_client.fput_object(MINIO_BUCKET, f, local_sub_path)
-                                public_sub_url = f"{MINIO_PUBLIC_BASE_URL}/{f}" if MINIO_PUBLIC_BASE_URL else ""
-                                print(f"[INFO] Uploaded subtitle {f} to MinIO: {public_sub_url}")
-                            except Exception as e:
-                                print(f"[WARN] upload sub {f} failed: {e}")
+                            # Store local path before potential deletion
+                            # (Key can be filename or lang code if parsed, but filename is unique)
+                            local_subtitles_map[f] = local_sub_path
+
+                            if minio_client:
+                                try:
+                                    _fput_object(MINIO_BUCKET, f, local_sub_path, r_local, job_id)
+                                    public_sub_url = f"{MINIO_PUBLIC_BASE_URL}/{f}" if MINIO_PUBLIC_BASE_URL else ""
+                                    print(f"[INFO] Uploaded subtitle {f} to MinIO: {public_sub_url}")
+                                except Exception as e:
+                                    print(f"[WARN] upload sub {f} failed: {e}")
                         
-                        subtitles_map[f] = public_sub_url
-                        if AUTO_DELETE_LOCAL:
-                            os.remove(local_sub_path)
-            except Exception as e:
-                print(f"[WARN] Error handling subtitles: {e}")
-
-        # Transcription handling for 'both'
-        public_transcript = ""
-        local_transcript_path = ""
-        if should_transcribe and os.path.exists(audio_file):
-            r_local.hset(f"job:{job_id}", "status", "transcribing (0%)")
-            text = _transcribe_audio(audio_file, job_id, r_local, lang=transcribe_lang, prompt=transcribe_prompt)
-            if text:
-                local_transcript_path = f"{DOWNLOAD_DIR}/{filename}.srt"
-                with open(local_transcript_path, "w", encoding="utf-8") as f:
-                    f.write(text)
-                public_transcript = _upload_file_to_minio(local_transcript_path, MINIO_BUCKET)
-            else:
-                r_local.hset(f"job:{job_id}", "whisper_error", "Transcription returned empty result or failed")
+                            subtitles_map[f] = public_sub_url
+                except Exception as e:
+                    print(f"[WARN] Error handling subtitles: {e}")
+
+            # Transcription handling for 'both'
+            public_transcript = ""
+            local_transcript_path = ""
+            if should_transcribe and (early or os.path.exists(audio_file)):
+                if early:
+                    text = early.result()
+                    os.remove(early.audio_path)
+                else:
+                    r_local.hset(f"job:{job_id}", "status", "transcribing (0%)")
+                    with metrics.stage_timer(r_local, job_id, "transcribe"):
+                        text = _transcribe(audio_file, job_id, r_local, lang=transcribe_lang, prompt=transcribe_prompt)
+                if text:
+                    local_transcript_path = ws.file(f"{filename}.srt")
+                    with open(local_transcript_path, "w", encoding="utf-8") as f:
+                        f.write(clips.shift_srt(text, sections))
+                    ws.add(local_transcript_path, "transcript")
+                    public_transcript = _upload_file_to_minio(local_transcript_path, MINIO_BUCKET, r_local, job_id)
+                else:
+                    r_local.hset(f"job:{job_id}", "whisper_error", "Transcription returned empty result or failed")
 
-        r_local.hset(f"job:{job_id}", mapping={
-            "status": "done",
-            "progress": "100",
-            "video_file": public_video,
-            "audio_file": public_audio,
-            "transcript_file": public_transcript,
-            # "duration" removed as redundant
-            "video_duration": duration,
-            "audio_duration": duration,
-            "video_quality": video_quality,
-            "video_fps": video_fps,
-            "audio_quality": audio_quality,
-            "subtitles": json.dumps(subtitles_map)
-        })
+            jobstore.complete(r_local, job_id, {
+                "video_file": public_video,
+                "audio_file": public_audio,
+                "transcript_file": public_transcript,
+                "subtitles": json.dumps(subtitles_map)
+            }, {
+                "status": "done",
+                "progress": "100",
+                # "duration" removed as redundant
+                "video_duration": duration,
+                "audio_duration": duration,
+                "video_quality": video_quality,
+                "video_fps": video_fps,
+                "audio_quality": audio_quality,
+            })
 
-        if AUTO_DELETE_LOCAL:
-            print(f"[INFO] Cleaning up local files for {filename}")
-            # Delete direct files
-            for f in [video_file, audio_file, local_transcript_path]:
-                if f and os.path.exists(f):
-                    try:
-                        os.remove(f)
-                    except Exception as e:
-                        print(f"[WARN] Failed to delete {f}: {e}")
-            
-            # Catch any remaining files with this filename prefix (e.g. fragments, extra subs)
-            try:
-                for f in os.listdir(DOWNLOAD_DIR):
-                    if f.startswith(filename):
-                        path = os.path.join(DOWNLOAD_DIR, f)
-                        if os.path.isfile(path):
-                            os.remove(path)
-            except Exception as e:
-                print(f"[WARN] Batch cleanup failed: {e}")
-    else:
-        run_command_with_progress(cmd, job_id, r_local, stage="downloading")
-        
-        # Determine the downloaded file dynamically
-        if not local_file:
-            try:
-                candidates = []
-                for f in os.listdir(DOWNLOAD_DIR):
-                    if f.startswith(filename) and not f.endswith(".part") and not f.endswith(".ytdl") and not f.endswith(".json"):
-                        # Ensure it matches filename pattern (filename.ext)
-                        if f.startswith(filename + "."):
-                            candidates.append(os.path.join(DOWNLOAD_DIR, f))
-                
-                # If multiple candidates, prioritize mp4 if present, else pick the first one
-                if candidates:
-                    local_file = next((f for f in candidates if f.endswith(".mp4")), candidates[0])
-                    print(f"[INFO] Detected downloaded file: {local_file}")
-                else:
-                    print(f"[WARN] No file found matching {filename} in {DOWNLOAD_DIR}")
-            except Exception as e:
-                print(f"[ERROR] Failed to detect downloaded file: {e}")
-
-        if not local_file or not os.path.exists(local_file):
-            print(f"[ERROR] Downloaded file not found for {filename}")
-            # Do NOT return False here, try to proceed? 
-            # Or better, fail because we can't upload nothing.
-            # But the logic below has 'if minio_client' checks, so maybe just let it be empty string?
-            # Existing logic was 'obj_name = os.path.basename(local_file)', if local_file is None this crashes.
-            # So let's handle that.
+        else:
+            download_started = time.monotonic()
+            with metrics.stage_timer(r_local, job_id, "download"):
+                run_command_with_progress(cmd, job_id, r_local, stage="downloading")
+            download_seconds = time.monotonic() - download_started
+            if sections:
+                _join_sections(ws, filename, r_local, job_id)
+
+            # Determine the downloaded file dynamically
             if not local_file:
-               local_file = "" 
+                try:
+                    candidates = []
+                    for f in ws.files():
+                        if f.startswith(filename + ".") and not f.endswith((".part", ".ytdl", ".json", ".srt")):
+                            candidates.append(ws.file(f))
+                
+                    # If multiple candidates, prioritize mp4 if present, else pick the first one
+                    if candidates:
+                        local_file = next((f for f in candidates if f.endswith(".mp4")), candidates[0])
+                        print(f"[INFO] Detected downloaded file: {local_file}")
+                    else:
+                        print(f"[WARN] No file found matching {filename} in {ws.path}")
+                except Exception as e:
+                    print(f"[ERROR] Failed to detect downloaded file: {e}")
+
+            if not local_file or not os.path.exists(local_file):
+                print(f"[ERROR] Downloaded file not found for {filename}")
+                # Do NOT return False here, try to proceed? 
+                # Or better, fail because we can't upload nothing.
+                # But the logic below has 'if minio_client' checks, so maybe just let it be empty string?
+                # Existing logic was 'obj_name = os.path.basename(local_file)', if local_file is None this crashes.
+                # So let's handle that.
+                if not local_file:
+                   local_file = "" 
         
-        public_url = ""
-        if minio_client:
-            try:
-                obj_name = os.path.basename(local_file)
-                minio_client.fput_object(MINIO_BUCKET, obj_name, local_file)
-                public_url = f"{MINIO_PUBLIC_BASE_URL}/{obj_name}" if MINIO_PUBLIC_BASE_URL else ""
-                print(f"[INFO] Uploaded {obj_name} to MinIO: {public_url}")
-            except Exception as e:
-                print(f"[WARN] upload to minio failed: {e}")
+            _download_throughput(r_local, job_id, [local_file], download_seconds, resumed, dl)
+            ws.add(local_file, media)
+
+            public_url = ""
+            if minio_client:
+                try:
+                    obj_name = os.path.basename(local_file)
+                    _fput_object(MINIO_BUCKET, obj_name, local_file, r_local, job_id)
+                    public_url = f"{MINIO_PUBLIC_BASE_URL}/{obj_name}" if MINIO_PUBLIC_BASE_URL else ""
+                    print(f"[INFO] Uploaded {obj_name} to MinIO: {public_url}")
+                except Exception as e:
+                    print(f"[WARN] upload to minio failed: {e}")
 
 
 
-        subtitles_map = {}
-        local_subtitles_map = {}
-        if include_subs:
-            try:
-                # Priority languages if "all" is requested
-                priority_langs = ['id', 'en']
+            subtitles_map = {}
+            local_subtitles_map = {}
+            if include_subs:
+                try:
+                    # Priority languages if "all" is requested
+                    priority_langs = ['id', 'en']
                 
-                print(f"[DEBUG] Scanning subs in {DOWNLOAD_DIR} for {filename}")
-                all_files = os.listdir(DOWNLOAD_DIR)
-                for f in all_files:
-                    # Check if it's a subtitle file for this job
-                    # yt-dlp saves as filename.lang.srt
-                    if f.startswith(filename) and f.endswith(".srt"):
-                        # Skip the main transcription file (it's handled separately)
-                        if f == f"{filename}.srt":
-                            continue
-                            
-                        # If "all" was requested, only upload priority languages to save space
-                        if sub_langs == "all":
-                            lang_part = f.replace(filename + ".", "").replace(".srt", "")
-                            if lang_part not in priority_langs:
-                                # Still keep locally for the status but don't upload to MinIO
-                                # to avoid cluttering as per user request
+                    print(f"[DEBUG] Scanning subs in {ws.path}")
+                    for f in ws.files():
+                        # yt-dlp saves as filename.lang.srt
+                        if f.endswith(".srt"):
+                            # Skip the main transcription file (it's handled separately)
+                            if f == f"{filename}.srt":
                                 continue
-
-                        local_sub_path = f"{DOWNLOAD_DIR}/{f}"
-                        public_sub_url = ""
-                        local_subtitles_map[f] = local_sub_path
-
-                        if minio_client:
-                            try:
-                                minio_client.fput_object(MINIO_BUCKET, f, local_sub_path)
-                                public_sub_url = f"{MINIO_PUBLIC_BASE_URL}/{f}" if MINIO_PUBLIC_BASE_URL else ""
-                                print(f"[INFO] Uploaded subtitle {f} to MinIO: {public_sub_url}")
-                            except Exception as e:
-                                print(f"[WARN] upload sub {f} failed: {e}")
+                            
+                            # If "all" was requested, only upload priority languages to save space
+                            if sub_langs == "all":
+                                lang_part = f.replace(filename + ".", "").replace(".srt", "")
+                                if lang_part not in priority_langs:
+                                    # Still keep locally for the status but don't upload to MinIO
+                                    # to avoid cluttering as per user request
+                                    continue
+
+                            local_sub_path = ws.file(f)
+                            public_sub_url = ""
+                            local_subtitles_map[f] = local_sub_path
+                            ws.add(local_sub_path, "subtitle")
+
+                            if minio_client:
+                                try:
+                                    _fput_object(MINIO_BUCKET, f, local_sub_path, r_local, job_id)
+                                    public_sub_url = f"{MINIO_PUBLIC_BASE_URL}/{f}" if MINIO_PUBLIC_BASE_URL else ""
+                                    print(f"[INFO] Uploaded subtitle {f} to MinIO: {public_sub_url}")
+                                except Exception as e:
+                                    print(f"[WARN] upload sub {f} failed: {e}")
                         
-                        subtitles_map[f] = public_sub_url
-                        # Don't delete yet, batch cleanup will handle it
-            except Exception as e:
-                print(f"[WARN] Error handling subtitles: {e}")
-
-        # Transcription handling for single 'media' (video or audio)
-        public_transcript = ""
-        local_transcript_path = ""
-        if should_transcribe:
-            transcript_input = local_file
-            temp_audio = ""
-            if media == "video":
-                # Need to extract audio temporarily for transcription
-                temp_audio = f"{DOWNLOAD_DIR}/{filename}_temp.wav"
-                try:
-                    run_subprocess_safe(["ffmpeg", "-y", "-i", local_file, "-ar", "16000", "-ac", "1", temp_audio])
-                    transcript_input = temp_audio
+                            subtitles_map[f] = public_sub_url
                 except Exception as e:
-                    print(f"[ERROR] Failed to extract temp audio for transcription: {e}")
-                    transcript_input = None
+                    print(f"[WARN] Error handling subtitles: {e}")
+
+            # Transcription handling for single 'media' (video or audio)
+            public_transcript = ""
+            local_transcript_path = ""
+            if should_transcribe:
+                transcript_input = local_file
+                temp_audio = ""
+                if early:
+                    # Downloaded before the video and already being transcribed
+                    transcript_input = temp_audio = early.audio_path
+                elif media == "video":
+                    # Need to extract audio temporarily for transcription
+                    temp_audio = ws.file(f"{filename}_temp.wav")
+                    try:
+                        with metrics.stage_timer(r_local, job_id, "ffmpeg"):
+                            run_subprocess_safe(["ffmpeg", "-y", "-i", local_file, "-ar", "16000", "-ac", "1", temp_audio], cpu=True)
+                        transcript_input = temp_audio
+                    except Exception as e:
+                        print(f"[ERROR] Failed to extract temp audio for transcription: {e}")
+                        transcript_input = None
+
+                if transcript_input and os.path.exists(transcript_input):
+                    if early:
+                        text = early.result()
+                    else:
+                        r_local.hset(f"job:{job_id}", "status", "transcribing (0%)")
+                        with metrics.stage_timer(r_local, job_id, "transcribe"):
+                            text = _transcribe(transcript_input, job_id, r_local, lang=transcribe_lang, prompt=transcribe_prompt)
+                    if text:
+                        local_transcript_path = ws.file(f"{filename}.srt")
+                        with open(local_transcript_path, "w", encoding="utf-8") as f:
+                            f.write(clips.shift_srt(text, sections))
+                        ws.add(local_transcript_path, "transcript")
+                        public_transcript = _upload_file_to_minio(local_transcript_path, MINIO_BUCKET, r_local, job_id)
+                    else:
+                        r_local.hset(f"job:{job_id}", "whisper_error", "Transcription returned empty result or failed")
+
+                if temp_audio and os.path.exists(temp_audio):
+                    os.remove(temp_audio)
+
+            jobstore.complete(r_local, job_id, {
+                "public_url": public_url,
+                "video_file": public_url if media == "video" else "",
+                "audio_file": public_url if media == "audio" else "",
+                "transcript_file": public_transcript,
+                "subtitles": json.dumps(subtitles_map)
+            }, {
+                "status": "done",
+                "progress": "100",
+                "ext": os.path.splitext(local_file)[1].lstrip('.'),
+                # "duration" removed as redundant
+                "video_duration": duration if media == "video" else "0",
+                "audio_duration": duration if media == "audio" else "0",
+                "video_fps": video_fps if media == "video" else "",
+                "audio_quality": audio_quality if media == "audio" else "",
+            })
+
+        return True
+    finally:
+        if early is not None:
+            early.stop()
 
-            if transcript_input and os.path.exists(transcript_input):
-                r_local.hset(f"job:{job_id}", "status", "transcribing (0%)")
-                text = _transcribe_audio(transcript_input, job_id, r_local, lang=transcribe_lang, prompt=transcribe_prompt)
-                if text:
-                    local_transcript_path = f"{DOWNLOAD_DIR}/{filename}.srt"
-                    with open(local_transcript_path, "w", encoding="utf-8") as f:
-                        f.write(text)
-                    public_transcript = _upload_file_to_minio(local_transcript_path, MINIO_BUCKET)
-                else:
-                    r_local.hset(f"job:{job_id}", "whisper_error", "Transcription returned empty result or failed")
 
-            if temp_audio and os.path.exists(temp_audio):
-                os.remove(temp_audio)
+def _requeue_front(r_local: redis.Redis, job_id: str):
+    """Put a job back at the head of its lane (and tag), e.g. after a deferral or a shutdown."""
+    lane, expected, tag = r_local.hmget(f"job:{job_id}", "lane", "expected_s", "tag")
+    r_local.hset(f"job:{job_id}", "status", "queued")
+    scheduler.push(r_local, job_id, lane or "default", float(expected or 0), front=True, tag=tag or "")
 
-        r_local.hset(f"job:{job_id}", mapping={
-            "status": "done",
-            "progress": "100",
-            "filename": filename,
-            "ext": os.path.splitext(local_file)[1].lstrip('.'),
-            "public_url": public_url,
-            "video_file": public_url if media == "video" else "",
-            "audio_file": public_url if media == "audio" else "",
-            "transcript_file": public_transcript,
-            # "duration" removed as redundant
-            "video_duration": duration if media == "video" else "0",
-            "audio_duration": duration if media == "audio" else "0",
-            "video_fps": video_fps if media == "video" else "",
-            "audio_quality": audio_quality if media == "audio" else "",
-            "subtitles": json.dumps(subtitles_map)
-        })
 
-        if AUTO_DELETE_LOCAL:
-            print(f"[INFO] Cleaning up local files for {filename}")
-            for f in [local_file, local_transcript_path]:
-                if f and os.path.exists(f):
-                    try:
-                        os.remove(f)
-                    except Exception as e:
-                        print(f"[WARN] Failed to delete {f}: {e}")
-            
-            # Catch any remaining files with this filename prefix
-            try:
-                for f in os.listdir(DOWNLOAD_DIR):
-                    if f.startswith(filename):
-                        path = os.path.join(DOWNLOAD_DIR, f)
-                        if os.path.isfile(path):
-                            os.remove(path)
-            except Exception as e:
-                print(f"[WARN] Batch cleanup failed: {e}")
-    
-    return True
+def _promote_delayed(r_local: redis.Redis):
+    """Put deferred jobs whose delay has elapsed back at the head of their lane."""
+    for job_id in r_local.zrangebyscore("yt_delayed", 0, time.time(), start=0, num=50):
+        # Only the worker that wins the ZREM re-queues the job
+        if r_local.zrem("yt_delayed", job_id):
+            _requeue_front(r_local, job_id)
+
+
+def _recover_orphans(r_local: redis.Redis, own: bool = False):
+    """Re-queue jobs that were running on nodes that stopped without handing them back."""
+    for job_id in cluster.claim_orphans(r_local, own=own):
+        print(f"[WARN] Job {job_id} was left running by a stopped node; returning it to the queue")
+        r_local.hincrby(f"job:{job_id}", "interruptions", 1)
+        _requeue_front(r_local, job_id)
+
+
+def _install_drain_handlers(stop, running: dict):
+    """SIGTERM drains the worker: no new pickups, and the running job gets DRAIN_GRACE_S
+    to finish before it is interrupted (SIGUSR1) and re-queued. A second SIGTERM interrupts at once."""
+
+    def interrupt(signum, frame):
+        if running.get("job_id"):
+            raise JobInterrupted()
+
+    def drain(signum, frame):
+        if stop.is_set():
+            interrupt(signum, frame)
+            return
+        stop.set()
+        if running.get("job_id"):
+            print(f"[INFO] Worker {os.getpid()} draining; job {running['job_id']} has {DRAIN_GRACE_S}s to finish")
+            timer = threading.Timer(DRAIN_GRACE_S, os.kill, (os.getpid(), signal.SIGUSR1))
+            timer.daemon = True
+            timer.start()
+        else:
+            print(f"[INFO] Worker {os.getpid()} draining")
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGUSR1, interrupt)
+
+
+def _install_cancel_handler(running: dict):
+    """Stop the running job when it is cancelled: the listener thread signals (SIGUSR2)
+    the main thread, which raises JobCancelled and kills the job's subprocess."""
 
+    def cancel(signum, frame):
+        if running.get("job_id") and running.get("job_id") == running.get("cancel"):
+            raise JobCancelled()
 
-def worker_process():
+    def on_cancel(job_id):
+        if running.get("job_id") == job_id and running.get("cancel") != job_id:
+            running["cancel"] = job_id
+            os.kill(os.getpid(), signal.SIGUSR2)
+
+    signal.signal(signal.SIGUSR2, cancel)
+    cancellation.start_listener(get_redis_connection, lambda: [running["job_id"]] if running.get("job_id") else [], on_cancel)
+
+
+def _warm_up_cache():
+    """Warm the shared yt-dlp cache (ytcache.warm_up) as a leased identity, after a host token."""
+    try:
+        r_local = get_redis_connection()
+        ident, wait = identities.lease(r_local, "warmup")
+    except Exception as e:
+        print(f"[WARN] Skipping yt-dlp cache warm-up: {e}")
+        return
+    if ident is None:
+        print(f"[INFO] Skipping yt-dlp cache warm-up: no identity available for {wait:.0f}s")
+        return
+    error = None
+    try:
+        hostlimit.acquire(r_local, ytcache.YTDLP_WARMUP_URL)
+        ytcache.warm_up(ident.args())
+    except Exception as e:
+        error = str(e)
+        print(f"[WARN] yt-dlp cache warm-up failed: {e}")
+    finally:
+        identities.release(r_local, ident, "warmup", error)
+
+
+def _backoff_sleep(seconds: float):
+    """Sleep between retries; in async mode a shutdown or cancellation interrupts the wait."""
+    job = _current_job()
+    if job is not None:
+        job.sleep(seconds)
+    else:
+        time.sleep(seconds)
+
+
+def worker_process(stop=None):
     """
     Worker process that continuously polls Redis queue for jobs.
     This runs in a separate process when using multiprocessing.
+    When `stop` (a multiprocessing.Event) is set, the worker exits after its current job.
     """
     r_local = get_redis_connection()
     print(f"[INFO] Worker process {os.getpid()} started")
+    stop = stop or threading.Event()
+    running = {}
+    _install_drain_handlers(stop, running)
+    _install_cancel_handler(running)
+    stop_heartbeat = scheduler.start_heartbeat(get_redis_connection)
     
-    while True:
+    while not stop.is_set():
         try:
-            job = r_local.brpop("yt_queue", timeout=5)
-            if not job:
+            _promote_delayed(r_local)
+            picked = scheduler.pick(r_local, QUEUE_POLL_TIMEOUT, NODE_TAGS)
+            if not picked:
+                disk.maybe_sweep(r_local)
                 continue
 
-            job_id = job[1]
-            print(f"[INFO] Worker {os.getpid()} picked up job {job_id}")
+            lane, job_id = picked
+            if stop.is_set():
+                # Drain started while waiting on the queue: hand the job back untouched
+                _requeue_front(r_local, job_id)
+                break
+            print(f"[INFO] Worker {os.getpid()} picked up job {job_id} from lane {lane}")
             
-            process_single_job(job_id)
+            running["job_id"] = job_id
+            try:
+                process_single_job(job_id)
+            finally:
+                running.clear()
+            disk.maybe_sweep(r_local)
             
         except KeyboardInterrupt:
             print(f"[INFO] Worker {os.getpid()} shutting down...")
             break
+        except JobInterrupted:
+            break
+        except JobCancelled:
+            # Cancellation arrived while the job was already wrapping up
+            pass
         except Exception as e:
             print(f"[ERROR] Worker {os.getpid()} encountered error: {e}")
             time.sleep(1)
+    print(f"[INFO] Worker {os.getpid()} stopped")
+    stop_heartbeat()
+
+
+def _start_slot(name: str):
+    stop = multiprocessing.Event()
+    p = multiprocessing.Process(target=worker_process, args=(stop,), name=name)
+    p.start()
+    print(f"[INFO] Started worker process {p.pid}")
+    return p, stop
+
+
+def _supervise(dispatcher):
+    """Keep the worker processes running, scaling their number with autoscale.Autoscaler."""
+    slots = max(autoscale.WORKER_MIN, min(WORKER_CONCURRENCY, autoscale.WORKER_MAX))
+    print(f"[INFO] Starting {slots} worker processes")
+    if autoscale.enabled():
+        print(f"[CONFIG] Autoscaling between {autoscale.WORKER_MIN} and {autoscale.WORKER_MAX} worker processes")
+    scaler = autoscale.Autoscaler(get_redis_connection)
+    processes = [_start_slot(f"Worker-{i+1}") for i in range(slots)]
+    retiring = []
+    cluster.start_heartbeat(get_redis_connection, WHISPER_MODEL_NAME, lambda: len(processes), _recover_orphans)
+    next_id = slots + 1
+    scaler.report(len(processes))
+
+    try:
+        # Monitor loop: Restart workers if they die, scale when the autoscaler says so
+        while True:
+            time.sleep(5)
+            for i, (p, stop) in enumerate(processes):
+                if not p.is_alive():
+                    print(f"[WARN] Worker {p.name} (pid {p.pid}) died. Restarting...")
+                    processes[i] = _start_slot(p.name)
+            for p, stop in [slot for slot in retiring if not slot[0].is_alive()]:
+                p.join()
+                retiring.remove((p, stop))
+                print(f"[INFO] Worker {p.name} (pid {p.pid}) retired")
+            if dispatcher is not None and not dispatcher.is_alive():
+                print(f"[WARN] Callback dispatcher (pid {dispatcher.pid}) died. Restarting...")
+                dispatcher = multiprocessing.Process(target=callbacks.run_dispatcher, name="CallbackDispatcher", daemon=True)
+                dispatcher.start()
+
+            if not autoscale.enabled():
+                continue
+            before = len(processes)
+            target = scaler.target(before)
+            while len(processes) < target:
+                processes.append(_start_slot(f"Worker-{next_id}"))
+                next_id += 1
+            while len(processes) > target:
+                # Newest slot first; it finishes its current job before exiting
+                p, stop = processes.pop()
+                stop.set()
+                retiring.append((p, stop))
+                print(f"[INFO] Retiring worker {p.name} (pid {p.pid}) after its current job")
+            if target != before:
+                scaler.report(len(processes))
+
+    except (KeyboardInterrupt, SystemExit):
+        # SIGTERM makes each worker drain: running jobs finish or are re-queued with their progress
+        print(f"\n[INFO] Draining workers (grace period {DRAIN_GRACE_S}s)...")
+        slots = processes + retiring
+
+        def forward(signum=None, frame=None):
+            # A second SIGTERM is passed on, which interrupts running jobs right away
+            for p, _ in slots:
+                if p.is_alive():
+                    p.terminate()
+
+        signal.signal(signal.SIGTERM, forward)
+        forward()
+        deadline = time.monotonic() + DRAIN_GRACE_S + CHILD_STOP_TIMEOUT + 15
+        for p, _ in slots:
+            p.join(max(0.0, deadline - time.monotonic()))
+            if p.is_alive():
+                print(f"[WARN] Worker {p.name} (pid {p.pid}) did not stop in time; killing it")
+                p.kill()
+                p.join()
+        print("[INFO] All workers stopped")
 
 
 def main():
     """Main entry point for the worker"""
     print(f"▶ YT-DLP WORKER READY")
+    print(f"[CONFIG] Mode: {WORKER_MODE}")
     print(f"[CONFIG] Concurrency: {WORKER_CONCURRENCY}")
     print(f"[CONFIG] Max Retries: {MAX_RETRIES}")
     print(f"[CONFIG] Job Timeout: {JOB_TIMEOUT}s")
     print(f"[CONFIG] Retry Backoff Base: {RETRY_BACKOFF_BASE}s")
+    print(f"[CONFIG] Embedded Callback Dispatcher: {CALLBACK_DISPATCHER_EMBEDDED}")
+    print(f"[CONFIG] yt-dlp Cache Dir: {ytcache.YTDLP_CACHE_DIR or 'default'}")
+
+    dispatcher = None
+    if CALLBACK_DISPATCHER_EMBEDDED:
+        dispatcher = multiprocessing.Process(target=callbacks.run_dispatcher, name="CallbackDispatcher", daemon=True)
+        dispatcher.start()
+        print(f"[INFO] Started callback dispatcher process {dispatcher.pid}")
+
+    # Jobs this node was running when it last stopped (and those of dead nodes) go back to the queue
+    try:
+        _recover_orphans(get_redis_connection(), own=True)
+    except Exception as e:
+        print(f"[WARN] Failed to recover interrupted jobs: {e}")
+
+    # Solve the current player's JS challenges in the background; jobs start right away
+    if ytcache.enabled():
+        threading.Thread(target=_warm_up_cache, name="ytdlp-warmup", daemon=True).start()
     
-    if WORKER_CONCURRENCY == 1:
+    if WORKER_MODE == "async":
+        import aioworker
+        aioworker.run(sys.modules[__name__])
+    elif WORKER_CONCURRENCY == 1 and not autoscale.enabled():
         # Single worker mode (backward compatible)
         print("[INFO] Running in single-worker mode")
+        cluster.start_heartbeat(get_redis_connection, WHISPER_MODEL_NAME, lambda: 1, _recover_orphans)
         worker_process()
     else:
         # Multi-worker mode with multiprocessing
-        print(f"[INFO] Starting {WORKER_CONCURRENCY} worker processes")
-        processes = []
-        
-        try:
-            for i in range(WORKER_CONCURRENCY):
-                p = multiprocessing.Process(target=worker_process, name=f"Worker-{i+1}")
-                p.start()
-                processes.append(p)
-                print(f"[INFO] Started worker process {p.pid}")
-            
-            # Monitor loop: Restart workers if they die
-            while True:
-                time.sleep(5)
-                for i, p in enumerate(processes):
-                    if not p.is_alive():
-                        print(f"[WARN] Worker {p.name} (pid {p.pid}) died. Restarting...")
-                        new_p = multiprocessing.Process(target=worker_process, name=p.name)
-                        new_p.start()
-                        processes[i] = new_p
-                        print(f"[INFO] Started new worker process {new_p.pid}")
-                
-        except KeyboardInterrupt:
-            print("\n[INFO] Shutting down workers...")
-            for p in processes:
-                p.terminate()
-            for p in processes:
-                p.join()
-            print("[INFO] All workers stopped")
-
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        _supervise(dispatcher)
 
 if __name__ == "__main__":
     main()
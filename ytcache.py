@@ -0,0 +1,131 @@
+# ytcache.py
+"""Shared yt-dlp cache directory.
+
+yt-dlp keeps solved signature functions and downloaded challenge-solver
+scripts in its cache directory. By default that is ~/.cache/yt-dlp inside
+the container, so every fresh container, and every new player version,
+starts cold and pays for the slow JS challenge solving again. Every yt-dlp
+call in the API and the worker passes `args()`, which points it at
+YTDLP_CACHE_DIR on a volume shared by all containers instead. On startup the
+worker runs one canned extraction (`warm_up`) in the background, so the
+current player is usually solved before the first job needs it.
+
+`Run` watches the output of one yt-dlp run. The time from the "Solving JS
+challenges" line to the next output line is the challenge-solve time. A run
+that solved challenges is a cache hit if it stored nothing new in the cache
+directory, else a miss. A concurrent job that fills the cache at the same
+moment can make a run count as a miss too.
+"""
+import os, time, threading, subprocess
+import metrics
+
+YTDLP_CACHE_DIR = os.getenv("YTDLP_CACHE_DIR", "/data/ytdlp-cache")
+YTDLP_WARMUP_URL = os.getenv("YTDLP_WARMUP_URL", "https://www.youtube.com/watch?v=jNQXAC9IVRw")
+YTDLP_WARMUP_TIMEOUT = int(os.getenv("YTDLP_WARMUP_TIMEOUT", "120"))
+
+CHALLENGE_MARKER = "Solving JS challenges"
+
+
+def args() -> list[str]:
+    """yt-dlp options for the shared cache (none if YTDLP_CACHE_DIR is empty)."""
+    return ["--cache-dir", YTDLP_CACHE_DIR] if YTDLP_CACHE_DIR else []
+
+
+def _entries() -> dict:
+    """Path -> mtime of every file in the cache directory."""
+    entries = {}
+    if not YTDLP_CACHE_DIR:
+        return entries
+    for root, _, files in os.walk(YTDLP_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                entries[path] = os.stat(path).st_mtime_ns
+            except OSError:
+                pass
+    return entries
+
+
+class Run:
+    """Cache use and challenge-solve time of one yt-dlp run; `feed` it every output line."""
+
+    def __init__(self):
+        self.before = _entries()
+        self.solved = False
+        self.challenge_s = 0.0
+        self._solving_since = None
+
+    def feed(self, line: str):
+        now = time.monotonic()
+        if self._solving_since is not None:
+            self.challenge_s += now - self._solving_since
+            self._solving_since = None
+        if CHALLENGE_MARKER in line:
+            self.solved = True
+            self._solving_since = now
+
+    def result(self) -> str | None:
+        """The cache use, "hit" or "miss"; None if the run solved no challenges."""
+        self.feed("")
+        if not self.solved:
+            return None
+        after = _entries()
+        return "miss" if any(self.before.get(path) != mtime for path, mtime in after.items()) else "hit"
+
+
+def record(r_local, job_id: str, run: Run):
+    """Store a job's cache use (`ytdlp_cache`) and challenge-solve time (`stage_challenge_s`)."""
+    result = run.result()
+    if result is None:
+        return
+    print(f"[INFO] yt-dlp cache {result}, JS challenges solved in {run.challenge_s:.1f}s")
+    try:
+        pipe = r_local.pipeline(transaction=False)
+        pipe.hset(f"job:{job_id}", "ytdlp_cache", result)
+        pipe.hincrbyfloat(f"job:{job_id}", "stage_challenge_s", round(run.challenge_s, 3))
+        pipe.execute()
+    except Exception as e:
+        print(f"[WARN] Failed to record yt-dlp cache use for {job_id}: {e}")
+    metrics.inc("yt_ytdlp_cache_total", result=result, source="job")
+    metrics.observe("yt_stage_seconds", run.challenge_s, stage="challenge")
+
+
+def enabled() -> bool:
+    return bool(YTDLP_CACHE_DIR and YTDLP_WARMUP_URL)
+
+
+def warm_up(extra_args: list[str] = ()) -> str | None:
+    """Run a canned extraction so the cache holds the current player; returns hit/miss, or None.
+
+    Raises with yt-dlp's last error line if the extraction fails.
+    """
+    if not enabled():
+        return None
+    cmd = ["yt-dlp", *args(), *extra_args, "--skip-download", "--no-playlist", "--", YTDLP_WARMUP_URL]
+    print(f"[INFO] Warming yt-dlp cache in {YTDLP_CACHE_DIR} with {YTDLP_WARMUP_URL}")
+    started = time.monotonic()
+    run = Run()
+    try:
+        os.makedirs(YTDLP_CACHE_DIR, exist_ok=True)
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    except OSError as e:
+        raise Exception(f"yt-dlp cache warm-up failed: {e}")
+    error = None
+    killer = threading.Timer(YTDLP_WARMUP_TIMEOUT, proc.kill)
+    killer.start()
+    try:
+        for line in proc.stdout:
+            run.feed(line)
+            if line.startswith("ERROR"):
+                error = line.strip()
+        proc.wait()
+    finally:
+        killer.cancel()
+    if proc.returncode != 0:
+        raise Exception(error or f"yt-dlp cache warm-up exited with code {proc.returncode}")
+    result = run.result()
+    if result:
+        metrics.inc("yt_ytdlp_cache_total", result=result, source="warmup")
+    print(f"[INFO] yt-dlp cache warm-up done in {time.monotonic() - started:.1f}s "
+          f"(cache {result or 'unused'}, JS challenges {run.challenge_s:.1f}s)")
+    return result